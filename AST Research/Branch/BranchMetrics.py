@@ -6,147 +6,594 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from MetricsClasses.MetricsController import MetricsController
 from MetricsClasses.MetricsController import supported_metrics
+from MetricsClasses.MetricsController import usable_metrics, analysis_error_message
+from MetricsClasses.MetricsController import analyzer_versions
+from MetricsClasses.MetricsController import get_stale_metrics
+from MetricsClasses.MetricsController import parse_metric_selection, selected_metric_types, selected_versions
+from MetricsClasses.MetricsExecutor import MetricsExecutor
+from MetricsClasses.HalsteadMetricsClass import halstead_metrics_names
+from MetricsClasses.HalsteadBatch import rederive_halstead_metrics, has_counts
+from MetricsClasses.ParseTreeCache import get_parse_tree_cache
+from MetricsClasses.SymbolIndex import collect_symbols, empty_symbols, symbol_index_version
+from Cache.BlobMetricsCache import BlobMetricsCache
+from RepositorySources.RepositorySource import RepositorySource, SourceCommit, TreeEntry
+from RepositorySources.GitHubRepositorySource import GitHubRepositorySource
+from RepositorySources.RateLimitScheduler import RequestBudget
 from github import *
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional
+import threading
 from github import Repository, Branch, GitTree, GitTreeElement
 import json
-from multiprocessing.pool import ThreadPool
 from MetricsFileManager import MetricsFileManager
+from MetricsFileStore import MetricsFileStore
+from CommitWatermark import CommitWatermark
+from CommitPipeline import CommitPipeline, CommitJob
+from ProjectMetrics import ProjectMetrics
 import ast
 
 class BranchMetrics:
-    def __init__(self, repo: Repository, branch_name: str = "main", save_online : bool = False, save:bool = False):
-        self.repo = repo
+    def __init__(self, repo, branch_name: str = "main", save_online : bool = False, save:bool = False,
+                 executor: Optional[MetricsExecutor] = None, cache: Optional[BlobMetricsCache] = None,
+                 metrics: Optional[list] = None, pipeline_queue_size: int = 64, project_metrics: bool = False,
+                 archive_min_files: int = 32, archive_request_kb: float = 128,
+                 budget: Optional[RequestBudget] = None, store: Optional[MetricsFileStore] = None):
+        # repo is a GitHub Repository or any RepositorySource (e.g. a local clone)
+        self.source = repo if isinstance(repo, RepositorySource) else GitHubRepositorySource(repo)
+        self.repo = self.source.repo
         self.branch_name = branch_name
         self.save_online= save_online
         self.save = save
-        self.branch = self.repo.get_branch(branch_name)
+        # A shared executor keeps its worker processes alive across runs; otherwise we own one
+        self.owns_executor = executor is None
+        self.executor = executor if executor is not None else MetricsExecutor(metrics=metrics)
+        # Metric selection spec, e.g. ["Traditional.CC", "Traditional.LOC"]; defaults to the executor's
+        self.selection = parse_metric_selection(metrics) if metrics else self.executor.selection
+        # Blob SHA -> metrics, so files unchanged since an earlier commit are neither fetched nor parsed
+        self.cache = cache if cache is not None else BlobMetricsCache(halstead_scopes=self.executor.halstead_scopes,
+                                                                      metrics=self.selection)
+        self._branch_head = None
+        # Partial runs walk the history independently of full ones
+        self.watermark = CommitWatermark(self.source.full_name, branch_name, selection=self.selection)
+        # Fetched files (and analyzed results) calculate_metrics holds between its stages
+        self.pipeline_queue_size = pipeline_queue_size
+        self.pipeline_stats = None
+        # Exception that ended the last calculate_metrics run early (e.g. listing commits failed) or kept
+        # its results from being saved, if any
+        self.pipeline_error = None
+        # Commits needing at least archive_min_files files (0 never does) are read from one archive
+        # download when its size is below archive_request_kb per file, see should_fetch_archive
+        self.archive_min_files = archive_min_files
+        self.archive_request_kb = archive_request_kb
+        self.fetch_stats = {"file_requests": 0, "archives": 0, "archive_files": 0}
+        self.fetch_stats_lock = threading.Lock()
+        # This repository's share of the API rate limit (see RateLimitScheduler); None walks every new commit
+        self.budget = budget
+        # Only the selected metric types are loaded, calculated and saved
         self.metric_managers = {
-            "Halstead": MetricsFileManager(repo, "Halstead"),
-            "Traditional": MetricsFileManager(repo, "Traditional"),
-            "OO": MetricsFileManager(repo, "OO")
+            metric_type: MetricsFileManager(self.repo, metric_type, repo_name=self.source.full_name, store=store)
+            for metric_type in selected_metric_types(self.selection)
         }
 
-        # Load existing metrics
-        for manager in self.metric_managers.values():
-            manager.load_metrics([])
-            # Clean up any malformed data
-            manager.clean_malformed_data()
-
-    def calculate_file_metrics(self, file_content: GitTreeElement, commit_sha: str) -> tuple[str, Dict]:
-        """Calculate metrics for a single file at a specific commit."""
+        # Project level Fan in, Fan out and CBO across modules, from a repository-wide symbol index
+        self.project = None
+        self.project_manager = None
+        if project_metrics:
+            self.project = ProjectMetrics(self.source.full_name, branch_name)
+            self.project_manager = MetricsFileManager(self.repo, "Project", repo_name=self.source.full_name, store=store)
+            self.project.load()
+
+        # Existing metrics are loaded (and malformed data cleaned up) when first needed, once per store
+        for manager in self.all_managers():
+            manager.load_lazily([], clean=True)
+
+    @property
+    def branch_head(self) -> str:
+        """Head commit of the branch, read on first use so that constructing a BranchMetrics makes no requests."""
+        if self._branch_head is None:
+            self._branch_head = self.source.get_branch_head(self.branch_name)
+        return self._branch_head
+
+    def all_managers(self) -> list:
+        """The metric families' managers and the project metrics' one, if enabled."""
+        managers = list(self.metric_managers.values())
+        if self.project_manager is not None:
+            managers.append(self.project_manager)
+        return managers
+
+    def should_fetch_archive(self, commit_sha: str, files: list) -> bool:
+        """
+        Whether the files of a commit are cheaper to read from one archive of the whole commit than
+        with one request each: a request costs about as much as downloading archive_request_kb of
+        the archive (and one unit of the API rate limit). Small batches never list the tree to
+        estimate the archive's size.
+        """
+        if self.archive_min_files <= 0 or len(files) < self.archive_min_files:
+            return False
         try:
-            full_path = file_content.path
-            file_data = self.repo.get_contents(full_path, ref=commit_sha)
-            tree = ast.parse(file_data.decoded_content.decode('utf-8'))
-
-            controller = MetricsController(tree)
-            metrics = controller.calculate_metrics()
-
-            return full_path, {
-                "Halstead": metrics[0],
-                "Traditional": metrics[1],
-                "OO": metrics[2]
-            }
+            archive_size = self.source.get_archive_size(commit_sha)
         except Exception as e:
-            print(f"Error calculating metrics for {file_content.path} in commit {commit_sha}: {e}")
-            return file_content.path, {}
+            print(f"Error estimating the archive size of {commit_sha[:8]}: {e}")
+            return False
+        return archive_size is not None and len(files) * self.archive_request_kb * 1024 >= archive_size
+
+    def iter_file_sources(self, files: list, commit_sha: str) -> Iterator[tuple[TreeEntry, Optional[bytes]]]:
+        """
+        (file, raw bytes or None if it couldn't be read) of files (TreeEntry) of a commit, as they
+        arrive: from the commit's archive, streamed member by member, if should_fetch_archive says so,
+        otherwise fetched in parallel one request per file. Files the archive didn't have, or that
+        weren't reached before the download failed, are fetched one by one.
+        """
+        if self.should_fetch_archive(commit_sha, files):
+            remaining = {file.path: file for file in files}
+            print(f"Reading {len(files)} files of {commit_sha[:8]} from its archive")
+            try:
+                for path, source in self.source.iter_archive(commit_sha, set(remaining)):
+                    file = remaining.pop(path, None)
+                    if file is None:
+                        continue
+                    with self.fetch_stats_lock:
+                        self.fetch_stats["archive_files"] += 1
+                    yield file, source
+                with self.fetch_stats_lock:
+                    self.fetch_stats["archives"] += 1
+            except Exception as e:
+                print(f"Error reading the archive of {commit_sha[:8]}: {e}")
+            files = list(remaining.values())
+            if files:
+                print(f"Fetching {len(files)} files of {commit_sha[:8]} missing from its archive")
+
+        with self.fetch_stats_lock:
+            self.fetch_stats["file_requests"] += len(files)
+        for file, source, error in self.source.read_files(files, commit_sha):
+            if error is not None:
+                print(f"Error fetching {file.path} in commit {commit_sha}: {error}")
+            yield file, source
+
+    def collect_file_symbols(self, files: list, commit_sha: str) -> None:
+        """
+        Fetch files and cache their symbol summaries, for blobs whose metrics were cached before
+        the project metrics needed them. Files that don't parse get an empty summary.
+        """
+        for file, source in self.iter_file_sources(files, commit_sha):
+            if source is None:
+                continue
+            try:
+                symbols = collect_symbols(get_parse_tree_cache().parse(source, source.decode('utf-8')))
+            except Exception:
+                symbols = empty_symbols()
+            self.cache.put_symbols(file.sha, symbols)
 
     def commit_needs_calculation(self, commit_sha: str) -> bool:
         """Check if metrics for this commit have already been calculated."""
-        for manager in self.metric_managers.values():
+        for metric_type, manager in self.metric_managers.items():
             if manager.needs_recalculation_for_commit(commit_sha):
                 return True
+            # A partial run also needs commits stored by runs that selected other sub-metrics.
+            # (Full runs leave sub-metrics that are missing or outdated to recalculate_stale_metrics)
+            if self.selection is not None and not self.has_selected_metrics(metric_type, commit_sha):
+                return True
+        if self.project_manager is not None and self.project_manager.needs_recalculation_for_commit(commit_sha):
+            return True
         return False
 
-    def calculate_metrics(self):
-        """Calculate metrics for the history of the main branch."""
-        # Get all commits and sort them chronologically (oldest first)
-        all_commits = list(self.repo.get_commits(sha=self.branch_name))
-        all_commits.reverse()  # Now oldest first
-        
-        print(f"Processing {len(all_commits)} commits chronologically...")
-        
-        for i, commit in enumerate(all_commits):
-            commit_sha = commit.sha
-            commit_date = commit.commit.author.date.isoformat()
-
-            print(f"Processing commit {i+1}/{len(all_commits)}: {commit_sha[:8]} on {commit_date}")
-
-            # Skip if already calculated
-            if not self.commit_needs_calculation(commit_sha):
-                print(f"Skipping commit {commit_sha[:8]} (already processed)")
+    def has_selected_metrics(self, metric_type: str, commit_sha: str) -> bool:
+        """Whether a stored commit has every selected sub-metric, according to its stamped versions."""
+        commit_data = self.metric_managers[metric_type].metrics.get(commit_sha, {})
+        # Data stored before versions were stamped always held everything its analyzer calculated
+        if "versions" not in commit_data:
+            return True
+        return all(name in commit_data["versions"] for name in selected_versions(metric_type, self.selection))
+
+    def calculate_commit_metrics(self, commit_sha: str, python_files: list) -> Dict[str, Dict]:
+        """Metrics of every Python file in a commit's tree, keyed by path in tree order."""
+        # Reuse metrics of blobs analyzed before; only the rest are fetched and parsed
+        commit_metrics, files_to_fetch = self.split_cached_files(python_files)
+
+        # Fetch files in parallel (network bound) or stream the commit's archive; each file is analyzed as soon as it arrives
+        work_items = ((file.path, source) for file, source in self.iter_file_sources(files_to_fetch, commit_sha)
+                      if source is not None)
+
+        # Collect results
+        blob_shas = {file.path: file.sha for file in files_to_fetch}
+        for file_path, file_metrics in MetricsController.analyze_many(work_items, executor=self.executor,
+                                                                      metrics=self.selection):
+            if "error" in file_metrics:
+                print(f"Error calculating metrics for {file_path}: {analysis_error_message(file_metrics)}")
+            self.cache.put_result(blob_shas[file_path], file_metrics)
+            file_metrics = usable_metrics(file_metrics)
+            if file_metrics is not None:
+                commit_metrics[file_path] = file_metrics
+        # Keep the snapshot in tree order, as if every file had been analyzed
+        return {file.path: commit_metrics[file.path] for file in python_files if file.path in commit_metrics}
+
+    def split_cached_files(self, python_files: list) -> tuple[Dict[str, Dict], list]:
+        """Split files into {path: metrics} of blobs found in the cache and the files that must be fetched."""
+        cached = {}
+        files_to_fetch = []
+        for file in python_files:
+            cached_metrics = self.cache.get(file.sha)
+            if cached_metrics is not None:
+                cached[file.path] = cached_metrics
+            else:
+                files_to_fetch.append(file)
+        return cached, files_to_fetch
+
+    def get_commit_snapshot(self, commit_sha: str) -> Optional[Dict[str, Dict]]:
+        """
+        Stored metrics of a commit as {file path: {metric type: metrics}}, limited to the selected
+        sub-metrics, or None if a selected family or sub-metric is missing.
+        """
+        snapshot = {}
+        for metric_type, manager in self.metric_managers.items():
+            commit_data = manager.metrics.get(commit_sha)
+            if not isinstance(commit_data, dict) or "metrics" not in commit_data:
+                return None
+            names = selected_versions(metric_type, self.selection)
+            if commit_data["metrics"] and not self.has_selected_metrics(metric_type, commit_sha):
+                return None
+            for file_path, file_metrics in commit_data["metrics"].items():
+                if self.selection is not None:
+                    # Markers such as "Degraded" aren't sub-metrics and stay
+                    file_metrics = {name: value for name, value in file_metrics.items()
+                                    if name in names or name not in analyzer_versions[metric_type]}
+                snapshot.setdefault(file_path, {})[metric_type] = file_metrics
+        return snapshot
+
+    def store_commit_metrics(self, metric_type: str, commit_sha: str, commit_date: str, type_metrics: Dict) -> None:
+        """
+        Store the metrics of a commit calculated with the current selection. Sub-metrics a partial
+        selection didn't calculate are kept from what was stored for the commit before.
+        """
+        manager = self.metric_managers[metric_type]
+        versions = selected_versions(metric_type, self.selection)
+        if self.selection is not None and not manager.needs_recalculation_for_commit(commit_sha):
+            stored = manager.metrics[commit_sha].get("metrics", {})
+            type_metrics = {file_path: {**stored.get(file_path, {}), **file_metrics}
+                            for file_path, file_metrics in type_metrics.items()}
+            versions = {**manager.get_commit_versions(commit_sha), **versions}
+        manager.update_commit_metrics(commit_sha, commit_date, type_metrics, versions=versions)
+
+    def get_changed_python_files(self, commit: SourceCommit) -> Optional[tuple[set, list]]:
+        """
+        Paths a commit drops from its parent's snapshot and the Python files (TreeEntry) it added or
+        modified, or None if its list of changed files is incomplete.
+        """
+        changed_files = self.source.get_changed_files(commit)
+        if changed_files is None:
+            print(f"Commit {commit.sha[:8]} changes too many files to diff, analyzing the whole tree")
+            return None
+
+        dropped = set()
+        files_to_analyze = []
+        for file in changed_files:
+            if file.status == "renamed" and file.previous_filename:
+                dropped.add(file.previous_filename)
+            if not file.filename.endswith('.py'):
                 continue
+            # Modified files are re-analyzed; if they no longer parse they must not keep the old metrics
+            dropped.add(file.filename)
+            if file.status != "removed":
+                files_to_analyze.append(TreeEntry(file.filename, file.sha))
+        return dropped, files_to_analyze
+
+    def merge_changed_metrics(self, previous_snapshot: Dict[str, Dict], dropped: set,
+                              changed_metrics: Dict[str, Dict]) -> Dict[str, Dict]:
+        """A commit's snapshot from its parent's: dropped paths removed, changed files' metrics added."""
+        commit_metrics = {file_path: file_metrics for file_path, file_metrics in previous_snapshot.items()
+                          if file_path not in dropped}
+        commit_metrics.update(changed_metrics)
+        # Tree listings are in path order; keep the snapshot in the same order
+        return {file_path: commit_metrics[file_path] for file_path in sorted(commit_metrics)}
+
+    def plan_commit(self, job: CommitJob, calculated: set) -> None:
+        """
+        Decide what calculate_metrics' pipeline does for a commit: skip it (already calculated),
+        analyze the files it changed since its parent, or analyze its whole tree.
+        calculated holds the commits planned before; their snapshots are stored before this one's.
+        """
+        commit = job.commit
+        print(f"Processing commit {job.index+1}: {commit.sha[:8]} on {commit.date.isoformat()}")
+        if not self.commit_needs_calculation(commit.sha):
+            job.skip = True
+            return
+        calculated.add(commit.sha)
+
+        # Only analyze what changed since the parent, if its metrics are (or will be) known
+        changed = None
+        if commit.parents:
+            parent_sha = commit.parents[0]
+            if parent_sha in calculated or self.get_commit_snapshot(parent_sha) is not None:
+                changed = self.get_changed_python_files(commit)
+        if changed is not None:
+            job.parent_sha = commit.parents[0]
+            job.dropped, job.files = changed
+            print(f"{len(job.files)} Python files changed since {job.parent_sha[:8]}")
+        else:
+            job.files = [item for item in self.source.get_tree(commit.sha) if item.path.endswith('.py')]
+            if job.files:
+                print(f"Found {len(job.files)} Python files")
+            else:
+                print(f"No Python files found in commit {commit.sha[:8]}")
+        job.cached, job.files_to_fetch = self.split_cached_files(job.files)
+        if self.project is not None:
+            job.symbol_files = [file for file in job.files
+                                if file.path in job.cached and self.cache.get_symbols(file.sha) is None]
+
+    def assemble_commit_metrics(self, job: CommitJob) -> Dict[str, Dict]:
+        """The snapshot of a commit that went through the pipeline, from its cached and analyzed files."""
+        analyzed = {**job.cached, **job.results}
+        for file in job.deferred:
+            # Blobs that couldn't be fetched have no cached metrics, as if they were analyzed again
+            cached_metrics = self.cache.get(file.sha)
+            if cached_metrics is not None:
+                analyzed[file.path] = cached_metrics
+        changed_metrics = {file.path: analyzed[file.path] for file in job.files if file.path in analyzed}
+        if job.parent_sha is None:
+            return changed_metrics
+        previous_snapshot = self.get_commit_snapshot(job.parent_sha)
+        if previous_snapshot is None:
+            # The parent failed in this run, so nothing can be carried forward
+            print(f"Metrics of {job.parent_sha[:8]} missing, analyzing the whole tree of {job.commit.sha[:8]}")
+            python_files = [item for item in self.source.get_tree(job.commit.sha) if item.path.endswith('.py')]
+            return self.calculate_commit_metrics(job.commit.sha, python_files)
+        return self.merge_changed_metrics(previous_snapshot, job.dropped, changed_metrics)
+
+    def store_project_metrics(self, job: CommitJob, commit_date: str, branch_info: Dict) -> None:
+        """
+        Store the project metrics of a commit that went through the pipeline. The symbol index only
+        takes the files the commit changed if it is at the commit's parent; otherwise (first commit of
+        a run without a saved index, after a skipped or failed commit) it is rebuilt from the whole tree.
+        """
+        commit_sha = job.commit.sha
+        if job.parent_sha is not None and self.project.head == job.parent_sha:
+            project_metrics = self.project.apply(commit_sha, job.dropped, {file.path: file.sha for file in job.files},
+                                                 self.cache.get_symbols)
+        else:
+            python_files = job.files if job.parent_sha is None else \
+                [item for item in self.source.get_tree(commit_sha) if item.path.endswith('.py')]
+            print(f"Building the symbol index of {commit_sha[:8]} from {len(python_files)} Python files")
+            self.collect_file_symbols([file for file in python_files if self.cache.get_symbols(file.sha) is None],
+                                      commit_sha)
+            project_metrics = self.project.rebuild(commit_sha, {file.path: file.sha for file in python_files},
+                                                   self.cache.get_symbols)
+        self.project_manager.update_commit_metrics(commit_sha, commit_date, project_metrics,
+                                                   versions={"Symbols": symbol_index_version})
+        self.project_manager.update_branch_info(commit_sha, branch_info)
+
+    def save_all_metrics(self) -> bool:
+        """Save every metric family depending on configuration. Returns False if any save failed."""
+        saved = True
+        for manager in self.all_managers():
+            print(f"Saving {manager.metric_type} metrics...")
+            if self.save_online:
+                saved = manager.save_metrics() and saved
+            if self.save:
+                saved = manager.save_local_metrics() and saved
+        return saved
 
-            try:
-                tree = self.repo.get_git_tree(commit_sha, recursive=True).tree
-                python_files = [item for item in tree if item.path.endswith('.py')]
-                
-                if not python_files:
-                    print(f"No Python files found in commit {commit_sha[:8]}")
-                    # Still record the commit info even if no Python files
-                    branch_info = {
-                        "commit_sha": commit_sha,
-                        "commit_date": commit_date,
-                        "file_count": 0
-                    }
-                    for manager in self.metric_managers.values():
-                        manager.update_commit_metrics(commit_sha, commit_date, {})
-                        manager.update_branch_info(commit_sha, branch_info)
+    def recalculate_stale_metrics(self):
+        """
+        Recompute only the sub-metrics whose analyzer version changed since they were stored.
+        Families and sub-metrics that are still current keep their stored values.
+        """
+        commit_shas = []
+        for manager in self.metric_managers.values():
+            commit_shas.extend(sha for sha in manager.get_commit_shas() if sha not in commit_shas)
+
+        print(f"Checking {len(commit_shas)} stored commits for stale metrics...")
+        self.cache.reset_stats()
+        rederived = self.rederive_stale_halstead_metrics(commit_shas)
+        recalculated = 0
+
+        for commit_sha in commit_shas:
+            stale = {}
+            for metric_type, manager in self.metric_managers.items():
+                commit_data = manager.metrics.get(commit_sha)
+                # Commits without Python files have nothing to recompute
+                if not commit_data or not commit_data.get("metrics"):
                     continue
+                stale_metrics = self.get_stale_metrics(metric_type, commit_sha)
+                if stale_metrics:
+                    stale[metric_type] = stale_metrics
+            if not stale:
+                continue
 
-                print(f"Found {len(python_files)} Python files")
+            print(f"Recalculating commit {commit_sha[:8]}: " +
+                  "; ".join(f"{metric_type} ({', '.join(names)})" for metric_type, names in stale.items()))
+            try:
+                python_files = [item for item in self.source.get_tree(commit_sha) if item.path.endswith('.py')]
+                commit_metrics = self.calculate_commit_metrics(commit_sha, python_files)
+            except Exception as e:
+                print(f"Error recalculating commit {commit_sha[:8]}: {e}")
+                continue
 
-                # Process files in parallel
-                with ThreadPool() as pool:
-                    results = [pool.apply_async(self.calculate_file_metrics, (file, commit_sha)) for file in python_files]
-                    pool.close()
-                    pool.join()
+            for metric_type, stale_metrics in stale.items():
+                manager = self.metric_managers[metric_type]
+                stored = manager.metrics[commit_sha]["metrics"]
+                for file_path, file_metrics in commit_metrics.items():
+                    if metric_type not in file_metrics:
+                        continue
+                    fresh = file_metrics[metric_type]
+                    if file_path not in stored:
+                        stored[file_path] = fresh
+                        continue
+                    # Copy instead of updating in place: cached metrics are shared between commits
+                    stored[file_path] = {**stored[file_path],
+                                         **{name: fresh[name] for name in stale_metrics if name in fresh}}
+                manager.update_commit_versions(commit_sha, {name: analyzer_versions[metric_type][name] for name in stale_metrics})
+            recalculated += 1
+
+        print(f"Recalculated stale metrics for {recalculated} commits")
+        if recalculated or rederived:
+            self.save_all_metrics()
+
+        if self.owns_executor:
+            self.executor.shutdown()
+
+    def get_stale_metrics(self, metric_type: str, commit_sha: str) -> list:
+        """Selected sub-metrics of a stored commit whose version differs from the current analyzer."""
+        names = selected_versions(metric_type, self.selection)
+        stored_versions = self.metric_managers[metric_type].get_commit_versions(commit_sha)
+        return [name for name in get_stale_metrics(metric_type, stored_versions) if name in names]
+
+    def rederive_stale_halstead_metrics(self, commit_shas: list) -> int:
+        """
+        Recompute stale derived Halstead metrics from the stored raw counts in one batch over the
+        whole history, without fetching or parsing any file. Commits that need more than that
+        (stale counts, results stored before counts were) are left to recalculate_stale_metrics.
+        """
+        if "Halstead" not in self.metric_managers:
+            return 0
+        manager = self.metric_managers["Halstead"]
+        rows = []  # (commit sha, file path, stale derived metrics)
+        rederived = []
+        for commit_sha in commit_shas:
+            commit_data = manager.metrics.get(commit_sha)
+            if not commit_data or not commit_data.get("metrics"):
+                continue
+            stale_metrics = self.get_stale_metrics("Halstead", commit_sha)
+            if not stale_metrics or not set(stale_metrics) <= set(halstead_metrics_names):
+                continue
+            if not all(has_counts(file_metrics) for file_metrics in commit_data["metrics"].values()):
+                continue
+            rows.extend((commit_sha, file_path, stale_metrics) for file_path in commit_data["metrics"])
+            rederived.append((commit_sha, stale_metrics))
+        if not rows:
+            return 0
+
+        # Rows of one commit share their stale metrics, so all derived metrics are computed and
+        # only the stale ones are written back
+        fresh = rederive_halstead_metrics(manager.metrics[commit_sha]["metrics"][file_path]
+                                          for commit_sha, file_path, _ in rows)
+        for (commit_sha, file_path, stale_metrics), file_metrics in zip(rows, fresh):
+            stored = manager.metrics[commit_sha]["metrics"]
+            # Copy instead of updating in place: cached metrics are shared between commits
+            stored[file_path] = {**stored[file_path], **{name: file_metrics[name] for name in stale_metrics}}
+        for commit_sha, stale_metrics in rederived:
+            manager.update_commit_versions(commit_sha, {name: analyzer_versions["Halstead"][name] for name in stale_metrics})
+        print(f"Rederived Halstead metrics of {len(rows)} files in {len(rederived)} commits from stored counts")
+        return len(rederived)
+
+    def iter_new_commits(self, watermark: Optional[str]) -> Iterator[SourceCommit]:
+        """Stream the commits of the branch after the watermark, oldest first."""
+        since_sha = None
+        if watermark:
+            # After a force push the old head is no longer an ancestor; resume from where the histories split
+            since_sha = self.source.get_merge_base(watermark, self.branch_head)
+            if since_sha is None:
+                print(f"Watermark {watermark[:8]} not found, walking the whole history of {self.branch_name}")
+            elif since_sha != watermark:
+                print(f"Branch {self.branch_name} was force-pushed, resuming from merge base {since_sha[:8]}")
+        return self.source.iter_commits(self.branch_head, since_sha)
 
-                    # Collect results
-                    commit_metrics = {}
-                    for result in results:
-                        file_path, file_metrics = result.get()
-                        if file_metrics:
-                            commit_metrics[file_path] = file_metrics
+    def calculate_metrics(self):
+        """Calculate metrics for the commits of the branch added since the last run."""
+        self.cache.reset_stats()
+        self.pipeline_error = None
+        watermark = self.watermark.load()
+        if watermark == self.branch_head:
+            print(f"Branch {self.branch_name} unchanged since {watermark[:8]}, nothing to process")
+            if self.owns_executor:
+                self.executor.shutdown()
+            return
+
+        print("Processing commits chronologically...")
+        # The watermark only moves past commits that were processed, so a failed commit is retried next run
+        processed_head = None
+        failed = False
+
+        # Fetching, analysis and storing overlap across commits; jobs come back in history order
+        pipeline = CommitPipeline(self, queue_size=self.pipeline_queue_size)
+        commits = self.iter_new_commits(watermark)
+        if self.budget is not None:
+            # Commits left when the repository's share of the rate limit runs out wait for the next run
+            commits = self.budget.limit(commits)
+        try:
+            for job in pipeline.run(commits):
+                commit_sha = job.commit.sha
+                commit_date = job.commit.date.isoformat()
+
+                # Skip if already calculated
+                if job.skip:
+                    print(f"Skipping commit {commit_sha[:8]} (already processed)")
+                    if not failed:
+                        processed_head = commit_sha
+                    continue
 
-                # Update metrics for each type
-                for metric_type in supported_metrics:
-                    manager = self.metric_managers[metric_type]
-                    
-                    # Extract metrics for this type from all files
-                    type_metrics = {}
-                    for file_path, file_metrics in commit_metrics.items():
-                        if metric_type in file_metrics:
-                            type_metrics[file_path] = file_metrics[metric_type]
+                try:
+                    if job.error is not None:
+                        raise job.error
+                    commit_metrics = self.assemble_commit_metrics(job)
+
+                    # Update metrics for each type
+                    for metric_type in self.metric_managers:
+                        # Extract metrics for this type from all files
+                        type_metrics = {}
+                        for file_path, file_metrics in commit_metrics.items():
+                            if metric_type in file_metrics:
+                                type_metrics[file_path] = file_metrics[metric_type]
                     
-                    # Update the manager with commit-based structure
-                    manager.update_commit_metrics(commit_sha, commit_date, type_metrics)
+                        # Update the manager with commit-based structure
+                        self.store_commit_metrics(metric_type, commit_sha, commit_date, type_metrics)
 
-                # Update branch info
-                branch_info = {
-                    "commit_sha": commit_sha,
-                    "commit_date": commit_date,
-                    "file_count": len(commit_metrics)
-                }
-
-                for manager in self.metric_managers.values():
-                    manager.update_branch_info(commit_sha, branch_info)
+                    # Update branch info
+                    branch_info = {
+                        "commit_sha": commit_sha,
+                        "commit_date": commit_date,
+                        "file_count": len(commit_metrics)
+                    }
 
-                print(f"Processed {len(commit_metrics)} files in commit {commit_sha[:8]}")
+                    for manager in self.metric_managers.values():
+                        manager.update_branch_info(commit_sha, branch_info)
+                    if self.project is not None:
+                        self.store_project_metrics(job, commit_date, branch_info)
 
-            except Exception as e:
-                print(f"Error processing commit {commit_sha[:8]}: {e}")
-                continue
+                    print(f"Processed {len(commit_metrics)} files in commit {commit_sha[:8]}")
+                    if not failed:
+                        processed_head = commit_sha
 
-        # Save depending on configuration
-        for metric_type, manager in self.metric_managers.items():
-            print(f"Saving {metric_type} metrics...")
-            if self.save_online:
-                manager.save_metrics()
-            if self.save:
-                manager.save_local_metrics()
+                except Exception as e:
+                    print(f"Error processing commit {commit_sha[:8]}: {e}")
+                    failed = True
+                    continue
 
+        except Exception as e:
+            # The commits already persisted are still saved; the watermark stops before the failure
+            print(f"Error in the commit pipeline of branch {self.branch_name}: {e}")
+            self.pipeline_error = e
+            failed = True
+
+        if not self.save_all_metrics():
+            # Commits that were not saved must not be skipped next run
+            print(f"Saving the metrics of branch {self.branch_name} failed, keeping its watermark")
+            self.pipeline_error = IOError(f"saving the metrics of branch {self.branch_name} failed")
+            processed_head = None
+            failed = True
+
+        # Only a persisted run may move the watermark
+        if not failed and not (self.budget is not None and self.budget.stopped):
+            processed_head = self.branch_head
+        if processed_head and (self.save or self.save_online):
+            self.watermark.save(processed_head)
+            if self.project is not None:
+                self.project.save()
+
+        if self.owns_executor:
+            self.executor.shutdown()
+
+        self.pipeline_stats = pipeline.get_stats()
+        print(pipeline.format_stats())
+        cache_stats = self.cache.get_stats()
+        print(f"Metrics cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.1%} hit rate)")
+        parse_stats = self.executor.get_parse_cache_stats()
+        print(f"Parse tree cache: {parse_stats['hits']} hits, {parse_stats['misses']} misses ({parse_stats['hit_rate']:.1%} hit rate)")
+        print(f"Fetches: {self.fetch_stats['file_requests']} file requests, "
+              f"{self.fetch_stats['archive_files']} files from {self.fetch_stats['archives']} archives")
+        if self.project is not None:
+            index_stats = self.project.get_stats()
+            print(f"Symbol index: {index_stats['modules']} modules, {index_stats['symbols']} symbols, "
+                  f"{index_stats['edges']} edges ({index_stats['resolved_modules']} module resolutions, "
+                  f"{index_stats['dirty_modules']} module recalculations)")
         print("Historical metrics calculation completed.")
 
     def format_metrics_for_json(self, metrics_dict: Dict) -> Dict:
@@ -158,11 +605,11 @@ class BranchMetrics:
 
     def compare_to_main(self, other_branch_name: str = "main") -> Dict:
         """Compare metrics from this branch with the main branch."""
-        metrics = BranchMetrics(self.repo, branch_name=other_branch_name)
+        metrics = BranchMetrics(self.source, branch_name=other_branch_name, metrics=self.selection)
         metrics.load_existing_only()
 
         comparison = {}
-        for metric_type in supported_metrics:
+        for metric_type in self.metric_managers:
             current = self.metric_managers[metric_type].metrics
             main = metrics.metric_managers[metric_type].metrics
 
@@ -210,8 +657,15 @@ class BranchMetrics:
             manager.load_existing_metrics()
 
 class MainBranchMetrics(BranchMetrics):
-    def __init__(self, repo, save_online : bool = False, save:bool = False):
-        super().__init__(repo, branch_name="main", save_online=save_online,save=save)
+    def __init__(self, repo, save_online : bool = False, save:bool = False, executor: Optional[MetricsExecutor] = None,
+                 cache: Optional[BlobMetricsCache] = None, metrics: Optional[list] = None,
+                 pipeline_queue_size: int = 64, project_metrics: bool = False, archive_min_files: int = 32,
+                 archive_request_kb: float = 128, budget: Optional[RequestBudget] = None,
+                 store: Optional[MetricsFileStore] = None):
+        super().__init__(repo, branch_name="main", save_online=save_online,save=save, executor=executor, cache=cache,
+                         metrics=metrics, pipeline_queue_size=pipeline_queue_size, project_metrics=project_metrics,
+                         archive_min_files=archive_min_files, archive_request_kb=archive_request_kb, budget=budget,
+                         store=store)
 # from datetime import datetime
 # import sys
 # import os
@@ -0,0 +1,278 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import queue
+import threading
+import time
+from contextlib import closing
+from typing import Dict, Iterable, Iterator, Optional
+from MetricsClasses.MetricsController import MetricsController, usable_metrics, analysis_error_message
+from RepositorySources.RepositorySource import SourceCommit
+
+pipeline_stages=["fetch","analyze","persist"]
+
+class CommitJob:
+    """A commit moving through the CommitPipeline, with what was planned, fetched and analyzed for it."""
+    def __init__(self, index: int, commit: SourceCommit):
+        self.index = index
+        self.commit = commit
+        self.skip = False          # Already calculated, nothing to do
+        self.error = None          # Exception that failed the commit before it reached persist
+        self.parent_sha = None     # Set when only the files changed since this parent are analyzed
+        self.dropped = set()       # Paths of the parent's snapshot the commit removed or modified
+        self.files = []            # Python files (TreeEntry) whose metrics the commit needs
+        self.cached = {}           # path -> metrics found in the blob cache
+        self.files_to_fetch = []   # The rest of files
+        self.deferred = []         # Files whose blob an earlier commit of the run fetched, read from the cache at persist
+        self.symbol_files = []     # Cached files whose symbol summary the project metrics still need
+        self.results = {}          # path -> metrics analyzed in this run
+        self.sent = None           # Files sent to analysis, known once fetching is done
+        self.received = 0
+
+    def is_finished(self) -> bool:
+        return self.sent is not None and self.received == self.sent
+
+class CommitPipeline:
+    """
+    Calculates the metrics of a stream of commits in three stages connected by bounded queues:
+    fetch (a thread planning each commit and reading its files through the shared I/O executor or
+    from the commit's archive),
+    analyze (a thread feeding the MetricsExecutor's worker pool) and persist (the caller, which
+    gets finished commits from run() in history order). Commit N+1 is already being fetched while
+    commit N is analyzed, and the queues bound how many fetched sources are held in memory.
+    """
+    def __init__(self, branch_metrics, queue_size: int = 64):
+        """
+        Args:
+            branch_metrics: BranchMetrics whose plan_commit and iter_file_sources feed the pipeline.
+            queue_size: Capacity of the fetch -> analyze and analyze -> persist queues.
+        """
+        self.branch = branch_metrics
+        self.file_queue = queue.Queue(maxsize=max(1, queue_size))    # fetch -> analyze
+        self.result_queue = queue.Queue(maxsize=max(1, queue_size))  # analyze -> persist
+        self.stop = threading.Event()
+        self.errors = []
+        self.lock = threading.Lock()
+        self.started = None
+        self.finished = None
+        self.stats = {stage: {"items": 0, "busy_seconds": 0.0, "max_queue_depth": 0} for stage in pipeline_stages}
+        self.planned_commits = 0
+        self.fetched_bytes = 0
+
+    def run(self, commits: Iterable[SourceCommit]) -> Iterator[CommitJob]:
+        """
+        Push commits through the fetch and analyze stages and yield each CommitJob once all of its
+        files are analyzed, in the order of commits. Skipped and failed commits are yielded too.
+        The caller persists a job before asking for the next one (the time it takes is the persist stage's).
+        """
+        self.started = time.perf_counter()
+        # Workers forked while the fetch stage runs git subprocesses could hang them (see MetricsExecutor.analyze_iter)
+        if self.branch.executor.max_workers > 1:
+            self.branch.executor.start_pool()
+        threads = [threading.Thread(target=self._fetch_stage, args=(commits,), name="pipeline-fetch", daemon=True),
+                   threading.Thread(target=self._analyze_stage, name="pipeline-analyze", daemon=True)]
+        for thread in threads:
+            thread.start()
+
+        jobs = {}  # index -> job not yielded yet
+        next_index = 0
+        try:
+            while True:
+                message = self.result_queue.get()
+                if message is None:
+                    break
+                kind = message[0]
+                if kind == "commit":
+                    jobs[message[1].index] = message[1]
+                elif kind == "done":
+                    message[1].sent = message[2]
+                else:
+                    # The commit marker always comes first, so its job is known
+                    job, path, file_metrics = jobs[message[1]], message[2], message[3]
+                    job.received += 1
+                    if "error" in file_metrics:
+                        print(f"Error calculating metrics for {path}: {analysis_error_message(file_metrics)}")
+                    file_metrics = usable_metrics(file_metrics)
+                    if file_metrics is not None:
+                        job.results[path] = file_metrics
+
+                while next_index in jobs and jobs[next_index].is_finished():
+                    job = jobs.pop(next_index)
+                    next_index += 1
+                    persist_started = time.perf_counter()
+                    yield job
+                    self._record("persist", 1, time.perf_counter() - persist_started)
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            self.finished = time.perf_counter()
+
+        if self.errors:
+            raise self.errors[0]
+
+    def _fetch_stage(self, commits: Iterable[SourceCommit]) -> None:
+        """Plan every commit and fetch the files it needs that aren't cached."""
+        calculated = set()  # Commits planned for calculation, their snapshots will exist by the time children persist
+        fetched_blobs = set()  # Their results are cached before any later commit persists
+        try:
+            busy_since = time.perf_counter()
+            for index, commit in enumerate(commits):
+                job = CommitJob(index, commit)
+                try:
+                    self.branch.plan_commit(job, calculated)
+                except Exception as e:
+                    job.error = e
+                if not self._put(self.file_queue, ("commit", job), "fetch", busy_since):
+                    return
+                busy_since = time.perf_counter()
+
+                sent = 0
+                if not job.skip and job.error is None:
+                    # Blobs of earlier commits may still be in analysis, so they missed the cache when planning
+                    job.deferred = [file for file in job.files_to_fetch if file.sha in fetched_blobs]
+                    files_to_fetch = [file for file in job.files_to_fetch if file.sha not in fetched_blobs]
+                    # Closed on early returns, so an archive download doesn't stay open
+                    with closing(self.branch.iter_file_sources(files_to_fetch, commit.sha)) as sources:
+                        for file, source in sources:
+                            if source is None:
+                                continue
+                            fetched_blobs.add(file.sha)
+                            with self.lock:
+                                self.fetched_bytes += len(source)
+                            self._record("fetch", 1)
+                            if not self._put(self.file_queue, ("file", job, (job.index, file.path, file.sha), source),
+                                             "fetch", busy_since):
+                                return
+                            busy_since = time.perf_counter()
+                            sent += 1
+                    if job.symbol_files:
+                        self.branch.collect_file_symbols(job.symbol_files, commit.sha)
+                with self.lock:
+                    self.planned_commits += 1
+                if not self._put(self.file_queue, ("done", job, sent), "fetch", busy_since):
+                    return
+                busy_since = time.perf_counter()
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            self._put(self.file_queue, None)
+
+    def _analyze_stage(self) -> None:
+        """Analyze fetched files in the worker pool, passing commit markers through in order."""
+        waited = [0.0]
+        analyze_started = time.perf_counter()
+
+        def feed() -> Iterator:
+            while True:
+                wait_started = time.perf_counter()
+                message = self._get(self.file_queue)
+                if message is None:
+                    waited[0] += time.perf_counter() - wait_started
+                    return
+                if message[0] == "file":
+                    waited[0] += time.perf_counter() - wait_started
+                    yield message[2], message[3]
+                    continue
+                # Commit markers are passed on before any of the commit's results
+                self._put(self.result_queue, message)
+                waited[0] += time.perf_counter() - wait_started
+
+        try:
+            for (index, path, blob_sha), file_metrics in MetricsController.analyze_many(
+                    feed(), executor=self.branch.executor, metrics=self.branch.selection,
+                    symbols=self.branch.project is not None):
+                # Before the metrics, so a blob with cached metrics always has its symbols
+                symbols = file_metrics.pop("Symbols", None)
+                if symbols is not None:
+                    self.branch.cache.put_symbols(blob_sha, symbols)
+                # Cached right away, so a later commit with the same blob doesn't fetch it again
+                self.branch.cache.put_result(blob_sha, file_metrics)
+                self._record("analyze", 1)
+                wait_started = time.perf_counter()
+                if not self._put(self.result_queue, ("result", index, path, file_metrics)):
+                    return
+                waited[0] += time.perf_counter() - wait_started
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            self._record("analyze", 0, time.perf_counter() - analyze_started - waited[0])
+            self._put(self.result_queue, None)
+
+    def _put(self, target: queue.Queue, message, stage: Optional[str] = None,
+             busy_since: Optional[float] = None) -> bool:
+        """
+        Put a message on a bounded queue, blocking while it is full (the backpressure), unless the
+        pipeline is stopped. Returns False when stopped. stage and busy_since add the work done
+        since busy_since to that stage's busy time.
+        """
+        if stage is not None:
+            self._record(stage, 0, time.perf_counter() - busy_since)
+        while not self.stop.is_set():
+            try:
+                target.put(message, timeout=0.1)
+            except queue.Full:
+                continue
+            depth_stage = "analyze" if target is self.file_queue else "persist"
+            with self.lock:
+                stats = self.stats[depth_stage]
+                stats["max_queue_depth"] = max(stats["max_queue_depth"], target.qsize())
+            return True
+        return False
+
+    def _get(self, source: queue.Queue):
+        """Get a message from a queue, or None once the pipeline is stopped."""
+        while not self.stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _record(self, stage: str, items: int, seconds: float = 0.0) -> None:
+        with self.lock:
+            self.stats[stage]["items"] += items
+            self.stats[stage]["busy_seconds"] += seconds
+
+    def get_stats(self) -> Dict:
+        """
+        Per stage: items done (files for fetch and analyze, commits for persist), busy seconds,
+        throughput (items per second of the run), utilization (busy share of the run) and the
+        current and maximum depth of the queue feeding it.
+        """
+        end = self.finished if self.finished is not None else time.perf_counter()
+        elapsed = end - self.started if self.started is not None else 0.0
+        depths = {"fetch": None, "analyze": self.file_queue.qsize(), "persist": self.result_queue.qsize()}
+        with self.lock:
+            stages = {}
+            for stage in pipeline_stages:
+                stats = self.stats[stage]
+                stages[stage] = {
+                    "items": stats["items"],
+                    "busy_seconds": stats["busy_seconds"],
+                    "throughput": stats["items"] / elapsed if elapsed else 0.0,
+                    "utilization": stats["busy_seconds"] / elapsed if elapsed else 0.0,
+                    "queue_depth": depths[stage],
+                    "max_queue_depth": stats["max_queue_depth"] if depths[stage] is not None else None
+                }
+            return {
+                "elapsed_seconds": elapsed,
+                "planned_commits": self.planned_commits,
+                "fetched_bytes": self.fetched_bytes,
+                "queue_size": self.file_queue.maxsize,
+                "stages": stages
+            }
+
+    def format_stats(self) -> str:
+        """Human readable summary of get_stats, one line per stage."""
+        stats = self.get_stats()
+        lines = [f"Pipeline: {stats['planned_commits']} commits, {stats['fetched_bytes'] / 1024 / 1024:.2f} MB fetched "
+                 f"in {stats['elapsed_seconds']:.2f}s"]
+        units = {"fetch": "files", "analyze": "files", "persist": "commits"}
+        for stage, stage_stats in stats["stages"].items():
+            line = (f"  {stage}: {stage_stats['items']} {units[stage]} ({stage_stats['throughput']:.1f}/s), "
+                    f"busy {stage_stats['utilization']:.0%}")
+            if stage_stats["queue_depth"] is not None:
+                line += f", queue {stage_stats['queue_depth']}/{stats['queue_size']} (max {stage_stats['max_queue_depth']})"
+            lines.append(line)
+        return "\n".join(lines)
@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from MetricsClasses.MetricsController import metric_selection_key
+
+class CommitWatermark:
+    """
+    Last processed head of a branch. Scheduled runs only walk the commits after it
+    instead of paginating the whole history again.
+    Runs that only calculate some metrics (a selection) keep a watermark of their own.
+    """
+    def __init__(self, repo_name: str, branch_name: str, output_dir: str = "metrics",
+                 selection: Optional[Dict[str, List[str]]] = None):
+        self.branch_name = branch_name
+        self.selection = selection
+        selection_key = metric_selection_key(selection)
+        file_name = branch_name.replace('/', '_') + (f"_{selection_key}" if selection_key else "") + "_watermark.json"
+        # Kept next to the metrics files it describes, so deleting them also resets the watermark
+        self.file_path = Path(output_dir) / repo_name.replace("/", "_") / file_name
+
+    def load(self) -> Optional[str]:
+        """Return the last processed head SHA, or None if the branch was never processed."""
+        if not os.path.exists(self.file_path):
+            return None
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("head")
+        except Exception as e:
+            print(f"Error loading watermark {self.file_path}: {e}")
+            return None
+
+    def save(self, commit_sha: str) -> None:
+        """Record that every commit up to and including commit_sha has been processed."""
+        try:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file_path, 'w', encoding='utf-8') as f:
+                watermark = {
+                    "branch": self.branch_name,
+                    "head": commit_sha,
+                    "updated": datetime.now().isoformat()
+                }
+                if self.selection is not None:
+                    watermark["metrics"] = self.selection
+                json.dump(watermark, f, indent=4)
+        except Exception as e:
+            print(f"Error saving watermark {self.file_path}: {e}")
@@ -49,7 +49,8 @@ class MetricsDataFrames:
             file_metrics = commit_data["metrics"]
             if file_name in file_metrics:
                 dates.append(self._parse_datetime(sha))
-                metrics_data.append(file_metrics[file_name])
+                # Raw counts and per function/class scopes are nested dicts, not time series of the file
+                metrics_data.append({name: value for name, value in file_metrics[file_name].items() if not isinstance(value, dict)})
         return pd.DataFrame(metrics_data, index=dates)
 
     def _process_oo(self, file_name):
@@ -93,7 +94,7 @@ class MetricsDataFrames:
         return metric_dfs
 
     def _process_traditional(self, file_name):
-        flat_metrics = ['LOC', 'Length of Identifier']
+        flat_metrics = ['LOC', 'Length of Identifier', 'Physical LOC', 'SLOC', 'Comment Lines', 'Blank Lines', 'Docstring Lines']
         nested_metrics = ['Fan in', 'Fan out', 'CC']
         dates = []
 
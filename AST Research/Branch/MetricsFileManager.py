@@ -8,23 +8,50 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 from github import Repository, Branch, GitTree, GitTreeElement
 from pathlib import Path
+from MetricsFileStore import MetricsFileEntry, MetricsFileStore
 
 class MetricsFileManager:
-    def __init__(self, repo: Repository, metric_type: str, branch_name: str = "main", output_dir: str = "metrics"):
+    def __init__(self, repo: Optional[Repository], metric_type: str, branch_name: str = "main", output_dir: str = "metrics",
+                 repo_name: Optional[str] = None, store: Optional[MetricsFileStore] = None):
+        # repo may be None for sources without a GitHub side (e.g. a local clone); metrics then stay local
         self.repo = repo
         self.metric_type = metric_type
         self.branch_name = branch_name
 
         # File naming includes branch and metric type
         self.file_name = f"{self.metric_type}_Metrics.json"
-        self.repo_safe_name = repo.full_name.replace("/", "_")
+        self.repo_safe_name = (repo_name or repo.full_name).replace("/", "_")
         self.output_dir = Path(output_dir) / self.repo_safe_name
         self.local_file_path = self.output_dir / self.file_name
-        self.metrics: Dict = {}
+        # Contents of the file, shared with the other managers of the same file in the store
+        self.entry = store.get_entry((str(self.local_file_path), branch_name)) if store is not None else MetricsFileEntry()
         self.file_sha = None
 
+    @property
+    def metrics(self) -> Dict:
+        return self.entry.get_metrics()
+
+    @metrics.setter
+    def metrics(self, metrics: Dict) -> None:
+        self.entry.set_metrics(metrics)
+
+    def load_lazily(self, tree=None, clean: bool = False) -> None:
+        """
+        Load (see load_metrics) and optionally clean the stored metrics on first access instead of now,
+        so managers that are never read cost no requests. Nothing is loaded if another manager of the
+        same file already did.
+        """
+        def load():
+            self.load_metrics(tree)
+            if clean:
+                self.clean_malformed_data()
+        self.entry.request_load(load)
+
     def load_metrics(self, tree) -> None:
         """Load metrics data from GitHub metrics folder or local."""
+        if self.repo is None:
+            self.load_existing_metrics()
+            return
         try:
             metrics_folder = "metrics"
             file_path = f"{metrics_folder}/{self.file_name}"
@@ -104,8 +131,8 @@ class MetricsFileManager:
             current = current[key]
         current[keys[-1]] = value
 
-    def save_local_metrics(self) -> None:
-        """Save metrics to a local JSON file, merging with existing data."""
+    def save_local_metrics(self) -> bool:
+        """Save metrics to a local JSON file, merging with existing data. Returns False if saving failed."""
         try:
             # Ensure the directory exists
             self.output_dir.mkdir(parents=True, exist_ok=True)
@@ -130,12 +157,17 @@ class MetricsFileManager:
             
             # Update our internal metrics to reflect the merged state
             self.metrics = merged_data
+            return True
             
         except Exception as e:
             print(f"Failed to save metrics locally: {e}")
+            return False
 
-    def save_metrics(self) -> None:
-        """Save metrics to GitHub repo in a 'metrics' folder, merging with existing data."""
+    def save_metrics(self) -> bool:
+        """Save metrics to GitHub repo in a 'metrics' folder, merging with existing data. Returns False if saving failed."""
+        if self.repo is None:
+            print(f"Cannot save {self.file_name} online: no GitHub repository for {self.repo_safe_name}")
+            return False
         try:
             # Define path to include the metrics folder
             metrics_folder = "metrics"
@@ -208,9 +240,11 @@ class MetricsFileManager:
             
             # Update our internal metrics to reflect the merged state
             self.metrics = merged_data
+            return True
             
         except Exception as e:
             print(f"Error saving {self.file_name} to GitHub: {e}")
+            return False
 
     def reload_and_merge_metrics(self, new_metrics: Dict = None) -> None:
         """Reload metrics from source and optionally merge with new metrics before saving."""
@@ -231,12 +265,40 @@ class MetricsFileManager:
         """Add or update metrics for a file at a specific commit date."""
         self.metrics.setdefault(commit_date, {})[file_path] = metrics_data
 
-    def update_commit_metrics(self, commit_sha: str, commit_date: str, metrics_data: Dict) -> None:
+    def update_commit_metrics(self, commit_sha: str, commit_date: str, metrics_data: Dict, versions: Optional[Dict] = None) -> None:
         """Add or update metrics for a commit (new commit-based structure)."""
         self.metrics[commit_sha] = {
             "date": commit_date,
             "metrics": metrics_data
         }
+        if versions is not None:
+            # Analyzer version of every sub-metric, used to find results that need recomputing
+            self.metrics[commit_sha]["versions"] = dict(versions)
+
+    def get_commit_versions(self, commit_sha: str) -> Dict:
+        """Return the sub-metric versions a commit was calculated with."""
+        commit_data = self.metrics.get(commit_sha, {})
+        if "versions" in commit_data:
+            return commit_data["versions"]
+        # Data stored before versions existed was calculated with version 1 of whatever it contains
+        versions = {}
+        for file_metrics in commit_data.get("metrics", {}).values():
+            if isinstance(file_metrics, dict):
+                for name in file_metrics:
+                    versions[name] = 1
+        return versions
+
+    def update_commit_versions(self, commit_sha: str, versions: Dict) -> None:
+        """Record that some sub-metrics of a commit were recalculated with new versions."""
+        if commit_sha in self.metrics:
+            stored_versions = dict(self.get_commit_versions(commit_sha))
+            stored_versions.update(versions)
+            self.metrics[commit_sha]["versions"] = stored_versions
+
+    def get_commit_shas(self) -> list:
+        """All commits with stored metrics, in stored order."""
+        return [key for key, value in self.metrics.items()
+                if key != "branch_info" and isinstance(value, dict) and "metrics" in value]
 
     def update_branch_info(self, commit_sha: str, branch_info: Dict) -> None:
         """Track branch-level commit info."""
@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+class MetricsFileEntry:
+    """
+    Contents of one metrics file. A load is only requested by MetricsFileManager.load_lazily and runs
+    on the first access of the contents; managers sharing the entry load it once between them.
+    """
+    def __init__(self):
+        self.metrics: Dict = {}
+        # "unloaded" (nothing requested), "pending" (loads on first access) or "loaded"
+        self.state = "unloaded"
+        self.loader: Optional[Callable[[], None]] = None
+        self.loading = False
+        self.lock = threading.RLock()
+
+    def request_load(self, loader: Callable[[], None]) -> None:
+        """Load with loader on first access, unless the contents were already loaded or set."""
+        with self.lock:
+            if self.state == "unloaded":
+                self.state = "pending"
+                self.loader = loader
+
+    def get_metrics(self) -> Dict:
+        if self.state == "pending":
+            with self.lock:
+                # The loader itself reads the contents it is building
+                if self.state == "pending" and not self.loading:
+                    self.loading = True
+                    try:
+                        self.loader()
+                    finally:
+                        self.loading = False
+                        self.loader = None
+                        self.state = "loaded"
+        return self.metrics
+
+    def set_metrics(self, metrics: Dict) -> None:
+        """Replace the contents; a pending load is dropped unless this is the load itself."""
+        with self.lock:
+            self.metrics = metrics
+            if not self.loading:
+                self.loader = None
+                self.state = "loaded"
+
+class MetricsFileStore:
+    """
+    Metrics files loaded at most once and shared by every MetricsFileManager of the same file (the
+    same local path and branch), e.g. the managers of the PRs of one sweep that come from the same
+    branch. Contents are held until the store is dropped and aren't reloaded, so a store should only
+    live for one run (a repository of a scheduling cycle, a PR sweep): between runs other processes
+    may save newer values, which stale contents would overwrite when merged into the file.
+    """
+    def __init__(self):
+        self.entries: Dict[Tuple, MetricsFileEntry] = {}
+        self.lock = threading.Lock()
+
+    def get_entry(self, key: Tuple) -> MetricsFileEntry:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = MetricsFileEntry()
+            return entry
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            entries = list(self.entries.values())
+        return {"files": len(entries), "loaded": sum(entry.state == "loaded" for entry in entries)}
@@ -0,0 +1,89 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+from MetricsClasses.SymbolIndex import SymbolIndex, symbol_index_version
+
+class ProjectMetrics:
+    """
+    Project level Fan in, Fan out and CBO of a branch, kept up to date commit by commit with a
+    SymbolIndex. Each commit only updates the modules it changed, and only the modules whose
+    metrics can have changed are recalculated; the rest are carried forward.
+    The index is saved next to the watermark, so the next run continues from its head instead of
+    rebuilding it from the whole tree.
+    """
+    def __init__(self, repo_name: str, branch_name: str, output_dir: str = "metrics"):
+        self.index = SymbolIndex()
+        self.head = None      # Commit the index describes
+        self.metrics = {}     # path -> project metrics of the module at head
+        file_name = branch_name.replace('/', '_') + "_symbol_index.json"
+        self.file_path = Path(output_dir) / repo_name.replace("/", "_") / file_name
+        self.dirty_modules = 0
+
+    def apply(self, commit_sha: str, dropped: Iterable[str], changed: Dict[str, str],
+              get_symbols: Callable[[str], Optional[Dict]]) -> Dict[str, Dict]:
+        """
+        Move the index from the parent of a commit to the commit: drop the paths it removed or
+        modified and add the changed files ({path: blob SHA}). Files without a summary (their fetch
+        failed) are left out. Returns the project metrics of every module, in path order.
+        """
+        summaries = {}
+        for path, blob_sha in changed.items():
+            symbols = get_symbols(blob_sha)
+            if symbols is not None:
+                summaries[path] = (blob_sha, symbols)
+        removed = [path for path in dropped if path not in summaries]
+        dirty = self.index.update(removed, summaries)
+        for path in removed:
+            self.metrics.pop(path, None)
+        for path in dirty:
+            self.metrics[path] = self.index.get_module_metrics(path)
+        self.dirty_modules += len(dirty)
+        self.head = commit_sha
+        return {path: self.metrics[path] for path in sorted(self.metrics)}
+
+    def rebuild(self, commit_sha: str, files: Dict[str, str],
+                get_symbols: Callable[[str], Optional[Dict]]) -> Dict[str, Dict]:
+        """Build the index from the whole tree of a commit ({path: blob SHA}) and return apply's result."""
+        self.index = SymbolIndex()
+        self.metrics = {}
+        return self.apply(commit_sha, [], files, get_symbols)
+
+    def get_stats(self) -> Dict:
+        return {**self.index.get_stats(), "dirty_modules": self.dirty_modules, "version": symbol_index_version}
+
+    def load(self) -> None:
+        """Load the index saved by an earlier run, if it was built with the current summaries."""
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") != symbol_index_version:
+                return
+            self.index = SymbolIndex.from_dict(data["modules"])
+            self.metrics = {path: self.index.get_module_metrics(path) for path in self.index.modules}
+            self.head = data["head"]
+        except Exception as e:
+            print(f"Error loading symbol index {self.file_path}: {e}")
+            self.index = SymbolIndex()
+            self.metrics = {}
+            self.head = None
+
+    def save(self) -> None:
+        if self.head is None:
+            return
+        try:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "head": self.head,
+                    "version": symbol_index_version,
+                    "updated": datetime.now().isoformat(),
+                    "modules": self.index.to_dict()
+                }, f)
+        except Exception as e:
+            print(f"Error saving symbol index {self.file_path}: {e}")
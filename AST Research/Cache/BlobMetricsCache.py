@@ -0,0 +1,186 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from MetricsClasses.MetricsController import get_analyzer_version, parse_metric_selection, selected_metric_types
+from MetricsClasses.MetricsController import metric_selection_key
+from MetricsClasses.TokenMetrics import token_metrics_version
+from MetricsClasses.SymbolIndex import symbol_index_version
+from Cache.SQLiteMetricsCache import SQLiteMetricsCache
+
+class BlobMetricsCache:
+    """
+    In-memory cache from git blob SHA to the metrics calculated for that blob.
+    Blobs are content addressed, so a file that did not change between commits keeps its
+    SHA and its cached metrics are always valid.
+    An optional SQLiteMetricsCache store backs the in-memory entries, so results survive
+    restarts and are shared with the other servers and scripts.
+    halstead_scopes and metrics (the metric selection) must match the MetricsExecutor's, so
+    results with and without the per function/class Halstead scopes, or with different
+    sub-metrics, are stored under different versions.
+    Blobs that can't be parsed or analyzed are kept in a negative cache with their error and
+    tokenizer-only metrics, so they aren't fetched and parsed again. Failures are only valid for
+    the Python version whose parser rejected the blob and the analyzer versions that failed on it.
+    The symbol summaries of the SymbolIndex (see collect_symbols) are cached per blob as well,
+    stored as their own "Symbols" metric type.
+    With a store, the in-memory entries are only a front cache of the most recently used blobs
+    (max_entries of each kind), so a long backfill doesn't hold every blob it has seen in memory.
+    Without one they are the only copy and are kept for the cache's lifetime.
+    """
+    def __init__(self, store: Optional[SQLiteMetricsCache] = None, halstead_scopes: bool = False, metrics=None,
+                 max_entries: int = 4096):
+        # blob SHA -> metrics, least recently used first
+        self.entries: Dict[str, Dict] = OrderedDict()
+        self.store = store
+        self.max_entries = max_entries if store is not None else None
+        self.halstead_scopes = halstead_scopes
+        self.selection = parse_metric_selection(metrics)
+        # blob SHA -> {"error": {...}, "metrics": tokenizer-only metrics}
+        self.failures: Dict[str, Dict] = OrderedDict()
+        analyzers = ";".join(get_analyzer_version(metric_type, halstead_scopes, self.selection)
+                             for metric_type in selected_metric_types(self.selection))
+        self.failure_version = (f"Python:{sys.version_info[0]}.{sys.version_info[1]},Tokens:{token_metrics_version},"
+                                f"Selection:{metric_selection_key(self.selection)},Analyzers:{analyzers}")
+        # blob SHA -> collect_symbols summary
+        self.symbols: Dict[str, Dict] = OrderedDict()
+        self.symbols_version = f"Symbols:{symbol_index_version}"
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.failure_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _recall(self, entries: OrderedDict, blob_sha: str) -> Optional[Dict]:
+        """Look a blob up in one of the in-memory caches, marking it recently used (holding self.lock)."""
+        value = entries.get(blob_sha)
+        if value is not None:
+            entries.move_to_end(blob_sha)
+        return value
+
+    def _remember(self, entries: OrderedDict, blob_sha: str, value: Dict) -> None:
+        """Add a blob to one of the in-memory caches, dropping the least recently used beyond max_entries (holding self.lock)."""
+        entries[blob_sha] = value
+        entries.move_to_end(blob_sha)
+        if self.max_entries is not None:
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, blob_sha: str) -> Optional[Dict]:
+        """
+        Return the cached metrics for a blob (the tokenizer-only ones of a blob that failed),
+        or None (counted as a miss).
+        """
+        with self.lock:
+            metrics = self._recall(self.entries, blob_sha)
+            if metrics is not None:
+                self.hits += 1
+                return metrics
+            failure = self._recall(self.failures, blob_sha)
+            if failure is not None:
+                self.hits += 1
+                self.failure_hits += 1
+                return failure["metrics"]
+
+        if self.store is not None:
+            metrics = {}
+            for metric_type in selected_metric_types(self.selection):
+                type_metrics = self.store.get(blob_sha, metric_type,
+                                              get_analyzer_version(metric_type, self.halstead_scopes, self.selection))
+                if type_metrics is None:
+                    break
+                metrics[metric_type] = type_metrics
+            else:
+                with self.lock:
+                    self._remember(self.entries, blob_sha, metrics)
+                    self.hits += 1
+                    self.store_hits += 1
+                return metrics
+
+            failure = self.store.get_failure(blob_sha, self.failure_version)
+            if failure is not None:
+                with self.lock:
+                    self._remember(self.failures, blob_sha, failure)
+                    self.hits += 1
+                    self.store_hits += 1
+                    self.failure_hits += 1
+                return failure["metrics"]
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, blob_sha: str, metrics: Dict) -> None:
+        """Remember the metrics calculated for a blob."""
+        with self.lock:
+            self._remember(self.entries, blob_sha, metrics)
+        if self.store is not None:
+            for metric_type, type_metrics in metrics.items():
+                self.store.put(blob_sha, metric_type,
+                               get_analyzer_version(metric_type, self.halstead_scopes, self.selection), type_metrics)
+
+    def put_failure(self, blob_sha: str, error: Dict, metrics: Dict) -> None:
+        """Remember that a blob can't be parsed or analyzed, with the error and the tokenizer-only metrics used instead."""
+        failure = {"error": error, "metrics": metrics}
+        with self.lock:
+            self._remember(self.failures, blob_sha, failure)
+        if self.store is not None:
+            self.store.put_failure(blob_sha, self.failure_version, error, metrics)
+
+    def put_result(self, blob_sha: str, file_metrics: Dict) -> None:
+        """Cache an analyze_file result: metrics, or a failure with its tokenizer-only metrics."""
+        if "error" not in file_metrics:
+            self.put(blob_sha, file_metrics)
+        elif "degraded" in file_metrics:
+            self.put_failure(blob_sha, file_metrics["error"], file_metrics["degraded"])
+
+    def get_symbols(self, blob_sha: str) -> Optional[Dict]:
+        """The symbol summary of a blob, or None if it wasn't collected (not counted in the hit rate)."""
+        with self.lock:
+            symbols = self._recall(self.symbols, blob_sha)
+        if symbols is None and self.store is not None:
+            symbols = self.store.get(blob_sha, "Symbols", self.symbols_version)
+            if symbols is not None:
+                with self.lock:
+                    self._remember(self.symbols, blob_sha, symbols)
+        return symbols
+
+    def put_symbols(self, blob_sha: str, symbols: Dict) -> None:
+        with self.lock:
+            self._remember(self.symbols, blob_sha, symbols)
+        if self.store is not None:
+            self.store.put(blob_sha, "Symbols", self.symbols_version, symbols)
+
+    def get_failure(self, blob_sha: str) -> Optional[Dict]:
+        """The error and tokenizer-only metrics of a blob known to fail, or None."""
+        with self.lock:
+            failure = self._recall(self.failures, blob_sha)
+        if failure is None and self.store is not None:
+            failure = self.store.get_failure(blob_sha, self.failure_version)
+        return failure
+
+    def reset_stats(self) -> None:
+        """Start a new run of hit/miss counting."""
+        with self.lock:
+            self.hits = 0
+            self.store_hits = 0
+            self.failure_hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "store_hits": self.store_hits,
+                "failure_hits": self.failure_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "failures": len(self.failures),
+                "symbols": len(self.symbols),
+                "evictions": self.evictions
+            }
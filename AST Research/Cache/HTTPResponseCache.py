@@ -0,0 +1,237 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+from typing import Dict, Optional, Tuple
+
+# Headers describing the token's rate limit at the time of a response; replaying them would be misleading
+rate_limit_headers = ("x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-reset",
+                      "x-ratelimit-used", "x-ratelimit-resource")
+# Headers describing how a body was sent rather than the body; stored bodies are replayed decoded
+transfer_headers = ("content-length", "content-encoding", "transfer-encoding", "connection", "keep-alive")
+
+class HTTPResponseCache:
+    """
+    Persistent cache of GitHub API GET responses in a local SQLite file, keyed by URL, media type
+    and token. Responses still fresh by their Cache-Control max-age are replayed without a request
+    (hits). Older ones are revalidated with If-None-Match / If-Modified-Since, and a
+    304 Not Modified replays the stored body (revalidations). GitHub doesn't count 304s against the
+    rate limit. Everything else is a miss.
+    Writes (PUT, POST, PATCH, DELETE) drop the cached responses of their path. The cache is bounded
+    by the size of the stored bodies and evicts the least recently used ones.
+    """
+    def __init__(self, path: str = "github_http_cache.sqlite", max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.bytes_since_eviction = 0
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS http_responses (
+                key TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        connection.execute("CREATE INDEX IF NOT EXISTS http_responses_path ON http_responses (path)")
+        connection.execute("CREATE INDEX IF NOT EXISTS http_responses_last_access ON http_responses (last_access)")
+        connection.commit()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["HTTPResponseCache"]:
+        """Open the cache named by the 'http_cache_path' and 'http_cache_max_mb' config keys; None if the path is empty."""
+        path = config.get("http_cache_path", "github_http_cache.sqlite")
+        if not path:
+            return None
+        return cls(path=path, max_bytes=int(config.get("http_cache_max_mb", 64) * 1024 * 1024))
+
+    def _connection(self) -> sqlite3.Connection:
+        """sqlite3 connections can't be shared between threads, so each thread gets its own."""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    @staticmethod
+    def get_key(url: str, headers: Dict[str, str]) -> str:
+        """Responses differ by media type and token; only a hash of the token is stored."""
+        headers = {name.lower(): value for name, value in headers.items()}
+        token = hashlib.sha256(headers.get("authorization", "").encode("utf-8")).hexdigest()[:16]
+        return f"{url}\n{headers.get('accept', '')}\n{token}"
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """The stored response ({"etag", "last_modified", "headers", "body", "fresh"}), or None."""
+        row = self._connection().execute(
+            "SELECT etag, last_modified, headers, body, expires FROM http_responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "headers": json.loads(row[2]), "body": bytes(row[3]),
+                "fresh": row[4] > time.time()}
+
+    @staticmethod
+    def get_conditional_headers(entry: Optional[Dict]) -> Dict[str, str]:
+        """Headers that make a GET of a stored response conditional."""
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def replay(self, key: str, entry: Dict, response_headers: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, str], bytes]:
+        """
+        Headers and body to answer a request with from a stored response: a fresh hit, or a 304 whose
+        headers (e.g. the current rate limit) replace the stored ones. Counts the hit or revalidation.
+        """
+        headers = {name: value for name, value in entry["headers"].items() if name not in rate_limit_headers}
+        if response_headers is None:
+            with self.lock:
+                self.hits += 1
+            self._touch(key, None)
+            return headers, entry["body"]
+        headers.update({name.lower(): value for name, value in response_headers.items()
+                        if name.lower() not in transfer_headers})
+        with self.lock:
+            self.revalidations += 1
+        self._touch(key, self.get_expires(headers))
+        return headers, entry["body"]
+
+    def _touch(self, key: str, expires: Optional[float]) -> None:
+        connection = self._connection()
+        if expires is None:
+            connection.execute("UPDATE http_responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        else:
+            connection.execute("UPDATE http_responses SET last_access = ?, expires = ? WHERE key = ?",
+                               (time.time(), expires, key))
+        connection.commit()
+
+    @staticmethod
+    def get_expires(headers: Dict[str, str]) -> float:
+        """When a response stops being fresh, from its Cache-Control max-age (now if there is none)."""
+        cache_control = headers.get("cache-control", "")
+        match = re.search(r"max-age=(\d+)", cache_control)
+        if match is None or "no-cache" in cache_control:
+            return time.time()
+        return time.time() + int(match.group(1))
+
+    def store(self, key: str, url: str, headers: Dict[str, str], body: bytes) -> None:
+        """
+        Count a miss, and keep a 200 response that can be revalidated (it has an ETag or Last-Modified)
+        unless it says no-store. Bodies larger than a tenth of the cache are not kept.
+        """
+        with self.lock:
+            self.misses += 1
+        headers = {name.lower(): value for name, value in headers.items()}
+        etag, last_modified = headers.get("etag"), headers.get("last-modified")
+        if not (etag or last_modified) or "no-store" in headers.get("cache-control", "") or len(body) > self.max_bytes // 10:
+            return
+        headers = {name: value for name, value in headers.items()
+                   if name not in rate_limit_headers and name not in transfer_headers}
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO http_responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, urllib.parse.urlsplit(url).path, etag, last_modified, json.dumps(headers), body, len(body),
+             self.get_expires(headers), time.time()))
+        connection.commit()
+        with self.lock:
+            self.bytes_since_eviction += len(body)
+            # Checking the total on every insert is wasteful; do it every ~5% of the budget
+            check_eviction = self.bytes_since_eviction > self.max_bytes // 20
+            if check_eviction:
+                self.bytes_since_eviction = 0
+        if check_eviction:
+            self.evict()
+
+    def invalidate(self, url: str) -> None:
+        """Drop every stored response of a path (any query, media type or token) after a write to it."""
+        connection = self._connection()
+        connection.execute("DELETE FROM http_responses WHERE path = ?", (urllib.parse.urlsplit(url).path,))
+        connection.commit()
+
+    def evict(self) -> int:
+        """Delete least recently used responses until the cache fits in max_bytes. Returns the number deleted."""
+        connection = self._connection()
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM http_responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        # Free a little more than needed so the next inserts don't trigger another eviction right away
+        to_free = total - int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        for key, size in connection.execute("SELECT key, size FROM http_responses ORDER BY last_access"):
+            if freed >= to_free:
+                break
+            doomed.append((key,))
+            freed += size
+        connection.executemany("DELETE FROM http_responses WHERE key = ?", doomed)
+        connection.commit()
+        print(f"Evicted {len(doomed)} responses ({freed} bytes) from {self.path}")
+        return len(doomed)
+
+    def get_stats(self) -> Dict:
+        entries, total = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM http_responses").fetchone()
+        with self.lock:
+            hits, revalidations, misses = self.hits, self.revalidations, self.misses
+        requests = hits + revalidations + misses
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "stored_bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "revalidations": revalidations,
+            "misses": misses,
+            # Requests answered from the cache, with or without asking GitHub
+            "hit_rate": (hits + revalidations) / requests if requests else 0.0
+        }
+
+    def format_stats(self) -> str:
+        stats = self.get_stats()
+        return (f"GitHub HTTP cache: {stats['hits']} hits, {stats['revalidations']} revalidated (304), "
+                f"{stats['misses']} misses ({stats['hit_rate']:.1%} served from cache); "
+                f"{stats['entries']} responses, {stats['stored_bytes'] / 1024 / 1024:.2f} MB stored")
+
+    def close(self) -> None:
+        """Close this thread's connection."""
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+http_cache = None
+http_cache_lock = threading.Lock()
+
+def get_http_cache() -> Optional[HTTPResponseCache]:
+    """The process-wide cache, or None unless configure_http_cache opened one."""
+    with http_cache_lock:
+        return http_cache
+
+def configure_http_cache(config: Dict) -> Optional[HTTPResponseCache]:
+    """(Re)open the process-wide cache from the 'http_cache_path' and 'http_cache_max_mb' config keys."""
+    global http_cache
+    with http_cache_lock:
+        if http_cache is not None:
+            http_cache.close()
+        http_cache = HTTPResponseCache.from_config(config)
+        return http_cache
@@ -0,0 +1,261 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# Hits whose last_access update is written together, in one transaction ...
+touch_batch_size = 512
+# ... or at least this often (seconds), so an LRU order a few seconds old is never a problem
+touch_interval = 30
+# Stored bytes of a parse failure, computed so existing cache files need no size column
+failure_size = "LENGTH(error) + LENGTH(metrics)"
+
+class SQLiteMetricsCache:
+    """
+    Persistent (blob SHA, metric type, analyzer version) -> metrics cache in a local SQLite file.
+    The branch server, the PR server and the Testing Files scripts can all open the same file:
+    WAL mode lets readers run while another process writes. The cache is bounded by the size of
+    the stored metrics and evicts the least recently used entries. Hits don't commit their access
+    time one by one: the updates are batched and written with the next put, eviction or close.
+    Blobs that failed to parse are kept in a separate table, with their error class and the
+    tokenizer-only metrics calculated instead; they count towards the bound and are evicted with
+    the metrics.
+    """
+    def __init__(self, path: str = "metrics_cache.sqlite", max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_since_eviction = 0
+        # Access times of hits not written yet: key -> time
+        self.touched = {}
+        self.touched_failures = {}
+        self.last_touch_flush = time.time()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS metrics_cache (
+                blob_sha TEXT NOT NULL,
+                metric_type TEXT NOT NULL,
+                analyzer_version TEXT NOT NULL,
+                metrics TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (blob_sha, metric_type, analyzer_version)
+            )""")
+        connection.execute("CREATE INDEX IF NOT EXISTS metrics_cache_last_access ON metrics_cache (last_access)")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS parse_failures (
+                blob_sha TEXT NOT NULL,
+                failure_version TEXT NOT NULL,
+                error_type TEXT NOT NULL,
+                error TEXT NOT NULL,
+                metrics TEXT NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (blob_sha, failure_version)
+            )""")
+        connection.commit()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "SQLiteMetricsCache":
+        """Open the cache named by the 'cache_path' and 'cache_max_mb' config keys."""
+        return cls(path=config.get("cache_path", "metrics_cache.sqlite"),
+                   max_bytes=int(config.get("cache_max_mb", 512) * 1024 * 1024))
+
+    def _connection(self) -> sqlite3.Connection:
+        """sqlite3 connections can't be shared between threads, so each thread gets its own."""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def get(self, blob_sha: str, metric_type: str, analyzer_version: str) -> Optional[Dict]:
+        """Return the cached metrics, or None if this blob was never analyzed with this version."""
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT metrics FROM metrics_cache WHERE blob_sha = ? AND metric_type = ? AND analyzer_version = ?",
+            (blob_sha, metric_type, analyzer_version)).fetchone()
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.touched[(blob_sha, metric_type, analyzer_version)] = time.time()
+            flush = self._touches_due()
+        if flush:
+            self.flush_touches()
+        return json.loads(row[0])
+
+    def _touches_due(self) -> bool:
+        """Whether enough hits piled up, or long enough ago, to write their access times (holding self.lock)."""
+        pending = len(self.touched) + len(self.touched_failures)
+        return pending >= touch_batch_size or (pending and time.time() - self.last_touch_flush >= touch_interval)
+
+    def _write_touches(self, connection: sqlite3.Connection) -> None:
+        """Write the pending access times, in the caller's transaction."""
+        with self.lock:
+            touched, self.touched = self.touched, {}
+            touched_failures, self.touched_failures = self.touched_failures, {}
+            self.last_touch_flush = time.time()
+        if touched:
+            connection.executemany(
+                "UPDATE metrics_cache SET last_access = ? WHERE blob_sha = ? AND metric_type = ? AND analyzer_version = ?",
+                [(accessed, *key) for key, accessed in touched.items()])
+        if touched_failures:
+            connection.executemany(
+                "UPDATE parse_failures SET last_access = ? WHERE blob_sha = ? AND failure_version = ?",
+                [(accessed, *key) for key, accessed in touched_failures.items()])
+
+    def flush_touches(self) -> None:
+        """Write the access times of the hits since the last write."""
+        connection = self._connection()
+        self._write_touches(connection)
+        connection.commit()
+
+    def put(self, blob_sha: str, metric_type: str, analyzer_version: str, metrics: Dict) -> None:
+        """Store the metrics of a blob, evicting old entries once the size bound is exceeded."""
+        data = json.dumps(metrics)
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO metrics_cache VALUES (?, ?, ?, ?, ?, ?)",
+            (blob_sha, metric_type, analyzer_version, data, len(data), time.time()))
+        self._write_touches(connection)
+        connection.commit()
+        self._count_written(len(data))
+
+    def _count_written(self, size: int) -> None:
+        """Add stored bytes, and evict once enough were stored since the last check."""
+        with self.lock:
+            self.bytes_since_eviction += size
+            # Checking the total on every insert is wasteful; do it every ~5% of the budget
+            check_eviction = self.bytes_since_eviction > self.max_bytes // 20
+            if check_eviction:
+                self.bytes_since_eviction = 0
+        if check_eviction:
+            self.evict()
+
+    def get_failure(self, blob_sha: str, failure_version: str) -> Optional[Dict]:
+        """Return {"error", "metrics"} of a blob that failed to parse, or None."""
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT error, metrics FROM parse_failures WHERE blob_sha = ? AND failure_version = ?",
+            (blob_sha, failure_version)).fetchone()
+        if row is None:
+            return None
+        with self.lock:
+            self.touched_failures[(blob_sha, failure_version)] = time.time()
+            flush = self._touches_due()
+        if flush:
+            self.flush_touches()
+        return {"error": json.loads(row[0]), "metrics": json.loads(row[1])}
+
+    def put_failure(self, blob_sha: str, failure_version: str, error: Dict, metrics: Dict) -> None:
+        """Record that a blob failed to parse, with the error and the metrics used instead."""
+        error_data, data = json.dumps(error), json.dumps(metrics)
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO parse_failures VALUES (?, ?, ?, ?, ?, ?)",
+            (blob_sha, failure_version, error.get("type", ""), error_data, data, time.time()))
+        self._write_touches(connection)
+        connection.commit()
+        self._count_written(len(error_data) + len(data))
+
+    def evict(self) -> int:
+        """
+        Delete least recently used entries and parse failures until the cache fits in max_bytes.
+        Returns the number deleted.
+        """
+        # Entries hit since the last write must not look unused
+        self.flush_touches()
+        connection = self._connection()
+        total = connection.execute(
+            f"SELECT (SELECT COALESCE(SUM(size), 0) FROM metrics_cache) + "
+            f"(SELECT COALESCE(SUM({failure_size}), 0) FROM parse_failures)").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        # Free a little more than needed so the next inserts don't trigger another eviction right away
+        to_free = total - int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        doomed_failures = []
+        for is_failure, blob_sha, metric_type, analyzer_version, size, _ in connection.execute(f"""
+                SELECT 0, blob_sha, metric_type, analyzer_version, size, last_access FROM metrics_cache
+                UNION ALL
+                SELECT 1, blob_sha, NULL, failure_version, {failure_size}, last_access FROM parse_failures
+                ORDER BY last_access"""):
+            if freed >= to_free:
+                break
+            if is_failure:
+                doomed_failures.append((blob_sha, analyzer_version))
+            else:
+                doomed.append((blob_sha, metric_type, analyzer_version))
+            freed += size
+        connection.executemany(
+            "DELETE FROM metrics_cache WHERE blob_sha = ? AND metric_type = ? AND analyzer_version = ?", doomed)
+        connection.executemany("DELETE FROM parse_failures WHERE blob_sha = ? AND failure_version = ?", doomed_failures)
+        connection.commit()
+        print(f"Evicted {len(doomed)} entries and {len(doomed_failures)} parse failures ({freed} bytes) from {self.path}")
+        return len(doomed) + len(doomed_failures)
+
+    def get_stats(self) -> Dict:
+        connection = self._connection()
+        entries, total = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM metrics_cache").fetchone()
+        per_type = {metric_type: count for metric_type, count in connection.execute(
+            "SELECT metric_type, COUNT(*) FROM metrics_cache GROUP BY metric_type")}
+        failures = {error_type: count for error_type, count in connection.execute(
+            "SELECT error_type, COUNT(*) FROM parse_failures GROUP BY error_type")}
+        failure_bytes = connection.execute(f"SELECT COALESCE(SUM({failure_size}), 0) FROM parse_failures").fetchone()[0]
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "entries_per_metric_type": per_type,
+            "stored_bytes": total,
+            "max_bytes": self.max_bytes,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "parse_failures": sum(failures.values()),
+            "parse_failure_bytes": failure_bytes,
+            "parse_failures_per_error_type": failures
+        }
+
+    def format_stats(self) -> str:
+        """Human readable report used by --cache-stats."""
+        stats = self.get_stats()
+        lines = [
+            f"Metrics cache: {stats['path']}",
+            f"  Entries: {stats['entries']}",
+        ]
+        for metric_type, count in sorted(stats["entries_per_metric_type"].items()):
+            lines.append(f"    {metric_type}: {count}")
+        lines.append(f"  Stored metrics: {stats['stored_bytes'] / 1024 / 1024:.2f} MB "
+                     f"of {stats['max_bytes'] / 1024 / 1024:.0f} MB "
+                     f"(file {stats['file_bytes'] / 1024 / 1024:.2f} MB)")
+        lines.append(f"  Parse failures: {stats['parse_failures']} ({stats['parse_failure_bytes'] / 1024 / 1024:.2f} MB)")
+        for error_type, count in sorted(stats["parse_failures_per_error_type"].items()):
+            lines.append(f"    {error_type}: {count}")
+        lines.append(f"  This process: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)")
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        """Write the pending access times and close this thread's connection."""
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            self._write_touches(connection)
+            connection.commit()
+            connection.close()
+            self.local.connection = None
@@ -0,0 +1,428 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import ast
+from collections import defaultdict
+from HalsteadMetricsClass import calculate_halstead_metrics, operator_table, docstring_node, HalsteadCounts
+from TraditionalMetricsClass import (calculate_loc, calculate_fan_in_out, calculate_cc,
+                                     calculate_length_of_identifier, classify_lines, line_metrics_names)
+from OOMetricsClass import calculate_wmc, calculate_noc_dit, calculate_cbo
+
+#Single pass replacement for the ten visitor walks the HalsteadMetrics, TraditionalMetrics and
+#OOMetrics classes used to make. Every accumulator below mirrors one of those visitors, and the walk
+#keeps their preorder/field order so dict insertion order (and therefore the JSON) is unchanged.
+#The walk uses an explicit stack instead of recursion, so deeply nested generated code (e.g. a
+#long chain of + in one expression) can't hit the recursion limit.
+
+#ComplexityVisitor: node type -> decision points added to the enclosing method
+complexity_table = {}
+for _name in ["If", "IfExp", "For", "While", "AsyncFor", "Assert", "Try", "TryStar",
+              "ExceptHandler", "Match", "match_case", "With"]:
+    if hasattr(ast, _name):
+        complexity_table[getattr(ast, _name)] = 1
+complexity_table.update({
+    ast.comprehension: lambda node: 1 + len(node.ifs),
+    ast.BoolOp: lambda node: len(node.values) - 1,
+})
+
+
+class FusedMetricsAnalyzer(ast.NodeVisitor):
+    """Visit every node of the tree once and compute the Halstead, Traditional and OO metrics."""
+    def __init__(self, tree, source=None, halstead_scopes=False, selection=None):
+        self.tree = tree
+        #Source text of the tree, for the tokenize based line metrics (left out without it)
+        self.source = source
+        #metric type -> sub-metrics to compute (see parse_metric_selection), None for everything.
+        #Accumulators nothing selected depends on are switched off below.
+        #halstead_scopes also computes Halstead metrics per function and per class ("Scopes")
+        self.selection = selection
+        self.count_halstead = self._selected("Halstead")
+        self.count_code_lines = self._selected("Traditional", "LOC")
+        self.count_calls = self._selected("Traditional", "Fan in", "Fan out")
+        self.count_complexity = self._selected("Traditional", "CC")
+        self.count_identifiers = self._selected("Traditional", "Length of Identifier")
+        self.count_lines = source is not None and self._selected("Traditional", *line_metrics_names)
+        self.count_class_methods = self._selected("OO", "WMC")
+        self.count_inheritance = self._selected("OO", "NOC", "DIT")
+        self.count_coupling = self._selected("OO", "CBO")
+        self.halstead_scopes = halstead_scopes and self.count_halstead
+        self.operator_table = operator_table if self.count_halstead else {}
+        self.complexity_table = complexity_table if self.count_complexity else {}
+        #Halstead (OperatorCollector, OperandCollector)
+        self.operators = set()
+        self.total_operators = 0
+        self.operands = set()
+        self.total_operands = 0
+        self.function_scopes = {}
+        self.class_scopes = {}
+        self.scope_stack = []  # HalsteadCounts of the enclosing functions/classes
+        #Traditional (LOC, FunctionCallVisitor, ComplexityVisitor, IdentifierVisitor)
+        self.code_lines = set()
+        self.docstring_spans = []
+        self.callers = defaultdict(set)   # key: callee, value: set of callers
+        self.callees = defaultdict(set)   # key: caller, value: set of callees
+        self.class_bases = {}
+        self.methods = defaultdict(int)
+        self.identifier_length = 0
+        self.identifier_occurrences = 0
+        #OO (MethodCollector, InheritanceVisitor, CouplingCollector)
+        self.class_methods = defaultdict(list)
+        self.inheritance = defaultdict(list)  # parent -> [children]
+        self.parent_of = {}  # child -> parent
+        self.classes = set()
+        self.class_references = defaultdict(set)
+        self.all_classes = set()
+        #Scope state. current_class/current_function are restored on exit like the Traditional
+        #and Halstead visitors; oo_class is reset to None on exit like MethodCollector/CouplingCollector
+        self.current_class = None
+        self.current_function = None
+        self.oo_class = None
+        self.count_operands = self.count_halstead
+        self.in_function_args = False
+        #Walk stack: (node, count_operands, in_function_args) frames to visit, and exit hooks that
+        #restore the scope state once every node of a class/function was visited
+        self.stack = []
+        self.metrics = []
+
+    def calculate_metrics(self):
+        """[Halstead, Traditional, OO] metrics; unselected metric types are None."""
+        self.visit(self.tree)
+        self.metrics = [
+            self._select("Halstead", self.__halstead_metrics),
+            self._select("Traditional", self.__traditional_metrics),
+            self._select("OO", self.__oo_metrics)
+        ]
+        return self.metrics
+
+    def _selected(self, metric_type, *names):
+        """Whether the metric type (or any of the named sub-metrics of it) has to be computed."""
+        if self.selection is None:
+            return True
+        if metric_type not in self.selection:
+            return False
+        return not names or any(name in self.selection[metric_type] for name in names)
+
+    def _select(self, metric_type, calculate):
+        if not self._selected(metric_type):
+            return None
+        metrics = calculate()
+        if self.selection is None:
+            return metrics
+        # "Scopes" is extra output of the Halstead walk, not a sub-metric that can be selected
+        return {name: value for name, value in metrics.items()
+                if name in self.selection[metric_type] or name == "Scopes"}
+
+    def get_metrics(self):
+        return self.metrics
+
+    def __halstead_metrics(self):
+        metrics = calculate_halstead_metrics(len(self.operators), self.total_operators,
+                                             len(self.operands), self.total_operands)
+        if self.halstead_scopes:
+            metrics["Scopes"] = {
+                "Functions": {name: scope.calculate_metrics() for name, scope in self.function_scopes.items()},
+                "Classes": {name: scope.calculate_metrics() for name, scope in self.class_scopes.items()}
+            }
+        return metrics
+
+    def __traditional_metrics(self):
+        fan_in, fan_out = calculate_fan_in_out(self.callers, self.callees)
+        metrics = {
+            "LOC": calculate_loc(self.code_lines),
+            "Fan in": fan_in,
+            "Fan out": fan_out,
+            "CC": calculate_cc(self.methods),
+            "Length of Identifier": calculate_length_of_identifier(self.identifier_length, self.identifier_occurrences)
+        }
+        if self.count_lines:
+            metrics.update(classify_lines(self.source, self.docstring_spans))
+        return metrics
+
+    def __oo_metrics(self):
+        noc, dit = calculate_noc_dit(self.inheritance, self.parent_of, self.classes)
+        return {
+            "WMC": calculate_wmc(self.class_methods),
+            "NOC": noc,
+            "DIT": dit,
+            "CBO": calculate_cbo(self.class_references, self.all_classes)
+        }
+
+    def visit(self, node):
+        """Visit node and everything below it in preorder."""
+        self.stack.append((node, self.count_operands, self.in_function_args))
+        while self.stack:
+            frame = self.stack.pop()
+            if callable(frame):
+                frame()
+            else:
+                node, self.count_operands, self.in_function_args = frame
+                self._visit_node(node)
+
+    def _visit_node(self, node):
+        """Count one node and push its children; the visit_* methods only push, never recurse."""
+        node_type = node.__class__
+        if self.count_code_lines and hasattr(node, 'lineno'):
+            self.code_lines.add(node.lineno)
+        operator = self.operator_table.get(node_type)
+        if operator is not None:
+            if isinstance(operator, str):
+                self.operators.add(operator)
+                self.total_operators += 1
+                for scope in self.scope_stack:
+                    scope.add_operator(operator)
+            else:
+                for token in operator(node):
+                    self.operators.add(token)
+                    self.total_operators += 1
+                    for scope in self.scope_stack:
+                        scope.add_operator(token)
+        complexity = self.complexity_table.get(node_type)
+        if complexity is not None and self.current_function:
+            self.methods[self.current_function] += complexity if isinstance(complexity, int) else complexity(node)
+        getattr(self, 'visit_' + node_type.__name__, self.generic_visit)(node)
+
+    def generic_visit(self, node):
+        self._visit_fields(node)
+
+    def _visit_fields(self, node, operand_fields=None, docstring=None, argument_field=None):
+        """generic_visit, but only count operands below operand_fields and never in the docstring."""
+        frames = []
+        for field, value in ast.iter_fields(node):
+            field_operands = self.count_operands and (operand_fields is None or field in operand_fields)
+            in_function_args = self.in_function_args if argument_field is None else field == argument_field
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        frames.append((item, field_operands and item is not docstring, in_function_args))
+            elif isinstance(value, ast.AST):
+                frames.append((value, field_operands, in_function_args))
+        # Popped in reverse, so the children are visited in field order
+        self.stack.extend(reversed(frames))
+
+    def _docstring(self, node):
+        """docstring_node, remembering where the docstring is for the line metrics."""
+        docstring = docstring_node(node)
+        if docstring is not None:
+            self.docstring_spans.append((docstring.lineno, docstring.end_lineno))
+        return docstring
+
+    def _add_operand(self, operand):
+        self.operands.add(operand)
+        self.total_operands += 1
+        for scope in self.scope_stack:
+            scope.add_operand(operand)
+
+    def _enter_scope(self, scopes, name):
+        """Start counting into the Halstead scope of a function/class. Returns whether one was entered."""
+        if not self.halstead_scopes:
+            return False
+        scope = scopes.get(name)
+        if scope is None:
+            scope = scopes[name] = HalsteadCounts()
+        elif scope in self.scope_stack:
+            # Nested definition with the same name, already counting into this scope
+            return False
+        self.scope_stack.append(scope)
+        return True
+
+    def _increase_identifier(self, name):
+        if not self.count_identifiers:
+            return
+        self.identifier_length += len(name)
+        self.identifier_occurrences += 1
+
+    def visit_Module(self, node):
+        self._visit_fields(node, docstring=self._docstring(node))
+
+    def visit_ClassDef(self, node):
+        self._increase_identifier(node.name)
+        if self.count_calls:
+            self.class_bases[node.name] = [
+                base.id for base in node.bases if isinstance(base, ast.Name)
+            ]
+        if self.count_inheritance:
+            self.classes.add(node.name)
+        if self.count_coupling:
+            self.all_classes.add(node.name)
+        for base in node.bases:
+            if isinstance(base, ast.Name):
+                if self.count_inheritance:
+                    self.inheritance[base.id].append(node.name)
+                    self.parent_of[node.name] = base.id
+                if self.count_coupling:
+                    self.class_references[node.name].add(base.id)
+            elif isinstance(base, ast.Attribute):
+                if self.count_inheritance:
+                    parent_name = base.value.id + "." + base.attr
+                    self.inheritance[parent_name].append(node.name)
+                    self.parent_of[node.name] = parent_name
+                if self.count_coupling:
+                    base_name = self._get_full_name(base)
+                    if base_name:
+                        self.class_references[node.name].add(base_name)
+
+        old_class = self.current_class
+        self.current_class = node.name
+        self.oo_class = node.name
+        entered_scope = self._enter_scope(self.class_scopes, node.name)
+
+        def exit_class():
+            if entered_scope:
+                self.scope_stack.pop()
+            self.current_class = old_class
+            self.oo_class = None
+        self.stack.append(exit_class)
+        self._visit_fields(node, operand_fields=("bases", "decorator_list", "body"),
+                           docstring=self._docstring(node))
+
+    def visit_FunctionDef(self, node):
+        self._increase_identifier(node.name)
+        for arg in node.args.args:
+            self._increase_identifier(arg.arg)
+
+        function_name = f"{self.current_class}.{node.name}" if self.current_class else node.name
+        if self.count_calls:
+            self.callers.setdefault(function_name, set())
+            self.callees.setdefault(function_name, set())
+        if self.count_complexity and function_name not in self.methods:
+            self.methods[function_name] = 0
+
+        if self.count_class_methods and self.oo_class is not None:
+            self.class_methods[self.oo_class].append(node.name)
+        if self.count_coupling and self.oo_class:
+            for arg in node.args.args:
+                if arg.annotation:
+                    self._add_class_reference(self._extract_type_name(arg.annotation))
+            if node.returns:
+                self._add_class_reference(self._extract_type_name(node.returns))
+
+        old_function = self.current_function
+        self.current_function = function_name
+        entered_scope = self._enter_scope(self.function_scopes, function_name)
+
+        def exit_function():
+            if entered_scope:
+                self.scope_stack.pop()
+            self.current_function = old_function
+        self.stack.append(exit_function)
+        self._visit_fields(node, operand_fields=("args", "decorator_list", "returns", "body"),
+                           docstring=self._docstring(node), argument_field="args")
+
+    def visit_AsyncFunctionDef(self, node):
+        self._increase_identifier(node.name)
+        for arg in node.args.args:
+            self._increase_identifier(arg.arg)
+        function_name = f"{self.current_class}.{node.name}" if self.current_class else node.name
+        if self._enter_scope(self.function_scopes, function_name):
+            self.stack.append(self.scope_stack.pop)
+        self._visit_fields(node, docstring=self._docstring(node))
+
+    def visit_arguments(self, node):
+        #OperandCollector only looks inside the arguments of a FunctionDef
+        count_operands = self.count_operands
+        self.count_operands = count_operands and self.in_function_args
+        self.generic_visit(node)
+        self.count_operands = count_operands
+
+    def visit_arg(self, node):
+        if self.count_operands:
+            self._add_operand(node.arg)
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if self.count_calls and self.current_function:
+            callee = self._get_callee_name(node.func)
+            if callee and callee != "super":
+                self.callees[self.current_function].add(callee)
+                self.callers[callee].add(self.current_function)
+        if self.count_coupling and self.oo_class and isinstance(node.func, ast.Name):
+            # Only count if it's likely a class (starts with uppercase)
+            if node.func.id[0].isupper():
+                self.class_references[self.oo_class].add(node.func.id)
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        self._increase_identifier(node.attr)
+        count_operands = self.count_operands
+        if count_operands:
+            if isinstance(node.value, ast.Name):
+                if node.value.id == "self" and self.current_class:
+                    self._add_operand(f"{self.current_class}.{node.attr}")
+                else:
+                    self._add_operand(f"{node.value.id}.{node.attr}")
+                self.count_operands = False
+            else:
+                self._add_operand(node.attr)
+        self.generic_visit(node)
+        self.count_operands = count_operands
+
+    def visit_Name(self, node):
+        if node.id not in ['True', 'False', 'None']:
+            self._increase_identifier(node.id)
+        if self.count_operands:
+            self._add_operand(node.id)
+        self.generic_visit(node)
+
+    def visit_Constant(self, node):
+        if self.count_operands:
+            self._add_operand(node.value)
+        self.generic_visit(node)
+
+    def visit_JoinedStr(self, node):
+        count_operands = self.count_operands
+        if count_operands:
+            f_string_content = ""
+            for value in node.values:
+                if isinstance(value, ast.Constant):
+                    f_string_content += str(value.value)
+                elif isinstance(value, ast.FormattedValue):
+                    f_string_content += "{}"
+            self._add_operand(f_string_content)
+        self.stack.extend((value, count_operands and not isinstance(value, ast.Constant), self.in_function_args)
+                          for value in reversed(node.values))
+
+    def visit_AnnAssign(self, node):
+        if self.count_coupling and self.oo_class and node.annotation:
+            self._add_class_reference(self._extract_type_name(node.annotation))
+        self.generic_visit(node)
+
+    def _add_class_reference(self, class_name):
+        if class_name:
+            self.class_references[self.oo_class].add(class_name)
+
+    def _get_callee_name(self, node):
+        if isinstance(node, ast.Name):
+            return node.id
+        elif isinstance(node, ast.Attribute):
+            if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name) and node.value.func.id == "super":
+                # Handle super().method()
+                if self.current_class:
+                    bases = self.class_bases.get(self.current_class, [])
+                    if bases:
+                        return f"{bases[0]}.{node.attr}"  # Assume single inheritance
+            elif isinstance(node.value, ast.Name):
+                if node.value.id == "self":
+                    return f"{self.current_class}.{node.attr}" if self.current_class else node.attr
+                else:
+                    return f"{node.value.id}.{node.attr}"
+            elif isinstance(node.value, ast.Attribute):
+                return node.attr
+        return None
+
+    def _extract_type_name(self, annotation):
+        """Extract class name from type annotation"""
+        if isinstance(annotation, ast.Name):
+            return annotation.id
+        elif isinstance(annotation, ast.Attribute):
+            return self._get_full_name(annotation)
+        return None
+
+    def _get_full_name(self, node):
+        """Get full dotted name from ast.Attribute"""
+        attributes = []
+        while isinstance(node, ast.Attribute):
+            attributes.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return None
+        return ".".join([node.id] + attributes[::-1])
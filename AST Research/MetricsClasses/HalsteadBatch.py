@@ -0,0 +1,62 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import math
+import numpy as np
+from typing import Dict, Iterable, List
+from MetricsClasses.HalsteadMetricsClass import halstead_count_names, halstead_metrics_names
+
+def calculate_halstead_metrics_batch(counts) -> Dict[str, np.ndarray]:
+    """
+    Vectorized calculate_halstead_metrics for many files at once.
+
+    Args:
+        counts: (n1, N1, n2, N2) rows, one per file (anything np.asarray turns into an (rows, 4) array).
+
+    Returns:
+        Halstead metric name -> array with one value per row. Undefined values are NaN.
+    """
+    counts = np.asarray(counts, dtype=np.int64).reshape(-1, 4)
+    n1, N1, n2, N2 = counts.T
+    program_vocabulary = n1 + n2
+    program_length = N1 + N2
+    # log2/divide of the zero cases would warn; those entries are replaced with NaN anyway
+    with np.errstate(divide="ignore", invalid="ignore"):
+        estimated_program_length = np.where((n1 > 0) & (n2 > 0),
+                                            n1 * np.log2(n1) + n2 * np.log2(n2), np.nan)
+        volume = np.where(program_vocabulary > 0, program_length * np.log2(program_vocabulary), np.nan)
+        difficulty = np.where(n2 > 0, (n1 / 2) * (N2 / n2), np.nan)
+    effort = difficulty * volume
+    return {
+        "Program Vocabulary": program_vocabulary,
+        "Program Length": program_length,
+        "Estimated Program Length": estimated_program_length,
+        "Volume": volume,
+        "Difficulty": difficulty,
+        "Effort": effort
+    }
+
+def rederive_halstead_metrics(file_metrics: Iterable[Dict], metric_names: List[str] = None) -> List[Dict]:
+    """
+    Recompute the derived metrics of stored Halstead results from their "Counts".
+    Works on any number of files, e.g. every file of every commit of a history.
+
+    Args:
+        file_metrics: Stored Halstead results of single files, each with "Counts".
+        metric_names: Derived metrics to recompute (defaults to all of them).
+
+    Returns:
+        New result dicts in input order; the inputs are not modified.
+    """
+    file_metrics = list(file_metrics)
+    metric_names = metric_names or halstead_metrics_names
+    batch = calculate_halstead_metrics_batch(
+        [[metrics["Counts"][name] for name in halstead_count_names] for metrics in file_metrics])
+    # tolist() turns NumPy scalars back into ints/floats json can write, and undefined values are
+    # None like calculate_halstead_metrics's (json would write NaN, which isn't JSON)
+    columns = {name: [None if math.isnan(value) else value for value in batch[name].tolist()] for name in metric_names}
+    return [{**metrics, **{name: columns[name][row] for name in metric_names}}
+            for row, metrics in enumerate(file_metrics)]
+
+def has_counts(file_metrics: Dict) -> bool:
+    return isinstance(file_metrics.get("Counts"), dict)
@@ -1,22 +1,193 @@
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from MetricsClasses.HalsteadMetricsClass import HalsteadMetrics
-from MetricsClasses.TraditionalMetricsClass import TraditionalMetrics
-from MetricsClasses.OOMetricsClass import OOMetrics
-from multiprocessing.pool import ThreadPool
+import ast
+import hashlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from MetricsClasses.FusedMetricsAnalyzer import FusedMetricsAnalyzer
+from MetricsClasses.HalsteadMetricsClass import halstead_metrics_versions, halstead_scopes_version
+from MetricsClasses.TraditionalMetricsClass import traditional_metrics_versions
+from MetricsClasses.OOMetricsClass import oo_metrics_versions
+from MetricsClasses.TokenMetrics import calculate_token_metrics
+from MetricsClasses.ParseTreeCache import get_parse_tree_cache
+from MetricsClasses.SymbolIndex import collect_symbols, empty_symbols
 
 supported_metrics=["Halstead","Traditional","OO"]
+# Version of every sub-metric, stored alongside calculated results
+analyzer_versions={
+    "Halstead": halstead_metrics_versions,
+    "Traditional": traditional_metrics_versions,
+    "OO": oo_metrics_versions
+}
+
+def parse_metric_selection(metrics: Optional[Iterable[str]] = None) -> Optional[Dict[str, List[str]]]:
+    """
+    Turn a metric selection spec into {metric type: [sub-metrics]}, in analyzer order.
+    The spec lists metric types and/or single sub-metrics, e.g. ["Halstead", "Traditional.CC"].
+    None (or an empty spec) selects everything and is returned as None. An already parsed
+    selection is returned unchanged. Raises ValueError for unknown names.
+    """
+    if not metrics:
+        return None
+    if isinstance(metrics, dict):
+        return metrics
+    if isinstance(metrics, str):
+        metrics = [metrics]
+    requested = {}
+    for spec in metrics:
+        metric_type, _, name = spec.partition(".")
+        if metric_type not in analyzer_versions:
+            raise ValueError(f"Unknown metric type '{metric_type}' in '{spec}', expected one of {supported_metrics}")
+        if name and name not in analyzer_versions[metric_type]:
+            raise ValueError(f"Unknown {metric_type} metric '{name}' in '{spec}', "
+                             f"expected one of {list(analyzer_versions[metric_type])}")
+        names = requested.setdefault(metric_type, set())
+        names.update([name] if name else analyzer_versions[metric_type])
+    selection = {metric_type: [name for name in analyzer_versions[metric_type] if name in requested[metric_type]]
+                 for metric_type in supported_metrics if metric_type in requested}
+    # Selecting everything is the same as not selecting
+    if all(len(selection.get(metric_type, [])) == len(versions) for metric_type, versions in analyzer_versions.items()):
+        return None
+    return selection
+
+def metric_selection_key(selection: Optional[Dict[str, List[str]]]) -> str:
+    """Short stable name of a parsed selection, for file names ('' when everything is selected)."""
+    if selection is None:
+        return ""
+    spec = ",".join(f"{metric_type}.{name}" for metric_type, names in selection.items() for name in names)
+    return hashlib.sha1(spec.encode("utf-8")).hexdigest()[:10]
+
+def selected_metric_types(selection: Optional[Dict[str, List[str]]]) -> List[str]:
+    """Metric types a parsed selection computes (all of them for None)."""
+    return list(supported_metrics) if selection is None else list(selection)
+
+def selected_versions(metric_type: str, selection: Optional[Dict[str, List[str]]] = None) -> Dict[str, int]:
+    """Current versions of the sub-metrics of a metric type that a selection computes."""
+    versions = analyzer_versions[metric_type]
+    if selection is None:
+        return dict(versions)
+    return {name: versions[name] for name in selection.get(metric_type, [])}
+
+def get_analyzer_version(metric_type: str, halstead_scopes: bool = False,
+                         selection: Optional[Dict[str, List[str]]] = None) -> str:
+    """
+    Version stamp of a whole metric family, e.g. 'CC:2,Fan in:1,...'. Changes when any sub-metric version does.
+    With a selection only the selected sub-metrics are part of it, so partial results are kept apart.
+    """
+    version = ",".join(f"{name}:{version}" for name, version in selected_versions(metric_type, selection).items())
+    if halstead_scopes and metric_type == "Halstead":
+        # Results with per function/class scopes must not be confused with results without them
+        version += f",Scopes:{halstead_scopes_version}"
+    return version
+
+def get_stale_metrics(metric_type: str, stored_versions: Dict[str, int]) -> list:
+    """Sub-metrics of a family whose stored version differs from the current analyzer."""
+    return [name for name, version in analyzer_versions[metric_type].items()
+            if stored_versions.get(name) != version]
 
 class MetricsController:
-    def __init__(self, tree):
-        self.metrics_obj_list = [HalsteadMetrics(tree), TraditionalMetrics(tree), OOMetrics(tree)]
-        
+    def __init__(self, tree, source=None, halstead_scopes=False, metrics=None):
+        # One fused walk feeds all three metric families (same output as the HalsteadMetrics,
+        # TraditionalMetrics and OOMetrics classes it replaced, without ~10 separate traversals per file).
+        # The source text adds the tokenize based line metrics to Traditional.
+        # metrics is a selection spec (see parse_metric_selection); only what it needs is computed
+        self.selection = parse_metric_selection(metrics)
+        self.analyzer = FusedMetricsAnalyzer(tree, source, halstead_scopes, self.selection)
+
     def calculate_metrics(self):
-        with ThreadPool(processes=len(self.metrics_obj_list)) as pool:
-            results = []
-            for metrics_obj in self.metrics_obj_list:
-                results.append(pool.apply_async(metrics_obj.calculate_metrics))
-            pool.close()
-            pool.join()
-            return [r.get() for r in results]
\ No newline at end of file
+        """[Halstead, Traditional, OO] metrics; metric types that weren't selected are None."""
+        return self.analyzer.calculate_metrics()
+
+    @staticmethod
+    def analyze_many(items: Iterable[Tuple[str, bytes]], executor=None, max_in_flight: Optional[int] = None,
+                     halstead_scopes: bool = False, metrics=None, symbols: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """
+        Parse and analyze (path, source bytes) items with bounded concurrency, yielding
+        (path, {metric type: metrics}) as each file finishes (completion order, not input order).
+        Files that can't be decoded, parsed or analyzed yield (path, {"error": {...}}), with tokenizer-only
+        metrics under "degraded", see analyze_file.
+        items is consumed lazily, so it can be a generator that is still fetching files.
+
+        Args:
+            items: (path, source bytes) pairs.
+            executor: MetricsExecutor to run in; a temporary one is created (and shut down) without it.
+            max_in_flight: Files submitted but not yet yielded (defaults to the executor's).
+            halstead_scopes: Analysis option of the temporary executor.
+            metrics: Metric selection spec (see parse_metric_selection), defaults to the executor's.
+            symbols: Also return the collect_symbols summary of each file, see analyze_file.
+        """
+        # Imported here because MetricsExecutor imports this module
+        from MetricsClasses.MetricsExecutor import MetricsExecutor
+        owns_executor = executor is None
+        if owns_executor:
+            executor = MetricsExecutor(halstead_scopes=halstead_scopes, metrics=metrics)
+        try:
+            yield from executor.analyze_iter(items, max_in_flight, parse_metric_selection(metrics), symbols)
+        finally:
+            if owns_executor:
+                executor.shutdown()
+
+def analyze_file(path, source, halstead_scopes=False, selection=None, symbols=False):
+    """
+    Parse and analyze one file. Returns (path, {metric type: metrics}) for the selected metric
+    types, or on failure (path, {"error": {"stage": "decode"|"parse"|"analyze", "type", "message", "line"}}).
+    Failed files also get "degraded": the tokenizer-only metrics of calculate_token_metrics,
+    so they don't leave holes in the history.
+    With symbols the result also has "Symbols", the collect_symbols summary of the file for the
+    SymbolIndex (an empty one for files that don't parse).
+    """
+    stage = "decode"
+    file_symbols = empty_symbols()
+    try:
+        text = source.decode('utf-8')
+        stage = "parse"
+        # Identical content analyzed before in this process reuses its tree
+        tree = get_parse_tree_cache().parse(source, text)
+        if symbols:
+            file_symbols = collect_symbols(tree)
+        stage = "analyze"
+        metrics = MetricsController(tree, text, halstead_scopes, selection).calculate_metrics()
+        result = {metric_type: type_metrics for metric_type, type_metrics in zip(supported_metrics, metrics)
+                  if type_metrics is not None}
+        if symbols:
+            result["Symbols"] = file_symbols
+        return path, result
+    except Exception as e:
+        error = {
+            "stage": stage,
+            "type": type(e).__name__,
+            "message": str(e),
+            "line": getattr(e, "lineno", None)
+        }
+        # Analysis errors are bugs of the metric classes, not of the file, but until they are fixed
+        # the file is as unusable as one that doesn't parse
+        result = {"error": error, "degraded": calculate_token_metrics(source, error, parse_metric_selection(selection))}
+        if symbols:
+            result["Symbols"] = file_symbols
+        return path, result
+
+def usable_metrics(file_metrics: Dict) -> Optional[Dict]:
+    """The {metric type: metrics} of an analyze_file result to store: its metrics, or the degraded ones of a failed file."""
+    if "error" not in file_metrics:
+        return file_metrics
+    return file_metrics.get("degraded")
+
+def analysis_error_message(file_metrics: Dict) -> str:
+    """What went wrong in a failed analyze_file result, for the logs."""
+    message = file_metrics["error"]["message"]
+    if "degraded" in file_metrics:
+        message += " (using tokenizer-only metrics)"
+    return message
+
+def analyze_source(path, source, halstead_scopes=False, selection=None):
+    """
+    Parse and analyze one file. Returns (path, {metric type: metrics}), with tokenizer-only metrics
+    for files that can't be decoded, parsed or analyzed.
+    """
+    return report_result(*analyze_file(path, source, halstead_scopes, selection))
+
+def report_result(path, metrics):
+    """analyze_source for an analyze_file result: print its error, if any, and keep the usable metrics."""
+    if "error" in metrics:
+        print(f"Error calculating metrics for {path}: {analysis_error_message(metrics)}")
+    return path, usable_metrics(metrics) or {}
@@ -0,0 +1,194 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain, islice, repeat
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from MetricsClasses.MetricsController import analyze_source, analyze_file, parse_metric_selection, report_result
+from MetricsClasses.ParseTreeCache import get_parse_tree_cache, configure_parse_tree_cache
+
+def analyze_chunk(chunk, halstead_scopes=False, selection=None, symbols=False):
+    """
+    Worker side of MetricsExecutor: analyze_file for a list of (path, source) items. Returns the
+    results and the worker's parse tree cache stats since its previous chunk.
+    """
+    results = [analyze_file(path, source, halstead_scopes, selection, symbols) for path, source in chunk]
+    return results, get_parse_tree_cache().collect_stats()
+
+class MetricsExecutor:
+    """
+    Runs metric analysis for (path, source bytes) work items in a pool of long-lived worker
+    processes, so the pure Python AST work is not serialized on the GIL.
+    Every worker (and this process) keeps its own ParseTreeCache.
+    """
+    def __init__(self, max_workers: int = None, chunk_size: int = 4, min_process_items: int = 8,
+                 halstead_scopes: bool = False, max_in_flight: Optional[int] = None, metrics=None,
+                 parse_cache_mb: Optional[float] = None):
+        """
+        Args:
+            max_workers: Number of worker processes (defaults to the CPU count).
+            chunk_size: Work items sent to a worker per round trip.
+            min_process_items: Batches smaller than this are analyzed in-process, since
+                shipping a tiny commit to the pool costs more than it saves.
+            halstead_scopes: Also compute Halstead metrics per function and per class.
+            max_in_flight: Files analyze_iter keeps submitted to the pool (defaults to 4 per worker).
+            metrics: Metric selection spec, e.g. ["Traditional.CC"] (see parse_metric_selection).
+                Everything is computed without it.
+            parse_cache_mb: Estimated memory of the parsed trees each process may cache
+                (see ParseTreeCache); the current budget of this process without it.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        self.min_process_items = min_process_items
+        self.halstead_scopes = halstead_scopes
+        self.max_in_flight = max_in_flight or self.max_workers * 4
+        self.selection = parse_metric_selection(metrics)
+        if parse_cache_mb is not None:
+            configure_parse_tree_cache(int(parse_cache_mb * 1024 * 1024))
+        self.parse_cache_bytes = get_parse_tree_cache().max_bytes
+        self.parse_stats = {}  # process id -> parse tree cache stats
+        self.pool = None
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "MetricsExecutor":
+        """
+        Create an executor from the 'workers', 'chunk_size', 'min_process_items', 'halstead_scopes',
+        'metrics' and 'parse_cache_mb' config keys.
+        """
+        return cls(max_workers=config.get("workers"),
+                   chunk_size=config.get("chunk_size", 4),
+                   min_process_items=config.get("min_process_items", 8),
+                   halstead_scopes=config.get("halstead_scopes", False),
+                   metrics=config.get("metrics"),
+                   parse_cache_mb=config.get("parse_cache_mb"))
+
+    def analyze(self, items: Iterable[Tuple[str, bytes]]) -> List[Tuple[str, Dict]]:
+        """Analyze all work items and return (path, metrics) pairs in input order."""
+        items = list(items)
+        if self.max_workers <= 1 or len(items) < self.min_process_items:
+            return [analyze_source(path, source, self.halstead_scopes, self.selection) for path, source in items]
+
+        self.start_pool()
+        try:
+            results = []
+            for chunk_results, stats in self.pool.map(analyze_chunk, self._chunks(items), repeat(self.halstead_scopes),
+                                                      repeat(self.selection)):
+                self._add_parse_stats(stats)
+                results.extend(report_result(path, metrics) for path, metrics in chunk_results)
+            return results
+        except BrokenProcessPool as e:
+            print(f"Metrics worker pool failed ({e}), analyzing in-process instead")
+            self.pool = None
+            return [analyze_source(path, source, self.halstead_scopes, self.selection) for path, source in items]
+
+    def analyze_iter(self, items: Iterable[Tuple[str, bytes]], max_in_flight: Optional[int] = None,
+                     selection: Optional[Dict] = None, symbols: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """
+        Analyze work items as they arrive and yield (path, metrics) in completion order.
+        Failed files yield (path, {"error": {...}}) instead of (path, {}), see analyze_file.
+        At most max_in_flight items are in the pool at a time, so a lazy items iterator
+        (e.g. files still being fetched) is only read as fast as the workers keep up.
+        selection (parsed, see parse_metric_selection) overrides the executor's for these items.
+        symbols adds the "Symbols" summary of each file to its result (see analyze_file).
+        """
+        selection = selection if selection is not None else self.selection
+        if self.max_workers > 1:
+            # Before reading items: their fetch threads may be starting git subprocesses, and a
+            # worker forked meanwhile inherits the pipe the subprocess module waits on, hanging it
+            self.start_pool()
+        items = iter(items)
+        # Peek at the first items so small batches stay in-process like in analyze()
+        head = list(islice(items, self.min_process_items))
+        if self.max_workers <= 1 or len(head) < self.min_process_items:
+            for path, source in chain(head, items):
+                yield analyze_file(path, source, self.halstead_scopes, selection, symbols)
+            return
+
+        max_chunks = max(1, (max_in_flight or self.max_in_flight) // self.chunk_size)
+        pending = {}  # future -> chunk of work items
+        for chunk in self._chunks(chain(head, items)):
+            while len(pending) >= max_chunks:
+                yield from self._finished(pending, selection, symbols)
+            if self.pool is not None:
+                try:
+                    pending[self.pool.submit(analyze_chunk, chunk, self.halstead_scopes, selection, symbols)] = chunk
+                    continue
+                except BrokenProcessPool as e:
+                    print(f"Metrics worker pool failed ({e}), analyzing in-process instead")
+                    self.pool = None
+            yield from self._analyze_chunk_here(chunk, selection, symbols)
+        while pending:
+            yield from self._finished(pending, selection, symbols)
+
+    def start_pool(self) -> None:
+        """
+        Create the worker pool and fork all its workers now (a fork pool starts them on the first submit).
+        Call it before starting threads that run subprocesses, see analyze_iter.
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=configure_parse_tree_cache,
+                                            initargs=(self.parse_cache_bytes,))
+            self.pool.submit(int).result()
+
+    def _chunks(self, items: Iterable[Tuple[str, bytes]]) -> Iterator[List[Tuple[str, bytes]]]:
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _finished(self, pending: Dict, selection: Optional[Dict], symbols: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Wait until at least one pending chunk is done and yield the results of every done chunk."""
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            chunk = pending.pop(future)
+            try:
+                results, stats = future.result()
+            except BrokenProcessPool as e:
+                if self.pool is not None:
+                    print(f"Metrics worker pool failed ({e}), analyzing in-process instead")
+                    self.pool = None
+                results, stats = analyze_chunk(chunk, self.halstead_scopes, selection, symbols)
+            self._add_parse_stats(stats)
+            yield from results
+
+    def _analyze_chunk_here(self, chunk: List[Tuple[str, bytes]], selection: Optional[Dict],
+                            symbols: bool = False) -> List[Tuple[str, Dict]]:
+        results, stats = analyze_chunk(chunk, self.halstead_scopes, selection, symbols)
+        self._add_parse_stats(stats)
+        return results
+
+    def _add_parse_stats(self, stats: Dict) -> None:
+        """Add the counts of a collect_stats result to its process' totals; sizes are the latest ones."""
+        totals = self.parse_stats.setdefault(stats["pid"], {"hits": 0, "misses": 0, "evictions": 0})
+        for name in ("hits", "misses", "evictions"):
+            totals[name] += stats[name]
+        totals["entries"] = stats["entries"]
+        totals["bytes"] = stats["bytes"]
+        totals["max_bytes"] = stats["max_bytes"]
+
+    def get_parse_cache_stats(self) -> Dict:
+        """Parse tree cache hits, misses and hit rate, evictions and cached trees over this process and the workers."""
+        self._add_parse_stats(get_parse_tree_cache().collect_stats())
+        totals = {name: sum(stats[name] for stats in self.parse_stats.values())
+                  for name in ("hits", "misses", "evictions", "entries", "bytes", "max_bytes")}
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = totals["hits"] / lookups if lookups else 0.0
+        totals["processes"] = len(self.parse_stats)
+        return totals
+
+    def shutdown(self):
+        """Stop the worker processes (a later analyze() call starts a new pool)."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
@@ -0,0 +1,116 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import ast
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# A CPython syntax tree takes about 30 bytes of memory per byte of source (20-42 for most stdlib modules)
+tree_bytes_per_source_byte = 30
+
+class ParseTreeCache:
+    """
+    LRU cache of the syntax trees of a process, keyed by the SHA-1 of the source bytes, so content
+    analyzed again (stale sub-metrics, another metric selection, files whose analysis failed and
+    aren't in the metrics cache) isn't parsed again. It is bounded by an estimate of the trees'
+    memory rather than by a number of entries. The metric classes only read trees, so a cached
+    tree can be analyzed any number of times.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Estimated memory the cached trees may take; 0 disables the cache.
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # source hash -> (tree, estimated bytes), least recently used first
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Counted since the last collect_stats
+        self.new_hits = 0
+        self.new_misses = 0
+        self.new_evictions = 0
+
+    def parse(self, source: bytes, text: Optional[str] = None) -> ast.Module:
+        """ast.parse the source (text is its decoded form, if already known), reusing the tree of identical source."""
+        key = hashlib.sha1(source).digest()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                self.new_hits += 1
+                return entry[0]
+            self.misses += 1
+            self.new_misses += 1
+
+        # Parse errors propagate and aren't cached
+        tree = ast.parse(text if text is not None else source)
+        size = len(source) * tree_bytes_per_source_byte
+        if size > self.max_bytes:
+            return tree
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = (tree, size)
+                self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+                self.new_evictions += 1
+        return tree
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes
+            }
+
+    def collect_stats(self) -> Dict:
+        """Hits, misses and evictions since the last call, with the current size, tagged with this process id."""
+        with self.lock:
+            stats = {
+                "pid": os.getpid(),
+                "hits": self.new_hits,
+                "misses": self.new_misses,
+                "evictions": self.new_evictions,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes
+            }
+            self.new_hits = self.new_misses = self.new_evictions = 0
+            return stats
+
+parse_tree_cache = None
+parse_tree_cache_lock = threading.Lock()
+
+def get_parse_tree_cache() -> ParseTreeCache:
+    """The process-wide parse tree cache, created with the default budget on first use."""
+    global parse_tree_cache
+    with parse_tree_cache_lock:
+        if parse_tree_cache is None:
+            parse_tree_cache = ParseTreeCache()
+        return parse_tree_cache
+
+def configure_parse_tree_cache(max_bytes: int) -> ParseTreeCache:
+    """(Re)create the process-wide parse tree cache with a new budget. Also the initializer of metrics worker processes."""
+    global parse_tree_cache
+    with parse_tree_cache_lock:
+        parse_tree_cache = ParseTreeCache(max_bytes)
+        return parse_tree_cache
@@ -0,0 +1,99 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+class BoundedExecutor:
+    """
+    Size-bounded thread pool shared by the whole process, used for file fetches and for writing
+    the pull request metrics files instead of each creating its own ThreadPool.
+    Work submitted from one of the pool's own threads runs inline in that thread, so nested
+    submissions (a fetch started from a pooled task) can neither deadlock nor grow the pool.
+    """
+    def __init__(self, max_workers: Optional[int] = None, max_in_flight: int = 64):
+        """
+        Args:
+            max_workers: Number of threads (defaults to min(32, CPU count + 4), like ThreadPoolExecutor).
+            max_in_flight: Default cap on the calls a single map() keeps submitted at a time.
+        """
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.max_in_flight = max(1, max_in_flight)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def _mark_worker(self):
+        self.local.is_worker = True
+
+    def in_worker(self) -> bool:
+        """True when called from one of the pool's threads."""
+        return getattr(self.local, "is_worker", False)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="metrics",
+                                               initializer=self._mark_worker)
+            return self.pool
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Schedule fn(*args, **kwargs), or run it right away when called from a pool thread."""
+        if self.in_worker():
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+        return self._get_pool().submit(fn, *args, **kwargs)
+
+    def map(self, fn: Callable, *iterables: Iterable, max_in_flight: Optional[int] = None) -> Iterator:
+        """
+        Like Executor.map (results in input order), but only max_in_flight calls of this run are
+        submitted at a time, so a huge commit can't queue thousands of fetches and their results.
+        """
+        limit = max_in_flight or self.max_in_flight
+        pending = deque()
+        for args in zip(*iterables):
+            if len(pending) >= limit:
+                yield pending.popleft().result()
+            pending.append(self.submit(fn, *args))
+        while pending:
+            yield pending.popleft().result()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Cancel queued work and stop the threads once running work finishes. A later submit starts a new pool."""
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+shared_executor = None
+shared_executor_lock = threading.Lock()
+
+def get_shared_executor() -> BoundedExecutor:
+    """The process-wide executor, created with default bounds on first use."""
+    global shared_executor
+    with shared_executor_lock:
+        if shared_executor is None:
+            shared_executor = BoundedExecutor()
+        return shared_executor
+
+def configure_shared_executor(config: Dict) -> BoundedExecutor:
+    """(Re)create the process-wide executor from the 'io_workers' and 'max_in_flight' config keys."""
+    global shared_executor
+    with shared_executor_lock:
+        if shared_executor is not None:
+            shared_executor.shutdown()
+        shared_executor = BoundedExecutor(max_workers=config.get("io_workers"),
+                                          max_in_flight=config.get("max_in_flight", 64))
+        return shared_executor
+
+def shutdown_shared_executor(wait: bool = True) -> None:
+    """Stop the process-wide executor's threads."""
+    with shared_executor_lock:
+        if shared_executor is not None:
+            shared_executor.shutdown(wait=wait)
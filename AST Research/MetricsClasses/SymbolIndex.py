@@ -0,0 +1,379 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import ast
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Bump when a change to collect_symbols alters the summaries it produces
+symbol_index_version=1
+project_metrics_names=["Fan in","Fan out","CBO"]
+
+def empty_symbols() -> Dict:
+    """Summary of a module without symbols (e.g. one that doesn't parse)."""
+    return {"functions": [], "classes": {}, "imports": {}, "star_imports": [], "calls": {}, "references": {}}
+
+class SymbolCollector(ast.NodeVisitor):
+    """
+    Collects what a module defines and what it refers to, before any name is resolved, so the
+    summary only depends on the content of the file and can be cached by blob SHA.
+    Function names follow the Traditional Fan in/Fan out of FusedMetricsAnalyzer ("Class.method",
+    nested functions by their own name).
+    """
+    def __init__(self):
+        self.functions = []
+        self.classes = {}                       # class name -> dotted base names
+        self.imports = {}                       # bound name -> [module, imported name or None, level]
+        self.star_imports = []                  # [module, level]
+        self.calls = defaultdict(set)           # function -> dotted callee names as written
+        self.references = defaultdict(set)     # class -> dotted names it is coupled to as written
+        self.current_class = None
+        self.current_function = None
+        self.class_bases = {}
+
+    def get_symbols(self) -> Dict:
+        return {
+            "functions": self.functions,
+            "classes": self.classes,
+            "imports": self.imports,
+            "star_imports": self.star_imports,
+            "calls": {function: sorted(callees) for function, callees in self.calls.items()},
+            "references": {class_name: sorted(names) for class_name, names in self.references.items()}
+        }
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.asname:
+                self.imports[alias.asname] = [alias.name, None, 0]
+            else:
+                # "import a.b" binds a
+                head = alias.name.split(".")[0]
+                self.imports[head] = [head, None, 0]
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name == "*":
+                self.star_imports.append([node.module or "", node.level])
+            else:
+                self.imports[alias.asname or alias.name] = [node.module or "", alias.name, node.level]
+
+    def visit_ClassDef(self, node):
+        bases = [name for name in (dotted_name(base) for base in node.bases) if name]
+        self.classes[node.name] = bases
+        self.class_bases[node.name] = bases
+        self.references[node.name].update(bases)
+        old_class, old_function = self.current_class, self.current_function
+        self.current_class, self.current_function = node.name, None
+        self.generic_visit(node)
+        self.current_class, self.current_function = old_class, old_function
+
+    def visit_FunctionDef(self, node):
+        function_name = f"{self.current_class}.{node.name}" if self.current_class else node.name
+        if function_name not in self.functions:
+            self.functions.append(function_name)
+        if self.current_class:
+            annotations = [arg.annotation for arg in node.args.args if arg.annotation] + [node.returns]
+            self.references[self.current_class].update(
+                name for name in (dotted_name(annotation) for annotation in annotations if annotation) if name)
+        old_function = self.current_function
+        self.current_function = function_name
+        self.generic_visit(node)
+        self.current_function = old_function
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_AnnAssign(self, node):
+        if self.current_class:
+            name = dotted_name(node.annotation)
+            if name:
+                self.references[self.current_class].add(name)
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        callee = self._get_callee_name(node.func)
+        if callee:
+            if self.current_function:
+                self.calls[self.current_function].add(callee)
+            if self.current_class:
+                self.references[self.current_class].add(callee)
+        self.generic_visit(node)
+
+    def _get_callee_name(self, node):
+        if isinstance(node, ast.Attribute):
+            if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name) and node.value.func.id == "super":
+                bases = self.class_bases.get(self.current_class, [])
+                # Assume single inheritance, like the Traditional Fan in/Fan out
+                return f"{bases[0]}.{node.attr}" if bases else None
+        name = dotted_name(node)
+        if name is None or name == "super":
+            return None
+        head, _, rest = name.partition(".")
+        if head == "self" and rest:
+            return f"{self.current_class}.{rest}" if self.current_class else rest
+        return name
+
+def dotted_name(node) -> Optional[str]:
+    """'a.b.c' for Name/Attribute chains, None for anything else."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = dotted_name(node.value)
+        if base:
+            return f"{base}.{node.attr}"
+    return None
+
+def collect_symbols(tree: ast.Module) -> Dict:
+    """Definitions, imports, calls and class references of a parsed module (see SymbolCollector)."""
+    collector = SymbolCollector()
+    collector.visit(tree)
+    return collector.get_symbols()
+
+def module_parts(path: str) -> List[str]:
+    """Dotted module name of a file as parts: 'pkg/mod.py' -> ['pkg', 'mod'], 'pkg/__init__.py' -> ['pkg']."""
+    parts = path[:-3].split("/") if path.endswith(".py") else path.split("/")
+    if parts[-1] == "__init__" and len(parts) > 1:
+        parts = parts[:-1]
+    return parts
+
+def definition_keys(path: str, name: str) -> List[str]:
+    """
+    Dotted names a symbol can be imported by. The root the code is imported from (a src/ folder,
+    a script directory put on sys.path) isn't known, so every suffix of the module path counts:
+    'app/pkg/mod.py' defines f as 'mod.f', 'pkg.mod.f' and 'app.pkg.mod.f'.
+    """
+    parts = module_parts(path)
+    return [".".join(parts[start:] + [name]) for start in range(len(parts))]
+
+class SymbolIndex:
+    """
+    Repository-wide symbol table, maintained incrementally as modules change. It holds the
+    collect_symbols summary of every module, the symbols each dotted name can refer to, and the
+    call and coupling edges between symbols once imports are resolved. Symbols are (path, name)
+    pairs. Updating a module only re-resolves that module and the modules whose lookups the
+    change affects, and only the modules whose metrics can change are reported as dirty, so
+    project level metrics of a history cost what changed rather than the size of the tree.
+
+    Project metrics of a module:
+        Fan in: functions of any module calling the function.
+        Fan out: functions of the project the function calls (instantiating a class calls its __init__).
+        CBO: classes of the project the class is coupled to, in either direction (bases,
+            annotations, instantiations and calls); built-ins and external classes aren't counted.
+    """
+    def __init__(self):
+        self.modules: Dict[str, Dict] = {}          # path -> summary
+        self.blob_shas: Dict[str, str] = {}         # path -> blob SHA of the summary
+        self.definitions = defaultdict(set)         # dotted name -> symbols
+        self.kinds: Dict[Tuple[str, str], str] = {} # symbol -> "function" | "class"
+        self.lookups: Dict[str, Set[str]] = {}      # path -> dotted names its resolution looked up
+        self.dependents = defaultdict(set)          # dotted name -> paths that looked it up
+        self.edges: Dict[str, Set[Tuple]] = {}      # path -> resolved (kind, source, target) edges
+        self.callers = defaultdict(set)             # function -> calling functions
+        self.callees = defaultdict(set)             # function -> called symbols
+        self.efferent = defaultdict(set)            # class -> classes it uses
+        self.afferent = defaultdict(set)            # class -> classes using it
+        self.resolved_modules = 0
+
+    def update(self, removed: Iterable[str], changed: Dict[str, Tuple[str, Dict]]) -> Set[str]:
+        """
+        Remove modules and add or replace others, given as {path: (blob SHA, summary)}.
+        Returns the paths of the modules whose project metrics may have changed.
+        """
+        dirty = set()
+        touched_keys = set()
+        to_resolve = set()
+        for path in set(removed) | set(changed):
+            if path not in self.modules:
+                continue
+            if path in changed and self.blob_shas.get(path) == changed[path][0]:
+                continue
+            dirty.update(self._clear_edges(path))
+            touched_keys.update(self._remove_definitions(path))
+            self._forget_lookups(path)
+            del self.modules[path]
+            del self.blob_shas[path]
+            dirty.add(path)
+        for path, (blob_sha, symbols) in changed.items():
+            if path in self.modules:
+                continue
+            self.modules[path] = symbols
+            self.blob_shas[path] = blob_sha
+            touched_keys.update(self._add_definitions(path))
+            to_resolve.add(path)
+            dirty.add(path)
+
+        # Modules whose references may now resolve differently
+        for key in touched_keys:
+            to_resolve.update(self.dependents.get(key, ()))
+        for path in to_resolve:
+            if path in self.modules:
+                dirty.update(self._resolve(path))
+        dirty.difference_update(path for path in list(dirty) if path not in self.modules)
+        return dirty
+
+    def _add_definitions(self, path: str) -> Set[str]:
+        symbols = self.modules[path]
+        keys = set()
+        for name, kind in self._defined(symbols):
+            self.kinds[(path, name)] = kind
+            for key in definition_keys(path, name):
+                self.definitions[key].add((path, name))
+                keys.add(key)
+        return keys
+
+    def _remove_definitions(self, path: str) -> Set[str]:
+        keys = set()
+        for name, _ in self._defined(self.modules[path]):
+            self.kinds.pop((path, name), None)
+            for key in definition_keys(path, name):
+                self.definitions[key].discard((path, name))
+                if not self.definitions[key]:
+                    del self.definitions[key]
+                keys.add(key)
+        return keys
+
+    @staticmethod
+    def _defined(symbols: Dict) -> Iterable[Tuple[str, str]]:
+        for name in symbols["classes"]:
+            yield name, "class"
+        for name in symbols["functions"]:
+            yield name, "function"
+
+    def _forget_lookups(self, path: str) -> None:
+        for key in self.lookups.pop(path, ()):
+            self.dependents[key].discard(path)
+            if not self.dependents[key]:
+                del self.dependents[key]
+
+    def _resolve(self, path: str) -> Set[str]:
+        """(Re)resolve the references of a module; returns the paths of symbols whose edges changed."""
+        self.resolved_modules += 1
+        symbols = self.modules[path]
+        self._forget_lookups(path)
+        looked_up = set()
+        edges = set()
+        for function, callees in symbols["calls"].items():
+            for callee in callees:
+                target = self._lookup(path, symbols, callee, looked_up)
+                if target is None:
+                    continue
+                if self.kinds[target] == "class":
+                    # Instantiating a class calls its __init__, if the project defines one
+                    constructor = (target[0], f"{target[1]}.__init__")
+                    if constructor not in self.kinds:
+                        continue
+                    target = constructor
+                edges.add(("call", (path, function), target))
+        for class_name, names in symbols["references"].items():
+            for name in names:
+                target = self._lookup(path, symbols, name, looked_up)
+                if target is not None and self.kinds[target] == "class" and target != (path, class_name):
+                    edges.add(("class", (path, class_name), target))
+
+        self.lookups[path] = looked_up
+        for key in looked_up:
+            self.dependents[key].add(path)
+        old_edges = self.edges.get(path, set())
+        changed_edges = old_edges ^ edges
+        self._clear_edges(path)
+        self.edges[path] = edges
+        for kind, source, target in edges:
+            if kind == "call":
+                self.callers[target].add(source)
+                self.callees[source].add(target)
+            else:
+                self.efferent[source].add(target)
+                self.afferent[target].add(source)
+        return {symbol[0] for _, source, target in changed_edges for symbol in (source, target)}
+
+    def _clear_edges(self, path: str) -> Set[str]:
+        """Drop the resolved edges of a module; returns the paths of the symbols they connected."""
+        affected = set()
+        for kind, source, target in self.edges.pop(path, ()):
+            if kind == "call":
+                self.callers[target].discard(source)
+                self.callees[source].discard(target)
+            else:
+                self.efferent[source].discard(target)
+                self.afferent[target].discard(source)
+            affected.update((source[0], target[0]))
+        return affected
+
+    def _lookup(self, path: str, symbols: Dict, name: str, looked_up: Set[str]) -> Optional[Tuple[str, str]]:
+        """The symbol a dotted name used in a module refers to, or None for built-ins and external code."""
+        if (path, name) in self.kinds:
+            return (path, name)
+        head, _, rest = name.partition(".")
+        candidates = []
+        if head in symbols["imports"]:
+            module, imported, level = symbols["imports"][head]
+            target = absolute_module(path, module, level)
+            if imported:
+                target = f"{target}.{imported}" if target else imported
+            candidates.append(f"{target}.{rest}" if rest else target)
+        else:
+            for module, level in symbols["star_imports"]:
+                target = absolute_module(path, module, level)
+                candidates.append(f"{target}.{name}" if target else name)
+        for key in candidates:
+            looked_up.add(key)
+            symbol = self._closest(path, self.definitions.get(key))
+            if symbol is not None:
+                return symbol
+        return None
+
+    @staticmethod
+    def _closest(path: str, symbols: Optional[Set[Tuple[str, str]]]) -> Optional[Tuple[str, str]]:
+        """Of the symbols a dotted name matches, the one defined closest to the importing module."""
+        if not symbols:
+            return None
+        if len(symbols) == 1:
+            return next(iter(symbols))
+        parts = path.split("/")
+
+        def shared_directories(symbol):
+            other = symbol[0].split("/")
+            shared = 0
+            while shared < min(len(parts), len(other)) - 1 and parts[shared] == other[shared]:
+                shared += 1
+            return -shared, symbol
+        return min(symbols, key=shared_directories)
+
+    def get_module_metrics(self, path: str) -> Dict[str, Dict]:
+        """Project level Fan in, Fan out and CBO of the functions and classes of a module."""
+        symbols = self.modules[path]
+        return {
+            "Fan in": {function: len(self.callers.get((path, function), ())) for function in symbols["functions"]},
+            "Fan out": {function: len(self.callees.get((path, function), ())) for function in symbols["functions"]},
+            "CBO": {class_name: len(self.efferent.get((path, class_name), set()) |
+                                    self.afferent.get((path, class_name), set()))
+                    for class_name in symbols["classes"]}
+        }
+
+    def get_stats(self) -> Dict:
+        return {
+            "modules": len(self.modules),
+            "symbols": len(self.kinds),
+            "edges": sum(len(edges) for edges in self.edges.values()),
+            "resolved_modules": self.resolved_modules
+        }
+
+    def to_dict(self) -> Dict:
+        """The summaries the index was built from; from_dict rebuilds the rest."""
+        return {path: [self.blob_shas[path], symbols] for path, symbols in self.modules.items()}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SymbolIndex":
+        index = cls()
+        index.update([], {path: (blob_sha, symbols) for path, (blob_sha, symbols) in data.items()})
+        return index
+
+def absolute_module(path: str, module: str, level: int) -> str:
+    """Dotted name of a module imported from the file at path ('from ..a import b' has level 2 and module 'a')."""
+    if not level:
+        return module
+    parts = path[:-3].split("/") if path.endswith(".py") else path.split("/")
+    # The package of the importing file, then one level up per extra dot
+    package = parts[:-1]
+    if level > 1:
+        package = package[:-(level - 1)] if level - 1 <= len(package) else []
+    return ".".join(package + ([module] if module else []))
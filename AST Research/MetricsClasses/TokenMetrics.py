@@ -0,0 +1,128 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import io
+import keyword
+import tokenize
+from typing import Dict, Optional
+from MetricsClasses.HalsteadMetricsClass import calculate_halstead_metrics
+
+# Bump when a change to the tokenizer-only metrics alters the values they produce
+token_metrics_version=1
+# What can be approximated without a syntax tree (no CC, fan in/out, identifiers or OO metrics)
+token_metrics_names={
+    "Traditional": ["LOC","Physical LOC","SLOC","Comment Lines","Blank Lines","Docstring Lines"],
+    "Halstead": ["Program Vocabulary","Program Length","Estimated Program Length","Volume","Difficulty","Effort","Counts"]
+}
+# Tokens that don't make a line count as code
+layout_tokens = {tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER}
+# A bracket pair counts as one operator
+closing_brackets = {")", "]", "}"}
+# Keywords that are values, so operands
+keyword_operands = {"True", "False", "None"}
+
+def calculate_token_metrics(source: bytes, error: Optional[Dict] = None, selection: Optional[Dict] = None) -> Dict[str, Dict]:
+    """
+    Degraded metrics of a file ast.parse rejects (Python 2 code, templates, syntax errors), from the
+    tokenizer alone: line counts and token based Halstead metrics. Operators are operator tokens and
+    keywords, operands are names, numbers and strings, so Halstead values are only approximations of
+    the tree based ones. Every metric type gets a "Degraded" entry with the parse error and token count.
+
+    Args:
+        source: Raw bytes of the file; undecodable bytes are replaced.
+        error: The error of the failed analysis (see analyze_file), kept in "Degraded".
+        selection: Parsed metric selection (see parse_metric_selection); everything without it.
+    """
+    text = source.decode("utf-8", errors="replace")
+    code_lines = set()
+    node_lines = set()
+    comment_lines = set()
+    docstring_lines = set()
+    operators, operands = {}, {}
+    line_tokens = []
+    # A string statement right after a def/class header (or at the top of the file) is a docstring
+    accepts_docstring = True
+    last_row = 0
+
+    def end_logical_line():
+        nonlocal accepts_docstring
+        if not line_tokens:
+            return
+        rows = set()
+        for token in line_tokens:
+            rows.update(range(token.start[0], token.end[0] + 1))
+        if accepts_docstring and all(token.type == tokenize.STRING for token in line_tokens):
+            docstring_lines.update(rows)
+        else:
+            code_lines.update(rows)
+        first = line_tokens[1].string if line_tokens[0].string == "async" and len(line_tokens) > 1 else line_tokens[0].string
+        accepts_docstring = first in ("def", "class") and line_tokens[-1].string == ":"
+        line_tokens.clear()
+
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(text).readline):
+            last_row = token.end[0]
+            if token.type == tokenize.COMMENT:
+                comment_lines.add(token.start[0])
+                continue
+            if token.type == tokenize.NEWLINE:
+                end_logical_line()
+                continue
+            if token.type in layout_tokens or (token.type == tokenize.ERRORTOKEN and not token.string.strip()):
+                continue
+            line_tokens.append(token)
+            # Nodes start at names, literals and opening brackets, never at closing brackets or other operators
+            if token.type != tokenize.OP or token.string in ("(", "[", "{"):
+                node_lines.add(token.start[0])
+            if token.type == tokenize.NAME:
+                counts = operators if keyword.iskeyword(token.string) and token.string not in keyword_operands else operands
+            elif token.type in (tokenize.NUMBER, tokenize.STRING):
+                counts = operands
+            elif token.string in closing_brackets:
+                continue
+            else:
+                counts = operators
+            counts[token.string] = counts.get(token.string, 0) + 1
+    except (tokenize.TokenError, SyntaxError):
+        # Unterminated strings or brackets, inconsistent dedents: the rest of the file is classified by its text
+        pass
+    end_logical_line()
+
+    lines = text.splitlines()
+    for row, line in enumerate(lines, 1):
+        if row <= last_row:
+            continue
+        stripped = line.strip()
+        if stripped.startswith("#"):
+            comment_lines.add(row)
+        elif stripped:
+            code_lines.add(row)
+            node_lines.add(row)
+    blank_lines = sum(1 for row, line in enumerate(lines, 1)
+                      if not line.strip() and row not in code_lines and row not in docstring_lines)
+
+    tokens = sum(operators.values()) + sum(operands.values())
+    calculated = {
+        "Traditional": {
+            # Lines where a node of the tree would start
+            "LOC": len(node_lines),
+            "Physical LOC": len(lines),
+            "SLOC": len(code_lines),
+            "Comment Lines": len(comment_lines),
+            "Blank Lines": blank_lines,
+            "Docstring Lines": len(docstring_lines)
+        },
+        "Halstead": calculate_halstead_metrics(len(operators), sum(operators.values()),
+                                               len(operands), sum(operands.values()))
+    }
+
+    degraded = {**(error or {}), "tokens": tokens}
+    metrics = {}
+    for metric_type, type_metrics in calculated.items():
+        if selection is None:
+            names = token_metrics_names[metric_type]
+        else:
+            names = [name for name in selection.get(metric_type, []) if name in token_metrics_names[metric_type]]
+        if names:
+            metrics[metric_type] = {**{name: type_metrics[name] for name in names}, "Degraded": degraded}
+    return metrics
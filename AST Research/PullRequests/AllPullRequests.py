@@ -4,15 +4,42 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from github import Repository
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from PullRequestMetrics import PullRequestMetrics
+from MetricsClasses.MetricsExecutor import MetricsExecutor
+from MetricsClasses.MetricsController import parse_metric_selection
+from Cache.BlobMetricsCache import BlobMetricsCache
+from RepositorySources.RepositorySource import RepositorySource
+from RepositorySources.AsyncGitHubClient import AsyncGitHubClient
+from RepositorySources.RateLimitScheduler import RequestBudget
+from Branch.MetricsFileStore import MetricsFileStore
 import json
 import os
-from concurrent.futures import ThreadPoolExecutor
+from MetricsClasses.SharedExecutor import get_shared_executor
 
 class AllPullRequestMetrics:
-    def __init__(self, repo: Repository, save_online : bool = False, save: bool = False, output_dir: str = "pull_request_metrics"):
+    def __init__(self, repo: Repository, save_online : bool = False, save: bool = False, output_dir: str = "pull_request_metrics",
+                 executor: Optional[MetricsExecutor] = None, cache: Optional[BlobMetricsCache] = None,
+                 source: Optional[RepositorySource] = None, metrics: Optional[list] = None,
+                 client: Optional[AsyncGitHubClient] = None, budget: Optional[RequestBudget] = None,
+                 store: Optional[MetricsFileStore] = None):
         self.repo = repo
+        # Where PR file contents are read from; None reads them through the GitHub API
+        self.source = source
+        # Async API layer the PRs' file lists (and blobs, without a source) are read through; PyGithub without it
+        self.client = client
+        # The repository's share of the API rate limit; PRs left when it runs out are processed next run
+        self.budget = budget
+        # Metrics files shared by the PRs of the sweep (e.g. several PRs from one branch)
+        self.store = store if store is not None else MetricsFileStore()
+        # One executor (and one set of worker processes) for every PR of the sweep
+        self.owns_executor = executor is None
+        self.executor = executor if executor is not None else MetricsExecutor(metrics=metrics)
+        # Metric selection spec, e.g. ["Traditional.CC"] for a quality gate; defaults to the executor's
+        self.selection = parse_metric_selection(metrics) if metrics else self.executor.selection
+        # PRs of a repository share most of their base files
+        self.cache = cache if cache is not None else BlobMetricsCache(halstead_scopes=self.executor.halstead_scopes,
+                                                                      metrics=self.selection)
         self.save_online = save_online
         self.save = save
         self.pull_request_metrics: List[PullRequestMetrics] = []
@@ -34,6 +61,8 @@ class AllPullRequestMetrics:
         
         # Get pull requests based on state
         pull_requests = self.repo.get_pulls(state=pr_state)
+        if self.budget is not None:
+            pull_requests = self.budget.limit(pull_requests)
         
         # Counter for tracking processed and skipped PRs
         processed_count = 0
@@ -44,11 +73,21 @@ class AllPullRequestMetrics:
                 skipped_count += 1
                 continue
                 
-            pr_metrics = PullRequestMetrics(self.repo, pr, save_online=False, save=False)
+            pr_metrics = PullRequestMetrics(self.repo, pr, save_online=False, save=False, executor=self.executor,
+                                            cache=self.cache, source=self.source, metrics=self.selection,
+                                            client=self.client, store=self.store)
             pr_metrics.calculate_metrics()
             self.pull_request_metrics.append(pr_metrics)
             self.processed_pr_numbers.append(pr.number)
             processed_count += 1
+
+        if self.owns_executor:
+            self.executor.shutdown()
+
+        cache_stats = self.cache.get_stats()
+        print(f"Metrics cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.1%} hit rate)")
+        parse_stats = self.executor.get_parse_cache_stats()
+        print(f"Parse tree cache: {parse_stats['hits']} hits, {parse_stats['misses']} misses ({parse_stats['hit_rate']:.1%} hit rate)")
             
         print(f"Finished processing {processed_count} new PRs. Skipped {skipped_count} already processed PRs.")
 
@@ -90,26 +129,31 @@ class AllPullRequestMetrics:
     
         # Save all metric types asynchronously
         saved_files = []
-        with ThreadPoolExecutor() as executor:
-            futures = []
-            for metric_type, data in metric_type_data.items():
-                # Read existing data if available
-                output_path = self.output_dir / f"{metric_type}_PRs.json"
-                existing_data = self._read_existing_json(output_path)
-                
-                # Merge new data with existing data
-                if existing_data:
-                    for pr_number, pr_data in data.items():
-                        existing_data[str(pr_number)] = pr_data
-                    merged_data = existing_data
-                else:
-                    merged_data = data
-                    
-                futures.append(executor.submit(self._save_json, output_path, merged_data))
-                saved_files.append((metric_type, str(output_path)))
+        executor = get_shared_executor()
+        futures = []
+        for metric_type, data in metric_type_data.items():
+            # Read existing data if available
+            output_path = self.output_dir / f"{metric_type}_PRs.json"
+            existing_data = self._read_existing_json(output_path)
             
-            for future in futures:
-                future.result()
+            # Merge new data with existing data
+            if existing_data:
+                for pr_number, pr_data in data.items():
+                    existing_pr = existing_data.get(str(pr_number))
+                    if self.selection is not None and existing_pr and existing_pr.get("commit_sha") == pr_data["commit_sha"]:
+                        # A partial run only replaces the sub-metrics it calculated
+                        pr_data["files"] = {file_name: {**existing_pr.get("files", {}).get(file_name, {}), **file_metrics}
+                                            for file_name, file_metrics in pr_data["files"].items()}
+                    existing_data[str(pr_number)] = pr_data
+                merged_data = existing_data
+            else:
+                merged_data = data
+                
+            futures.append(executor.submit(self._save_json, output_path, merged_data))
+            saved_files.append((metric_type, str(output_path)))
+        
+        for future in futures:
+            future.result()
     
         print(f"Finished saving metrics locally split by type under {self.output_dir}.")
     
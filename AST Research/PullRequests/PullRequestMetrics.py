@@ -2,68 +2,105 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from github import PullRequest, Repository
-from typing import Dict, Any
-from multiprocessing.pool import ThreadPool
+from typing import Dict, Any, List, Optional
 import ast
 from Branch.MetricsFileManager import MetricsFileManager
+from Branch.MetricsFileStore import MetricsFileStore
 from MetricsClasses.MetricsController import MetricsController
 from MetricsClasses.MetricsController import supported_metrics
+from MetricsClasses.MetricsController import usable_metrics, analysis_error_message
+from MetricsClasses.MetricsController import parse_metric_selection, selected_metric_types
+from MetricsClasses.MetricsExecutor import MetricsExecutor
+from Cache.BlobMetricsCache import BlobMetricsCache
+from RepositorySources.RepositorySource import RepositorySource, ChangedFile, TreeEntry
+from RepositorySources.GitHubRepositorySource import GitHubRepositorySource
+from RepositorySources.AsyncGitHubClient import AsyncGitHubClient
 
 
 class PullRequestMetrics:
-    def __init__(self, repo: Repository, pr: PullRequest.PullRequest, save_online : bool = False, save:bool = False):
+    def __init__(self, repo: Repository, pr: PullRequest.PullRequest, save_online : bool = False, save:bool = False,
+                 executor: Optional[MetricsExecutor] = None, cache: Optional[BlobMetricsCache] = None,
+                 source: Optional[RepositorySource] = None, metrics: Optional[list] = None,
+                 client: Optional[AsyncGitHubClient] = None, store: Optional[MetricsFileStore] = None):
         self.repo = repo
+        # Lists the PR's files (and reads their blobs, without a source) through the async API layer
+        self.client = client
+        # Pull requests are listed through GitHub, but file contents can come from any source (e.g. a local mirror)
+        self.source = source if source is not None else GitHubRepositorySource(repo, client)
         self.pr = pr
         self.save_online = save_online
         self.save=save
+        self.owns_executor = executor is None
+        self.executor = executor if executor is not None else MetricsExecutor(metrics=metrics)
+        # Metric selection spec, e.g. ["Traditional.CC"] for a quality gate; defaults to the executor's
+        self.selection = parse_metric_selection(metrics) if metrics else self.executor.selection
+        self.cache = cache if cache is not None else BlobMetricsCache(halstead_scopes=self.executor.halstead_scopes,
+                                                                      metrics=self.selection)
         self.branch_name = pr.head.ref
         self.metric_managers = {
-            "Halstead": MetricsFileManager(repo, "Halstead", branch_name=self.branch_name),
-            "Traditional": MetricsFileManager(repo, "Traditional", branch_name=self.branch_name),
-            "OO": MetricsFileManager(repo, "OO", branch_name=self.branch_name)
+            metric_type: MetricsFileManager(repo, metric_type, branch_name=self.branch_name, store=store)
+            for metric_type in selected_metric_types(self.selection)
         }
 
-        # Load existing if any (optional, or we could always recalculate for PRs)
-        for manager in self.metric_managers.values():
-            manager.load_metrics([])
+        # Stored metrics are not loaded: only this PR's head commit is read back, and saving merges with
+        # the stored file. Managers of a store share whatever another manager of the branch loaded.
 
-    def calculate_file_metrics(self, file_path: str, commit_sha: str) -> tuple[str, Dict]:
-        try:
-            file_content = self.repo.get_contents(file_path, ref=commit_sha)
-            tree = ast.parse(file_content.decoded_content.decode('utf-8'))
+    def get_changed_files(self) -> List[ChangedFile]:
+        """Files the pull request changes, with their blob SHAs at the PR head."""
+        if self.client is not None:
+            return [ChangedFile(f["status"], f["filename"], f.get("sha"), f.get("previous_filename"))
+                    for f in self.client.run(self.client.get_pull_files(self.repo.full_name, self.pr.number))]
+        return [ChangedFile(f.status, f.filename, f.sha, f.previous_filename) for f in self.pr.get_files()]
 
-            controller = MetricsController(tree)
-            metrics = controller.calculate_metrics()
-
-            return file_path, {
-                "Halstead": metrics[0],
-                "Traditional": metrics[1],
-                "OO": metrics[2]
-            }
-        except Exception as e:
-            print(f"Error calculating metrics for {file_path} in PR #{self.pr.number}: {e}")
-            return file_path, {}
+    def iter_file_sources(self, files: List[TreeEntry], commit_sha: str):
+        """(path, raw bytes) of changed files at the PR head as they arrive; files that can't be read are left out."""
+        for file, source, error in self.source.read_files(files, commit_sha):
+            if error is not None:
+                print(f"Error fetching {file.path} in PR #{self.pr.number}: {error}")
+            elif source is not None:
+                yield file.path, source
 
     def calculate_metrics(self):
         """Calculate metrics for all Python files changed in the pull request."""
-        files = self.pr.get_files()
+        files = self.get_changed_files()
         commit_sha = self.pr.head.sha
 
-        python_files = [f.filename for f in files if f.filename.endswith('.py')]
-
-        with ThreadPool() as pool:
-            results = [pool.apply_async(self.calculate_file_metrics, (file_path, commit_sha)) for file_path in python_files]
-
-            pool.close()
-            pool.join()
-
-            for result in results:
-                file_path, file_metrics = result.get()
-                if file_metrics:
-                    for metric_type in supported_metrics:
-                        if metric_type in file_metrics:
-                            manager = self.metric_managers[metric_type]
-                            manager.update_file_metrics(commit_sha, file_path, file_metrics[metric_type])
+        # Files the PR deletes don't exist at its head (their blob SHA is the old content's)
+        python_files = [f for f in files if f.filename.endswith('.py') and f.status != "removed"]
+
+        # PR files carry their blob SHA, so files already analyzed (e.g. on main) are not fetched again
+        results = {}
+        files_to_fetch = []
+        for f in python_files:
+            cached_metrics = self.cache.get(f.sha) if f.sha else None
+            if cached_metrics is not None:
+                results[f.filename] = cached_metrics
+            else:
+                files_to_fetch.append(f)
+
+        # Each file is analyzed as soon as its fetch finishes
+        work_items = self.iter_file_sources([TreeEntry(f.filename, f.sha) for f in files_to_fetch], commit_sha)
+
+        blob_shas = {f.filename: f.sha for f in files_to_fetch}
+        for file_path, file_metrics in MetricsController.analyze_many(work_items, executor=self.executor,
+                                                                      metrics=self.selection):
+            if "error" in file_metrics:
+                print(f"Error calculating metrics for {file_path} in PR #{self.pr.number}: {analysis_error_message(file_metrics)}")
+            if blob_shas.get(file_path):
+                self.cache.put_result(blob_shas[file_path], file_metrics)
+            file_metrics = usable_metrics(file_metrics)
+            if file_metrics is not None:
+                results[file_path] = file_metrics
+
+        for f in python_files:
+            file_metrics = results.get(f.filename)
+            if file_metrics:
+                for metric_type, manager in self.metric_managers.items():
+                    if metric_type in file_metrics:
+                        manager.update_file_metrics(commit_sha, f.filename, file_metrics[metric_type])
+
+        if self.owns_executor:
+            self.executor.shutdown()
 
         # Save depending on configuration
         if(self.save):
@@ -112,13 +149,12 @@ class PullRequestMetrics:
         """Compare PR metrics to the main branch metrics for changed files."""
         from Branch.BranchMetrics import BranchMetrics  # import here to avoid circular import
 
-        main_branch_metrics = BranchMetrics(self.repo, branch_name="main")
+        main_branch_metrics = BranchMetrics(self.source, branch_name="main", metrics=self.selection)
         main_branch_metrics.load_existing_only()
 
         comparison = {}
 
-        for metric_type in supported_metrics:
-            pr_manager = self.metric_managers[metric_type]
+        for metric_type, pr_manager in self.metric_managers.items():
             main_manager = main_branch_metrics.metric_managers[metric_type]
 
             pr_metrics = pr_manager.metrics
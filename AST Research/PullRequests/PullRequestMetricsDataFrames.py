@@ -62,7 +62,8 @@ class PullRequestMetricsDataFrames:
             if file_name in files:
                 index = self._parse_datetime(pr_data)
                 indices.append(index)
-                metrics_data.append(files[file_name])
+                # Raw counts and per function/class scopes are nested dicts, not time series of the file
+                metrics_data.append({name: value for name, value in files[file_name].items() if not isinstance(value, dict)})
         
         df = pd.DataFrame(metrics_data, index=indices)
         
@@ -116,7 +117,7 @@ class PullRequestMetricsDataFrames:
         return metric_dfs
 
     def _process_traditional(self, file_name):
-        flat_metrics = ['LOC', 'Length of Identifier']
+        flat_metrics = ['LOC', 'Length of Identifier', 'Physical LOC', 'SLOC', 'Comment Lines', 'Blank Lines', 'Docstring Lines']
         nested_metrics = ['Fan in', 'Fan out', 'CC']
         indices, flat_data = [], {metric: [] for metric in flat_metrics}
         pr_numbers = []
@@ -0,0 +1,387 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import asyncio
+import json
+import re
+import ssl
+import threading
+import time
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Coroutine, Dict, Iterable, Iterator, List, Optional, Tuple
+from Cache.HTTPResponseCache import HTTPResponseCache, get_http_cache
+
+# Media type of the GitHub REST API, and the one that returns blobs as raw bytes instead of base64 JSON
+json_media_type = "application/vnd.github+json"
+raw_media_type = "application/vnd.github.raw"
+# Redirects followed per request (renamed or transferred repositories)
+max_redirects = 3
+
+class GitHubAPIError(Exception):
+    """A GitHub API request answered with an error status."""
+    def __init__(self, status: int, url: str, message: str):
+        super().__init__(f"{status} {message} ({url})")
+        self.status = status
+        self.url = url
+
+class AsyncHTTPConnectionPool:
+    """
+    Minimal HTTP/1.1 client on asyncio streams that keeps connections alive between requests,
+    so thousands of small API reads don't each pay for a TCP and TLS handshake.
+    Bodies are read whole (Content-Length, chunked, or until the server closes).
+    """
+    def __init__(self, max_idle_per_host: int = 16, timeout: float = 30):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.idle = {}  # (scheme, host, port) -> idle (reader, writer) connections
+        self.ssl_context = ssl.create_default_context()
+        self.opened = 0
+        self.reused = 0
+
+    async def request(self, method: str, url: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """Send a request and return (status, lower-cased headers, body)."""
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        for attempt in range(2):
+            connection, reused = await self._acquire(key)
+            try:
+                status, response_headers, body, keep_alive = await asyncio.wait_for(
+                    self._exchange(connection, method, target, parts.netloc, headers), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection[1].close()
+                # The server may have closed an idle keep-alive connection; a fresh one gets one more try
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                connection[1].close()
+                raise
+            if keep_alive:
+                self._release(key, connection)
+            else:
+                connection[1].close()
+            return status, response_headers, body
+
+    async def _acquire(self, key: Tuple) -> Tuple[Tuple[asyncio.StreamReader, asyncio.StreamWriter], bool]:
+        idle = self.idle.get(key)
+        while idle:
+            connection = idle.pop()
+            if not connection[0].at_eof() and not connection[1].is_closing():
+                self.reused += 1
+                return connection, True
+            connection[1].close()
+        scheme, host, port = key
+        connection = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == "https" else None), self.timeout)
+        self.opened += 1
+        return connection, False
+
+    def _release(self, key: Tuple, connection: Tuple) -> None:
+        idle = self.idle.setdefault(key, [])
+        if len(idle) < self.max_idle_per_host:
+            idle.append(connection)
+        else:
+            connection[1].close()
+
+    @staticmethod
+    async def _exchange(connection: Tuple, method: str, target: str, host: str,
+                        headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes, bool]:
+        reader, writer = connection
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {host}", "Connection: keep-alive"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed before the response")
+        version, status = status_line.decode("latin-1").split(None, 2)[:2]
+        status = int(status)
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            value = value.strip()
+            response_headers[name] = f"{response_headers[name]}, {value}" if name in response_headers else value
+
+        keep_alive = version == "HTTP/1.1" and response_headers.get("connection", "").lower() != "close"
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif "chunked" in response_headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip(), 16)
+                if size == 0:
+                    # Trailers, up to the blank line
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in response_headers:
+            body = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status, response_headers, body, keep_alive
+
+    def close(self) -> None:
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+class AsyncGitHubClient:
+    """
+    asyncio layer for the GitHub REST API endpoints a run reads most: commit lists, trees, blobs
+    and pull request files. It runs its own event loop in a background thread, so the threaded
+    code calls it through run() and iter_blobs() while all requests share:
+    - one keep-alive connection pool (AsyncHTTPConnectionPool),
+    - a semaphore capping the requests in flight across the whole process,
+    - request coalescing: a GET already in flight (the same blob wanted by two PRs) is sent once
+      and every caller gets its response.
+    """
+    def __init__(self, token: Optional[str] = None, base_url: str = "https://api.github.com",
+                 max_concurrency: int = 16, timeout: float = 30, cache: Optional[HTTPResponseCache] = None):
+        """
+        Args:
+            token: GitHub access token; anonymous requests without it.
+            base_url: API root (a GitHub Enterprise server or a local fake one).
+            max_concurrency: Requests in flight at a time, over every caller.
+            timeout: Seconds a single request may take.
+            cache: Conditional request cache for JSON responses.
+        """
+        self.token = token
+        self.cache = cache
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max(1, max_concurrency)
+        self.pool = AsyncHTTPConnectionPool(max_idle_per_host=self.max_concurrency, timeout=timeout)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = {}  # (url, media type) -> future of the response
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0
+        self.active = 0
+        self.max_active = 0
+        self.request_seconds = 0.0
+        # (remaining, limit, reset epoch seconds) as reported by the last response
+        self.rate_limit = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="github-async", daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine: Coroutine) -> Any:
+        """Run a coroutine of this client on its loop and wait for the result (from any thread but the loop's)."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def url(self, path: str) -> str:
+        return path if path.startswith("http") else f"{self.base_url}{path}"
+
+    async def get(self, path: str, media_type: str = json_media_type) -> Tuple[Dict[str, str], bytes]:
+        """GET an API path (or full URL) and return (headers, body); identical GETs in flight are sent once."""
+        key = (self.url(path), media_type)
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        future = self.loop.create_future()
+        self.in_flight[key] = future
+        try:
+            response = await self._request(key[0], media_type)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            # Marks the exception as retrieved when nobody else was waiting for it
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del self.in_flight[key]
+
+    async def _request(self, url: str, media_type: str) -> Tuple[Dict[str, str], bytes]:
+        headers = {"Accept": media_type, "User-Agent": "Python-Code-Quality-Visualizer",
+                   "X-GitHub-Api-Version": "2022-11-28"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        # Blobs never change and are only read once their metrics aren't cached, so only JSON is kept
+        cache = self.cache if media_type == json_media_type else None
+        if cache is not None:
+            key = cache.get_key(url, headers)
+            entry = cache.lookup(key)
+            if entry is not None and entry["fresh"]:
+                return cache.replay(key, entry)
+            headers.update(cache.get_conditional_headers(entry))
+        for _ in range(max_redirects + 1):
+            async with self.semaphore:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                started = time.perf_counter()
+                try:
+                    status, response_headers, body = await self.pool.request("GET", url, headers)
+                finally:
+                    self.active -= 1
+                    self.requests += 1
+                    self.request_seconds += time.perf_counter() - started
+            if "x-ratelimit-remaining" in response_headers:
+                self.rate_limit = (int(response_headers["x-ratelimit-remaining"]),
+                                   int(response_headers.get("x-ratelimit-limit", 0)),
+                                   float(response_headers.get("x-ratelimit-reset", 0)))
+            if status == 304 and cache is not None and entry is not None:
+                return cache.replay(key, entry, response_headers)
+            if status in (301, 302, 307, 308) and "location" in response_headers:
+                url = urllib.parse.urljoin(url, response_headers["location"])
+                continue
+            if status >= 400:
+                try:
+                    error = json.loads(body)
+                except ValueError:
+                    error = None
+                # GitHub's errors are {"message": ...}; anything else (a proxy's page, a list) is quoted
+                if isinstance(error, dict):
+                    message = str(error.get("message", ""))
+                else:
+                    message = body[:200].decode("utf-8", errors="replace")
+                raise GitHubAPIError(status, url, message)
+            if cache is not None:
+                cache.store(key, url, response_headers, body)
+            return response_headers, body
+        raise GitHubAPIError(status, url, "Too many redirects")
+
+    async def get_json(self, path: str) -> Any:
+        _, body = await self.get(path)
+        return json.loads(body)
+
+    async def get_pages(self, path: str) -> List:
+        """Every item of a paginated list endpoint, following the Link headers."""
+        items = []
+        url = self.url(path)
+        while url:
+            headers, body = await self.get(url)
+            items.extend(json.loads(body))
+            match = re.search(r'<([^>]+)>;\s*rel="next"', headers.get("link", ""))
+            url = match.group(1) if match else None
+        return items
+
+    async def get_commits(self, full_name: str, sha: str) -> List[Dict]:
+        """Commits reachable from a branch or SHA, newest first (GET /repos/{owner}/{repo}/commits)."""
+        return await self.get_pages(f"/repos/{full_name}/commits?sha={urllib.parse.quote(sha, safe='')}&per_page=100")
+
+    async def get_tree(self, full_name: str, sha: str) -> Dict:
+        """The recursive tree of a commit (GET /repos/{owner}/{repo}/git/trees/{sha}?recursive=1)."""
+        return await self.get_json(f"/repos/{full_name}/git/trees/{sha}?recursive=1")
+
+    async def get_blob(self, full_name: str, blob_sha: str) -> bytes:
+        """Raw bytes of a blob (GET /repos/{owner}/{repo}/git/blobs/{sha})."""
+        _, body = await self.get(f"/repos/{full_name}/git/blobs/{blob_sha}", raw_media_type)
+        return body
+
+    async def get_pull_files(self, full_name: str, number: int) -> List[Dict]:
+        """Files changed by a pull request (GET /repos/{owner}/{repo}/pulls/{number}/files)."""
+        return await self.get_pages(f"/repos/{full_name}/pulls/{number}/files?per_page=100")
+
+    def iter_blobs(self, full_name: str, blob_shas: Iterable[str],
+                   max_in_flight: Optional[int] = None) -> Iterator[Tuple[int, Optional[bytes], Optional[Exception]]]:
+        """
+        Read blobs concurrently and yield (position in blob_shas, bytes, None) or (position, None, error)
+        in completion order. At most max_in_flight (twice the concurrency by default) are requested
+        ahead of the caller, so a slow consumer doesn't pile up downloaded blobs.
+        """
+        limit = max_in_flight or self.max_concurrency * 2
+        pending = {}
+        blob_shas = iter(enumerate(blob_shas))
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < limit:
+                    item = next(blob_shas, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    future = asyncio.run_coroutine_threadsafe(self.get_blob(full_name, item[1]), self.loop)
+                    pending[future] = item[0]
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        yield index, future.result(), None
+                    except Exception as e:
+                        yield index, None, e
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def get_stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "max_concurrency": self.max_concurrency,
+            "max_active": self.max_active,
+            "connections_opened": self.pool.opened,
+            "connections_reused": self.pool.reused,
+            "request_seconds": self.request_seconds,
+            "rate_limit_remaining": self.rate_limit[0] if self.rate_limit else None
+        }
+
+    def format_stats(self) -> str:
+        stats = self.get_stats()
+        return (f"GitHub API: {stats['requests']} requests ({stats['coalesced']} coalesced), "
+                f"up to {stats['max_active']}/{stats['max_concurrency']} at a time, "
+                f"{stats['connections_opened']} connections opened, {stats['connections_reused']} reused")
+
+    def close(self) -> None:
+        """Close the pooled connections and stop the loop's thread."""
+        if self.loop.is_closed():
+            return
+
+        async def close_pool():
+            self.pool.close()
+        self.run(close_pool())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+async_github_client = None
+async_github_client_lock = threading.Lock()
+
+def get_async_github_client() -> Optional[AsyncGitHubClient]:
+    """The process-wide client, or None unless configure_async_github_client enabled it."""
+    with async_github_client_lock:
+        return async_github_client
+
+def configure_async_github_client(config: Dict) -> Optional[AsyncGitHubClient]:
+    """
+    (Re)create the process-wide client from the 'async_api', 'access_token', 'api_url' and
+    'api_concurrency' config keys; None (and no client) when 'async_api' is off. JSON responses go
+    through the process-wide HTTP cache, so configure_http_cache first.
+    """
+    global async_github_client
+    with async_github_client_lock:
+        if async_github_client is not None:
+            async_github_client.close()
+            async_github_client = None
+        if config.get("async_api", False):
+            async_github_client = AsyncGitHubClient(token=config.get("access_token") or None,
+                                                    base_url=config.get("api_url", "https://api.github.com"),
+                                                    max_concurrency=config.get("api_concurrency", 16),
+                                                    cache=get_http_cache())
+        return async_github_client
+
+def shutdown_async_github_client() -> None:
+    """Close the process-wide client."""
+    global async_github_client
+    with async_github_client_lock:
+        if async_github_client is not None:
+            async_github_client.close()
+            async_github_client = None
@@ -0,0 +1,81 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import threading
+from typing import Any, Dict, Iterator
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester
+from Cache.HTTPResponseCache import get_http_cache
+
+class CachedResponse:
+    """A stored response, shaped like the responses of PyGithub's connection classes."""
+    def __init__(self, headers: Dict[str, str], body: bytes):
+        self.status = 200
+        self.headers = headers
+        self.body = body
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self) -> str:
+        return self.body.decode("utf-8")
+
+    def iter_content(self, chunk_size: int = 1) -> Iterator[bytes]:
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def raise_for_status(self) -> None:
+        pass
+
+class ConditionalRequestMixin:
+    """
+    Sends PyGithub's GETs through the process-wide HTTPResponseCache: fresh responses are replayed
+    without a request, stale ones are revalidated and replayed on 304. Writes drop the cached
+    responses of their path. Without a cache, requests pass through unchanged.
+    """
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        # PyGithub shares one connection between threads; what a request looked up is per thread
+        self.cache_state = threading.local()
+
+    def request(self, verb: str, url: str, input: Any, headers: Dict[str, str], stream: bool = False) -> None:
+        cache = get_http_cache()
+        state = self.cache_state
+        state.cache, state.key, state.entry = cache, None, None
+        state.url = f"{self.protocol}://{self.host}:{self.port}{url}"
+        if cache is not None and verb != "GET":
+            cache.invalidate(url)
+        elif cache is not None and not stream:
+            state.key = cache.get_key(state.url, headers)
+            state.entry = cache.lookup(state.key)
+            if state.entry is not None and not state.entry["fresh"]:
+                headers = {**headers, **cache.get_conditional_headers(state.entry)}
+        super().request(verb, url, input, headers, stream)
+
+    def getresponse(self):
+        state = self.cache_state
+        cache, key, entry = state.cache, state.key, state.entry
+        if key is None:
+            return super().getresponse()
+        if entry is not None and entry["fresh"]:
+            return CachedResponse(*cache.replay(key, entry))
+        response = super().getresponse()
+        if response.status == 304 and entry is not None:
+            return CachedResponse(*cache.replay(key, entry, dict(response.headers)))
+        if response.status == 200:
+            cache.store(key, state.url, dict(response.headers), response.response.content)
+        return response
+
+class CachedHTTPSRequestsConnection(ConditionalRequestMixin, HTTPSRequestsConnectionClass):
+    pass
+
+class CachedHTTPRequestsConnection(ConditionalRequestMixin, HTTPRequestsConnectionClass):
+    pass
+
+def install_cached_connections() -> None:
+    """
+    Make PyGithub clients created from now on use the cached connection classes. PyGithub only lets
+    them be replaced through its testing hook, which also turns off connection reuse between
+    requests; reuse is turned back on.
+    """
+    Requester.injectConnectionClasses(CachedHTTPRequestsConnection, CachedHTTPSRequestsConnection)
+    Requester._Requester__persist = True
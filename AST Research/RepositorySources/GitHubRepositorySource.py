@@ -0,0 +1,115 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import urllib.request
+from datetime import datetime
+from typing import Iterator, List, Optional, Set, Tuple
+from github import Repository, GithubException
+from RepositorySources.RepositorySource import RepositorySource, SourceCommit, TreeEntry, ChangedFile, iter_tar_files
+from RepositorySources.AsyncGitHubClient import AsyncGitHubClient
+
+# GitHub lists at most this many files of a commit; larger diffs are incomplete
+max_commit_files = 3000
+# ... and at most this many commits of a comparison
+max_compare_commits = 10000
+# Source code shrinks about this much in a gzipped tarball
+archive_compression_ratio = 4
+# Seconds without data before an archive download is given up
+archive_timeout = 60
+
+class GitHubRepositorySource(RepositorySource):
+    """
+    Reads a repository through the GitHub REST API (one request per tree, commit diff and file).
+    Whole snapshots can also be read from one tarball download per commit, see iter_archive.
+    With an AsyncGitHubClient, commit lists, trees and blobs are read through it instead of
+    PyGithub: pooled connections, a process-wide cap on requests in flight, and blobs of a
+    commit requested concurrently.
+    """
+    def __init__(self, repo: Repository, client: Optional[AsyncGitHubClient] = None):
+        self.repo = repo
+        self.full_name = repo.full_name
+        self.client = client
+        # ((base, head), Comparison) of the last compare call; finding the merge base and walking
+        # the new commits usually need the same comparison
+        self.last_comparison = None
+        # (commit SHA, total size of its blobs) of the last tree listed
+        self.last_tree_size = None
+
+    def get_branch_head(self, branch_name: str) -> str:
+        return self.repo.get_branch(branch_name).commit.sha
+
+    def get_commits(self, branch_name: str) -> List[SourceCommit]:
+        if self.client is not None:
+            return [SourceCommit(commit["sha"], datetime.fromisoformat(commit["commit"]["author"]["date"].replace("Z", "+00:00")),
+                                 [parent["sha"] for parent in commit["parents"]])
+                    for commit in self.client.run(self.client.get_commits(self.full_name, branch_name))]
+        return [SourceCommit(commit.sha, commit.commit.author.date, [parent.sha for parent in commit.parents])
+                for commit in self.repo.get_commits(sha=branch_name)]
+
+    def _compare(self, base_sha: str, head_sha: str):
+        if self.last_comparison is None or self.last_comparison[0] != (base_sha, head_sha):
+            self.last_comparison = ((base_sha, head_sha), self.repo.compare(base_sha, head_sha))
+        return self.last_comparison[1]
+
+    def iter_commits(self, head_sha: str, since_sha: Optional[str] = None) -> Iterator[SourceCommit]:
+        if since_sha is not None:
+            comparison = self._compare(since_sha, head_sha)
+            # Comparisons list commits oldest first, page by page
+            if comparison.total_commits <= max_compare_commits:
+                for commit in comparison.commits:
+                    yield SourceCommit(commit.sha, commit.commit.author.date, [parent.sha for parent in commit.parents])
+                return
+        # The commits API only lists newest first, so the whole history has to be read before the first yield
+        yield from reversed(self.get_commits(head_sha))
+
+    def get_merge_base(self, sha: str, other_sha: str) -> Optional[str]:
+        try:
+            return self._compare(sha, other_sha).merge_base_commit.sha
+        except GithubException as e:
+            print(f"Error comparing {sha[:8]}...{other_sha[:8]}: {e}")
+            return None
+
+    def get_changed_files(self, commit: SourceCommit) -> Optional[List[ChangedFile]]:
+        files = [ChangedFile(file.status, file.filename, file.sha, file.previous_filename)
+                 for file in self.repo.get_commit(commit.sha).files]
+        if len(files) >= max_commit_files:
+            return None
+        return files
+
+    def get_tree(self, commit_sha: str) -> List[TreeEntry]:
+        if self.client is not None:
+            blobs = [item for item in self.client.run(self.client.get_tree(self.full_name, commit_sha))["tree"]
+                     if item["type"] == "blob"]
+            self.last_tree_size = (commit_sha, sum(item.get("size") or 0 for item in blobs))
+            return [TreeEntry(item["path"], item["sha"]) for item in blobs]
+        tree = self.repo.get_git_tree(commit_sha, recursive=True).tree
+        blobs = [item for item in tree if item.type == "blob"]
+        self.last_tree_size = (commit_sha, sum(item.size or 0 for item in blobs))
+        return [TreeEntry(item.path, item.sha) for item in blobs]
+
+    def read_file(self, path: str, commit_sha: str, blob_sha: Optional[str] = None) -> bytes:
+        if self.client is not None and blob_sha:
+            return self.client.run(self.client.get_blob(self.full_name, blob_sha))
+        return self.repo.get_contents(path, ref=commit_sha).decoded_content
+
+    def read_files(self, files: List[TreeEntry], commit_sha: str) -> Iterator[Tuple[TreeEntry, Optional[bytes], Optional[Exception]]]:
+        """With a client, every blob is requested on its loop (no thread per request) and yielded as it arrives."""
+        if self.client is None or not all(file.sha for file in files):
+            yield from super().read_files(files, commit_sha)
+            return
+        for index, data, error in self.client.iter_blobs(self.full_name, [file.sha for file in files]):
+            yield files[index], data, error
+
+    def get_archive_size(self, commit_sha: str) -> Optional[int]:
+        """The compressed size of the commit's blobs, from its tree listing (one request unless just listed)."""
+        last_tree_size = self.last_tree_size
+        if last_tree_size is None or last_tree_size[0] != commit_sha:
+            self.get_tree(commit_sha)
+            last_tree_size = self.last_tree_size
+        return last_tree_size[1] // archive_compression_ratio
+
+    def iter_archive(self, commit_sha: str, paths: Optional[Set[str]] = None) -> Iterator[Tuple[str, bytes]]:
+        # The archive link redirects to a short-lived download URL that needs no further authentication
+        url = self.repo.get_archive_link("tarball", ref=commit_sha)
+        with urllib.request.urlopen(url, timeout=archive_timeout) as response:
+            yield from iter_tar_files(response, paths)
@@ -0,0 +1,145 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import re
+import subprocess
+import threading
+from datetime import datetime
+from typing import Iterator, List, Optional
+from RepositorySources.RepositorySource import RepositorySource, SourceCommit, TreeEntry, ChangedFile
+
+# git diff-tree status letters -> GitHub file statuses
+diff_statuses = {
+    "A": "added",
+    "M": "modified",
+    "D": "removed",
+    "R": "renamed",
+    "C": "copied",
+    "T": "changed"
+}
+# sha NUL parents NUL author date, one commit per line
+commit_format = "%H%x00%P%x00%aI"
+# Tree of an empty repository, used as the "parent" of root commits
+empty_tree_sha = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+class LocalGitRepositorySource(RepositorySource):
+    """
+    Reads a local clone or bare mirror with git plumbing: history from git log, trees from
+    git ls-tree and blobs straight from the object database through one long-lived
+    git cat-file --batch process. No network and no API rate limit.
+    """
+    def __init__(self, path: str, full_name: Optional[str] = None, repo=None):
+        self.path = path
+        # Optional GitHub repository, only needed to save metrics online
+        self.repo = repo
+        self.full_name = full_name or (repo.full_name if repo is not None else self._guess_full_name())
+        self.cat_file = None
+        self.cat_file_lock = threading.Lock()
+
+    def _git(self, *args: str) -> bytes:
+        return subprocess.run(["git", "-C", self.path, *args], capture_output=True, check=True).stdout
+
+    def _guess_full_name(self) -> str:
+        """owner/repo from the origin URL, or the folder name if there is no origin."""
+        try:
+            url = self._git("config", "--get", "remote.origin.url").decode().strip()
+            match = re.search(r"[:/]([^/:]+/[^/]+?)(?:\.git)?/?$", url)
+            if match:
+                return match.group(1)
+        except subprocess.CalledProcessError:
+            pass
+        return os.path.basename(os.path.abspath(self.path).rstrip("/")).removesuffix(".git")
+
+    def fetch(self) -> None:
+        """Bring the clone up to date with its origin (including PR heads if the mirror fetches them)."""
+        try:
+            self._git("fetch", "--quiet", "--prune", "origin")
+        except subprocess.CalledProcessError as e:
+            print(f"Error fetching {self.path}: {e.stderr.decode(errors='replace').strip()}")
+
+    def _resolve(self, branch_name: str) -> str:
+        # Clones keep remote branches under origin/, mirrors keep them as local branches
+        for ref in (branch_name, f"origin/{branch_name}"):
+            try:
+                return self._git("rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}").decode().strip()
+            except subprocess.CalledProcessError:
+                continue
+        raise ValueError(f"Branch {branch_name} not found in {self.path}")
+
+    def get_branch_head(self, branch_name: str) -> str:
+        return self._resolve(branch_name)
+
+    @staticmethod
+    def _parse_commit(line: str) -> SourceCommit:
+        sha, parents, date = line.rstrip("\n").split("\0")
+        return SourceCommit(sha, datetime.fromisoformat(date), parents.split())
+
+    def get_commits(self, branch_name: str) -> List[SourceCommit]:
+        output = self._git("log", f"--format={commit_format}", self._resolve(branch_name)).decode()
+        return [self._parse_commit(line) for line in output.splitlines()]
+
+    def iter_commits(self, head_sha: str, since_sha: Optional[str] = None) -> Iterator[SourceCommit]:
+        revisions = f"{since_sha}..{head_sha}" if since_sha else head_sha
+        # Read git log as it writes instead of holding the whole history in memory
+        with subprocess.Popen(["git", "-C", self.path, "log", "--reverse", f"--format={commit_format}", revisions],
+                              stdout=subprocess.PIPE) as process:
+            for line in process.stdout:
+                yield self._parse_commit(line.decode())
+
+    def get_merge_base(self, sha: str, other_sha: str) -> Optional[str]:
+        try:
+            return self._git("merge-base", sha, other_sha).decode().strip() or None
+        except subprocess.CalledProcessError:
+            return None
+
+    def get_changed_files(self, commit: SourceCommit) -> Optional[List[ChangedFile]]:
+        parent = commit.parents[0] if commit.parents else empty_tree_sha
+        fields = self._git("diff-tree", "-r", "-M", "-z", "--no-commit-id", parent, commit.sha).decode().split("\0")
+        files = []
+        i = 0
+        # -z output: ":old_mode new_mode old_sha new_sha status", then one path (two for renames/copies)
+        while i < len(fields) - 1:
+            meta = fields[i].split()
+            new_sha, status = meta[3], meta[4]
+            if status[0] in "RC":
+                previous_filename, filename = fields[i + 1], fields[i + 2]
+                i += 3
+            else:
+                previous_filename, filename = None, fields[i + 1]
+                i += 2
+            files.append(ChangedFile(diff_statuses.get(status[0], "modified"), filename, new_sha, previous_filename))
+        return files
+
+    def get_tree(self, commit_sha: str) -> List[TreeEntry]:
+        entries = []
+        for line in self._git("ls-tree", "-r", "-z", commit_sha).decode().split("\0"):
+            if not line:
+                continue
+            meta, path = line.split("\t", 1)
+            mode, object_type, sha = meta.split()
+            if object_type == "blob":
+                entries.append(TreeEntry(path, sha))
+        return entries
+
+    def read_file(self, path: str, commit_sha: str, blob_sha: Optional[str] = None) -> bytes:
+        name = blob_sha or f"{commit_sha}:{path}"
+        with self.cat_file_lock:
+            if self.cat_file is None:
+                self.cat_file = subprocess.Popen(["git", "-C", self.path, "cat-file", "--batch"],
+                                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.cat_file.stdin.write(name.encode() + b"\n")
+            self.cat_file.stdin.flush()
+            header = self.cat_file.stdout.readline().split()
+            if len(header) != 3:
+                raise FileNotFoundError(f"{path} not found at {commit_sha[:8]} in {self.path}")
+            data = self.cat_file.stdout.read(int(header[2]))
+            # Each object is followed by a newline
+            self.cat_file.stdout.read(1)
+        return data
+
+    def close(self) -> None:
+        with self.cat_file_lock:
+            if self.cat_file is not None:
+                self.cat_file.stdin.close()
+                self.cat_file.wait()
+                self.cat_file = None
@@ -0,0 +1,238 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# (requests remaining, requests per window, epoch seconds the window resets at)
+RateLimit = Tuple[int, int, float]
+
+def get_github_rate_limit(github_client, client=None) -> Optional[RateLimit]:
+    """
+    The core API rate limit of a token as last reported by the response headers of a PyGithub
+    client and, if given, an AsyncGitHubClient using the same token. The reading of the latest
+    window wins, and within a window the lower remaining count. No request is made once either
+    client has received a response.
+    """
+    limits = []
+    try:
+        remaining, limit = github_client.rate_limiting
+        limits.append((remaining, limit, float(github_client.rate_limiting_resettime)))
+    except Exception as e:
+        print(f"Error reading the GitHub rate limit: {e}")
+    if client is not None and client.rate_limit is not None and client.rate_limit[1] > 0:
+        limits.append(client.rate_limit)
+    if not limits:
+        return None
+    return max(limits, key=lambda rate_limit: (rate_limit[2], -rate_limit[0]))
+
+class RequestBudget:
+    """
+    Requests one repository may spend in a scheduling cycle. Spending is charged from the rate limit
+    the API reports, which also counts other clients of the token (e.g. the other server), so the
+    charge errs on the safe side. An allowance of None (the rate limit is unknown) never runs out.
+    """
+    def __init__(self, scheduler: "RateLimitScheduler", repo_name: str, allowance: Optional[int],
+                 rate_limit: Optional[RateLimit]):
+        self.scheduler = scheduler
+        self.repo_name = repo_name
+        self.allowance = allowance
+        self.used = 0
+        self.last = rate_limit
+        # Set once work was left for a later cycle
+        self.stopped = False
+
+    def charge(self) -> None:
+        """Add the requests spent since the last reading."""
+        rate_limit = self.scheduler.observe()
+        if rate_limit is None:
+            return
+        if self.last is not None:
+            if rate_limit[2] == self.last[2]:
+                self.used += max(0, self.last[0] - rate_limit[0])
+            else:
+                # A new window started; what it's missing was spent since
+                self.used += max(0, rate_limit[1] - rate_limit[0])
+        self.last = rate_limit
+
+    def exhausted(self) -> bool:
+        """
+        Whether the repository should stop for now: its allowance is spent, or the token is down to
+        the reserve and the window doesn't reset within the scheduler's max wait. A reset that is
+        close enough is waited for instead, and the allowance grows by a share of the new window.
+        """
+        self.charge()
+        if self.allowance is None or self.last is None:
+            return False
+        if self.last[0] <= self.scheduler.get_reserve(self.last[1]):
+            if not self.scheduler.wait_for_reset(self.last):
+                return True
+            self.last = self.scheduler.observe()
+            allowance = self.scheduler.get_allowance(self.repo_name, self.last)
+            self.allowance = None if allowance is None else self.used + allowance
+        return self.allowance is not None and self.used >= self.allowance
+
+    def limit(self, items: Iterable) -> Iterator:
+        """Yield items (commits, pull requests) until the budget is exhausted."""
+        for item in items:
+            if self.exhausted():
+                self.stopped = True
+                print(f"Rate limit: {self.repo_name} spent {self.used} of its {self.allowance} requests, "
+                      f"leaving the rest for a later run")
+                return
+            yield item
+
+class RateLimitScheduler:
+    """
+    Shares the GitHub API rate limit between the repositories a server processes, so one large
+    backfill can't spend the whole window and make every other repository fail.
+    Each cycle, repositories are ordered by priority, then those whose last run was cut short or
+    deferred, then the least recently served. Each is granted its priority-weighted share of what is
+    left above a reserve (kept for the other server and for saving results), and unused shares flow
+    to the repositories after it. A repository without a share is deferred to the next cycle.
+    What each repository spent and whether it finished is persisted between runs.
+    """
+    def __init__(self, get_rate_limit: Callable[[], Optional[RateLimit]], state_file: str = "rate_limit_state.json",
+                 priorities: Optional[Dict[str, float]] = None, reserve: float = 0.1, max_wait_minutes: float = 15):
+        self.get_rate_limit = get_rate_limit
+        self.file_path = Path(state_file)
+        # Repository -> weight of its share (default 1); higher weights are also served first
+        self.priorities = priorities or {}
+        # Fraction of the limit never spent by this server
+        self.reserve = reserve
+        # A window resetting sooner than this is waited for instead of stopping work
+        self.max_wait = max_wait_minutes * 60
+        self.pending: List[str] = []
+        self.state = {"rate_limit": None, "repositories": {}}
+        self.load()
+
+    @classmethod
+    def from_config(cls, config: Dict, get_rate_limit: Callable[[], Optional[RateLimit]],
+                    state_file: str = "rate_limit_state.json") -> "RateLimitScheduler":
+        """
+        Create a scheduler from the 'rate_limit_state', 'repository_priorities', 'rate_limit_reserve'
+        and 'rate_limit_max_wait_minutes' config keys.
+        """
+        return cls(get_rate_limit,
+                   state_file=config.get("rate_limit_state", state_file),
+                   priorities=config.get("repository_priorities"),
+                   reserve=config.get("rate_limit_reserve", 0.1),
+                   max_wait_minutes=config.get("rate_limit_max_wait_minutes", 15))
+
+    def observe(self) -> Optional[RateLimit]:
+        """
+        The current rate limit. Without a reading, the last one persisted is used while its window
+        lasts; a window that has reset since its last reading is assumed full again.
+        """
+        rate_limit = None
+        try:
+            rate_limit = self.get_rate_limit()
+        except Exception as e:
+            print(f"Error reading the GitHub rate limit: {e}")
+        if rate_limit is None or rate_limit[1] <= 0:
+            rate_limit = self.state["rate_limit"] and tuple(self.state["rate_limit"])
+            if not rate_limit or rate_limit[2] <= time.time():
+                return None
+        if rate_limit[2] <= time.time():
+            rate_limit = (rate_limit[1], rate_limit[1], rate_limit[2])
+        self.state["rate_limit"] = list(rate_limit)
+        return rate_limit
+
+    def get_priority(self, repo_name: str) -> float:
+        return float(self.priorities.get(repo_name, 1))
+
+    def get_reserve(self, limit: int) -> int:
+        return int(limit * self.reserve)
+
+    def get_allowance(self, repo_name: str, rate_limit: Optional[RateLimit]) -> Optional[int]:
+        """A repository's priority-weighted share, among the repositories still pending, of what is left above the reserve."""
+        if rate_limit is None:
+            return None
+        spendable = rate_limit[0] - self.get_reserve(rate_limit[1])
+        weights = self.get_priority(repo_name) + sum(self.get_priority(name) for name in self.pending if name != repo_name)
+        return max(0, int(spendable * self.get_priority(repo_name) / weights))
+
+    def plan(self, repo_names: Iterable[str]) -> List[str]:
+        """Start a cycle and return its repositories in the order they should be processed."""
+        repositories = self.state["repositories"]
+
+        def order(repo_name: str):
+            entry = repositories.get(repo_name, {})
+            return (-self.get_priority(repo_name), entry.get("complete", False), entry.get("last_served", ""))
+        self.pending = sorted(repo_names, key=order)
+        return list(self.pending)
+
+    def wait_for_reset(self, rate_limit: RateLimit) -> bool:
+        """Sleep until the window resets if that is at most max_wait away; False without waiting otherwise."""
+        wait = rate_limit[2] - time.time() + 1
+        if wait > self.max_wait:
+            return False
+        if wait > 0:
+            print(f"Rate limit: {rate_limit[0]} requests left, pausing {wait:.0f}s until the window resets")
+            time.sleep(wait)
+        return True
+
+    def acquire(self, repo_name: str) -> Optional[RequestBudget]:
+        """Grant a repository its share of the cycle, or defer it (None) if there is no share to give."""
+        rate_limit = self.observe()
+        allowance = self.get_allowance(repo_name, rate_limit)
+        if allowance == 0 and self.wait_for_reset(rate_limit):
+            rate_limit = self.observe()
+            allowance = self.get_allowance(repo_name, rate_limit)
+        if repo_name in self.pending:
+            self.pending.remove(repo_name)
+        if allowance == 0:
+            self.defer(repo_name)
+            return None
+        return RequestBudget(self, repo_name, allowance, rate_limit)
+
+    def defer(self, repo_name: str) -> None:
+        """Skip a repository this cycle; it goes before the repositories that finished next cycle."""
+        entry = self.state["repositories"].setdefault(repo_name, {})
+        entry["complete"] = False
+        entry["deferred"] = entry.get("deferred", 0) + 1
+        rate_limit = self.state["rate_limit"]
+        print(f"Rate limit: deferring {repo_name}, {rate_limit[0] if rate_limit else '?'} requests left "
+              f"until {datetime.fromtimestamp(rate_limit[2]).isoformat() if rate_limit else '?'}")
+        self.save()
+
+    def release(self, budget: RequestBudget, complete: bool = True) -> None:
+        """Record what a repository spent and whether its work was finished, and persist the state."""
+        budget.charge()
+        entry = self.state["repositories"].setdefault(budget.repo_name, {})
+        entry["requests"] = entry.get("requests", 0) + budget.used
+        entry["last_requests"] = budget.used
+        entry["last_served"] = datetime.now().isoformat()
+        entry["complete"] = complete and not budget.stopped
+        self.save()
+
+    def format_stats(self) -> str:
+        rate_limit = self.state["rate_limit"]
+        if rate_limit is None:
+            return "Rate limit: unknown"
+        repositories = self.state["repositories"]
+        spent = ", ".join(f"{name} {entry.get('last_requests', 0)}" + ("" if entry.get("complete", False) else " (unfinished)")
+                          for name, entry in repositories.items())
+        return (f"Rate limit: {rate_limit[0]}/{rate_limit[1]} requests left until "
+                f"{datetime.fromtimestamp(rate_limit[2]).isoformat()}; last spent: {spent or 'nothing'}")
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.state = {"rate_limit": data.get("rate_limit"), "repositories": data.get("repositories", {})}
+        except Exception as e:
+            print(f"Error loading rate limit state {self.file_path}: {e}")
+
+    def save(self) -> None:
+        try:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file_path, 'w', encoding='utf-8') as f:
+                json.dump({**self.state, "updated": datetime.now().isoformat()}, f, indent=4)
+        except Exception as e:
+            print(f"Error saving rate limit state {self.file_path}: {e}")
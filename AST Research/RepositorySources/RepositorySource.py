@@ -0,0 +1,100 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import tarfile
+from collections import namedtuple
+from typing import BinaryIO, Iterator, List, Optional, Set, Tuple
+from MetricsClasses.SharedExecutor import get_shared_executor
+
+# A commit of the walked history; parents are commit SHAs, first parent first
+SourceCommit = namedtuple("SourceCommit", ["sha", "date", "parents"])
+# A file of a commit's tree, with its git blob SHA
+TreeEntry = namedtuple("TreeEntry", ["path", "sha"])
+# A file touched by a commit: status is "added", "modified", "removed", "renamed", ... (GitHub's names)
+ChangedFile = namedtuple("ChangedFile", ["status", "filename", "sha", "previous_filename"])
+
+class RepositorySource:
+    """
+    Where BranchMetrics and PullRequestMetrics read history and file contents from.
+    full_name is "owner/repo" and names the metrics output folders. repo is the GitHub
+    repository used to save metrics online, or None when the source has no GitHub side.
+    """
+    full_name: str = ""
+    repo = None
+
+    def get_branch_head(self, branch_name: str) -> str:
+        """SHA of the commit a branch points to. Raises if the branch doesn't exist."""
+        raise NotImplementedError
+
+    def get_commits(self, branch_name: str) -> List[SourceCommit]:
+        """Every commit reachable from a branch, newest first."""
+        raise NotImplementedError
+
+    def iter_commits(self, head_sha: str, since_sha: Optional[str] = None) -> Iterator[SourceCommit]:
+        """
+        Stream the commits reachable from head_sha but not from since_sha, oldest first.
+        Without since_sha this is the whole history.
+        """
+        raise NotImplementedError
+
+    def get_merge_base(self, sha: str, other_sha: str) -> Optional[str]:
+        """Best common ancestor of two commits, or None if there is none (or sha no longer exists)."""
+        raise NotImplementedError
+
+    def get_changed_files(self, commit: SourceCommit) -> Optional[List[ChangedFile]]:
+        """Files changed by a commit relative to its first parent, or None if the list is incomplete."""
+        raise NotImplementedError
+
+    def get_tree(self, commit_sha: str) -> List[TreeEntry]:
+        """Every file of a commit's tree, recursively, in path order."""
+        raise NotImplementedError
+
+    def read_file(self, path: str, commit_sha: str, blob_sha: Optional[str] = None) -> bytes:
+        """Raw bytes of a file at a commit. Sources that can read blobs directly use blob_sha."""
+        raise NotImplementedError
+
+    def read_files(self, files: List[TreeEntry], commit_sha: str) -> Iterator[Tuple[TreeEntry, Optional[bytes], Optional[Exception]]]:
+        """
+        Read many files of a commit, yielding (file, bytes, None) or (file, None, error) as they arrive.
+        By default read_file calls run in parallel on the shared I/O executor, in input order.
+        """
+        def read(file: TreeEntry):
+            try:
+                return file, self.read_file(file.path, commit_sha, file.sha), None
+            except Exception as e:
+                return file, None, e
+        yield from get_shared_executor().map(read, files)
+
+    def get_archive_size(self, commit_sha: str) -> Optional[int]:
+        """Estimated download size of a commit's archive, or None if the source has no archives."""
+        return None
+
+    def iter_archive(self, commit_sha: str, paths: Optional[Set[str]] = None) -> Iterator[Tuple[str, bytes]]:
+        """Stream (path, raw bytes) of the files of a commit from one archive download, limited to paths."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release anything the source holds open."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def iter_tar_files(fileobj: BinaryIO, paths: Optional[Set[str]] = None) -> Iterator[Tuple[str, bytes]]:
+    """
+    Read a (compressed) tar stream front to back and yield (path, bytes) of its regular files as
+    they stream past, without extracting anything to disk or seeking. The single top-level folder
+    archives put everything under ("<owner>-<repo>-<sha>/" for GitHub) is stripped from paths.
+    """
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            path = member.name.split("/", 1)[1] if "/" in member.name else member.name
+            if paths is not None and path not in paths:
+                continue
+            yield path, archive.extractfile(member).read()
@@ -4,20 +4,30 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from github import Github
 from Branch.BranchMetrics import MainBranchMetrics
 from Branch.MetricsDataFrames import MetricsDataFrames
+from Cache.BlobMetricsCache import BlobMetricsCache
+from Cache.SQLiteMetricsCache import SQLiteMetricsCache
+from RepositorySources.LocalGitRepositorySource import LocalGitRepositorySource
 
 # ======== SETUP ========
 ACCESS_TOKEN = "GitHub Personal Access Token"  # Replace this when testing
 REPO_NAME = "dipenarathod/desktop-tutorial"  # Format: "username/reponame"
 SAVE_TO_REPO = False  # Set to True if you want to save results
+CACHE_PATH = "metrics_cache.sqlite"  # Same cache file as the metrics servers
+LOCAL_CLONE_PATH = None  # Path to a local clone of REPO_NAME to read it offline instead of through the API
 
 # ======== STEP 1: INITIALIZE GITHUB + MAIN METRICS PROCESSOR ========
-g = Github(ACCESS_TOKEN)
-repo = g.get_repo(REPO_NAME)
+if LOCAL_CLONE_PATH:
+    repo = LocalGitRepositorySource(LOCAL_CLONE_PATH, full_name=REPO_NAME)
+else:
+    g = Github(ACCESS_TOKEN)
+    repo = g.get_repo(REPO_NAME)
 
-main_metrics = MainBranchMetrics(repo, save_online=False,save=True)
+metrics_store = SQLiteMetricsCache(CACHE_PATH)
+main_metrics = MainBranchMetrics(repo, save_online=False,save=True, cache=BlobMetricsCache(store=metrics_store))
 
 # # ======== STEP 2: CALCULATE METRICS ========
 main_metrics.calculate_metrics()
+print(metrics_store.format_stats())
 
 # ======== STEP 3: READ JSON FILES BACK INTO DATAFRAMES ========
 # Use the convenience method to get file paths dynamically for each metric type
@@ -5,6 +5,8 @@ from github import Github
 from PullRequests.PullRequestMetrics import PullRequestMetrics
 from PullRequests.AllPullRequests import AllPullRequestMetrics
 from PullRequests.PullRequestMetricsDataFrames import PullRequestMetricsDataFrames
+from Cache.BlobMetricsCache import BlobMetricsCache
+from Cache.SQLiteMetricsCache import SQLiteMetricsCache
 
 g = Github("GitHub Personal Access Token")
 repo = g.get_repo("dipenarathod/desktop-tutorial")
@@ -16,8 +18,10 @@ repo = g.get_repo("dipenarathod/desktop-tutorial")
 # # pr_metrics = PullRequestMetrics(repo, pr, save_online=False,save=False)
 # # pr_metrics.calculate_metrics()
 
-all_pr_metrics=AllPullRequestMetrics(repo, save_online=True, save=True)
+metrics_store = SQLiteMetricsCache("metrics_cache.sqlite")  # Same cache file as the metrics servers
+all_pr_metrics=AllPullRequestMetrics(repo, save_online=True, save=True, cache=BlobMetricsCache(store=metrics_store))
 all_pr_metrics.calculate_all()
+print(metrics_store.format_stats())
 all_pr_metrics.save_by_metric_type()
 
 # comparison = pr_metrics.compare_to_main()
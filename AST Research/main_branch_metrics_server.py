@@ -14,6 +14,18 @@ from Branch.BranchMetrics import BranchMetrics
 from Branch.BranchMetrics import MainBranchMetrics
 from Branch.MetricsDataFrames import MetricsDataFrames
 from Branch.MetricsFileManager import MetricsFileManager
+from Branch.MetricsFileStore import MetricsFileStore
+from MetricsClasses.MetricsExecutor import MetricsExecutor
+from MetricsClasses.SharedExecutor import configure_shared_executor, shutdown_shared_executor
+from Cache.BlobMetricsCache import BlobMetricsCache
+from Cache.SQLiteMetricsCache import SQLiteMetricsCache
+from RepositorySources.RepositorySource import RepositorySource
+from RepositorySources.GitHubRepositorySource import GitHubRepositorySource
+from RepositorySources.AsyncGitHubClient import configure_async_github_client, get_async_github_client, shutdown_async_github_client
+from RepositorySources.RateLimitScheduler import RateLimitScheduler, RequestBudget, get_github_rate_limit
+from RepositorySources.CachedGitHubConnection import install_cached_connections
+from Cache.HTTPResponseCache import configure_http_cache, get_http_cache
+from RepositorySources.LocalGitRepositorySource import LocalGitRepositorySource
 
 # Configure logging
 logging.basicConfig(
@@ -40,9 +52,29 @@ class MetricsServer:
         """
         self.config_file = config_file
         self.config = self._load_config()
+        
+        # Conditional request cache for GitHub reads; it has to be installed before the clients are created
+        if configure_http_cache(self.config) is not None:
+            install_cached_connections()
         self.github_client = Github(self.config["access_token"])
         self.running = False
         
+        # Worker processes for metric analysis, kept alive between scheduled runs
+        self.executor = MetricsExecutor.from_config(self.config)
+        
+        # One bounded thread pool shared by file fetches and the pull request metrics writes
+        configure_shared_executor(self.config)
+        
+        #Pooled asyncio GitHub client used by the repository sources when "async_api" is on
+        configure_async_github_client(self.config)
+        
+        # Shares the API rate limit between the repositories and remembers what each spent between runs
+        self.scheduler = RateLimitScheduler.from_config(
+            self.config, lambda: get_github_rate_limit(self.github_client, get_async_github_client()))
+        
+        # On-disk metrics cache shared with the other server and the Testing Files scripts
+        self.metrics_store = SQLiteMetricsCache.from_config(self.config)
+        
     def _load_config(self) -> Dict:
         """Load configuration from file."""
         try:
@@ -76,43 +108,116 @@ class MetricsServer:
         except Exception as e:
             logger.error(f"Error saving configuration: {e}")
             
-    def process_repository(self, repo_name: str):
+    def get_repository_source(self, repo_name: str) -> RepositorySource:
+        """
+        Get the source to read a repository from: a local clone if one is configured, otherwise the GitHub API.
+        
+        Args:
+            repo_name: Full name of the repository (e.g., "owner/repo").
+        """
+        local_path = self.config.get("local_repositories", {}).get(repo_name)
+        if not local_path:
+            return GitHubRepositorySource(self.github_client.get_repo(repo_name), get_async_github_client())
+        
+        # The GitHub repository is only needed to save metrics online
+        repo = self.github_client.get_repo(repo_name) if self.config.get("save_online", False) else None
+        source = LocalGitRepositorySource(local_path, full_name=repo_name, repo=repo)
+        if self.config.get("fetch_local", True):
+            source.fetch()
+        return source
+    
+    def process_repository(self, repo_name: str, stale_only: bool = False, budget: Optional[RequestBudget] = None) -> bool:
         """
         Process a single repository.
         
         Args:
             repo_name: Full name of the repository (e.g., "owner/repo").
+            stale_only: Only recompute stored metrics whose analyzer version changed.
+            budget: The repository's share of the API rate limit; its branches stop when it runs out.
+        
+        Returns:
+            False if processing failed or a branch stopped early.
         """
         logger.info(f"Processing repository: {repo_name}")
+        complete = True
         try:
-            # Get the repository from GitHub
-            repo = self.github_client.get_repo(repo_name)
+            # Get the repository from a local clone or GitHub
+            source = self.get_repository_source(repo_name)
+            
+            try:
+                # Branches share most of their files, so they share one blob cache
+                cache = BlobMetricsCache(store=self.metrics_store, halstead_scopes=self.config.get("halstead_scopes", False),
+                                         metrics=self.config.get("metrics"),
+                                         max_entries=self.config.get("cache_memory_entries", 4096))
+                # Metrics files are loaded at most once while the repository is processed, then dropped,
+                # so the next run reads what other processes saved in the meantime
+                metrics_files = MetricsFileStore()
             
-            # Process each branch in the configuration
-            branches = self.config.get("branches", ["main"])
-            for branch_name in branches:
-                logger.info(f"Processing branch: {branch_name} in {repo_name}")
+                # Process each branch in the configuration
+                branches = self.config.get("branches", ["main"])
+                for branch_name in branches:
+                    logger.info(f"Processing branch: {branch_name} in {repo_name}")
                 
-                # Create metrics calculator for this branch
-                branch_metrics = MainBranchMetrics(
-                    repo, 
-                    save_online=self.config.get("save_online", False),
-                    save=True
-                ) if branch_name == "main" else BranchMetrics(
-                    repo, 
-                    branch_name=branch_name,
-                    save_online=self.config.get("save_online", False),
-                    save=True
-                )
+                    # Create metrics calculator for this branch
+                    branch_metrics = MainBranchMetrics(
+                        source, 
+                        save_online=self.config.get("save_online", False),
+                        save=True,
+                        executor=self.executor,
+                        cache=cache,
+                        pipeline_queue_size=self.config.get("pipeline_queue_size", 64),
+                        project_metrics=self.config.get("project_metrics", False),
+                        archive_min_files=self.config.get("archive_min_files", 32),
+                        archive_request_kb=self.config.get("archive_request_kb", 128),
+                        budget=budget,
+                        store=metrics_files
+                    ) if branch_name == "main" else BranchMetrics(
+                        source, 
+                        branch_name=branch_name,
+                        save_online=self.config.get("save_online", False),
+                        save=True,
+                        executor=self.executor,
+                        cache=cache,
+                        pipeline_queue_size=self.config.get("pipeline_queue_size", 64),
+                        project_metrics=self.config.get("project_metrics", False),
+                        archive_min_files=self.config.get("archive_min_files", 32),
+                        archive_request_kb=self.config.get("archive_request_kb", 128),
+                        budget=budget,
+                        store=metrics_files
+                    )
                 
-                # Calculate metrics
-                branch_metrics.calculate_metrics()
+                    # Calculate metrics
+                    if stale_only:
+                        branch_metrics.recalculate_stale_metrics()
+                    else:
+                        branch_metrics.calculate_metrics()
+                        if branch_metrics.pipeline_error is not None:
+                            # The branch is retried from its watermark next run
+                            logger.error(f"Error processing {repo_name}:{branch_name}: {branch_metrics.pipeline_error}")
+                            complete = False
                 
-                # Log completion
-                logger.info(f"Completed metrics calculation for {repo_name}:{branch_name}")
+                    # Log completion
+                    cache_stats = cache.get_stats()
+                    logger.info(f"Completed metrics calculation for {repo_name}:{branch_name} "
+                                f"(cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses)")
+                    if branch_metrics.pipeline_stats is not None:
+                        stages = branch_metrics.pipeline_stats["stages"]
+                        logger.info("Pipeline throughput: " + ", ".join(
+                            f"{stage} {stats['throughput']:.1f}/s (busy {stats['utilization']:.0%})"
+                            for stage, stats in stages.items()))
+            finally:
+                # Also when a branch raised: the git cat-file process or archive session must not leak
+                source.close()
+                # Access times of this repository's cache hits, so they count for eviction in other processes
+                self.metrics_store.flush_touches()
+            client = get_async_github_client()
+            if client is not None and not isinstance(source, LocalGitRepositorySource):
+                logger.info(client.format_stats())
                 
         except Exception as e:
             logger.error(f"Error processing repository {repo_name}: {e}")
+            return False
+        return complete
     
     def process_all_repositories(self):
         """Process all repositories in the configuration."""
@@ -123,9 +228,16 @@ class MetricsServer:
         self._update_status("running")
         
         try:
-            # Process each repository
-            for repo_name in self.config["repositories"]:
-                self.process_repository(repo_name)
+            # Each repository gets its share of the rate limit; those without one wait for the next run
+            for repo_name in self.scheduler.plan(self.config["repositories"]):
+                budget = self.scheduler.acquire(repo_name)
+                if budget is None:
+                    continue
+                complete = self.process_repository(repo_name, budget=budget)
+                self.scheduler.release(budget, complete)
+            logger.info(self.scheduler.format_stats())
+            if get_http_cache() is not None:
+                logger.info(get_http_cache().format_stats())
                 
             # Update the last run time in configuration
             self.config["last_run"] = datetime.now().isoformat()
@@ -143,6 +255,12 @@ class MetricsServer:
             logger.error(f"Error in processing repositories: {e}")
             self._update_status("error", {"error": str(e)})
     
+    def recompute_stale_metrics(self):
+        """Recompute metrics of all repositories that were stored by an older analyzer version."""
+        logger.info("Recomputing stale metrics for all repositories")
+        for repo_name in self.config["repositories"]:
+            self.process_repository(repo_name, stale_only=True)
+
     def _update_status(self, status: str, additional_info: Optional[Dict] = None):
         """
         Update the status file with current server status.
@@ -224,10 +342,17 @@ class MetricsServer:
             self.running = False
             self._update_status("error", {"error": str(e)})
     
+    def shutdown_executor(self):
+        """Stop the metric worker processes, the shared thread pool and the async GitHub client."""
+        self.executor.shutdown()
+        shutdown_shared_executor()
+        shutdown_async_github_client()
+
     def stop(self):
         """Stop the metrics server."""
         self.running = False
         logger.info("Server stopping...")
+        self.shutdown_executor()
         self._update_status("stopped")
 
 
@@ -240,7 +365,45 @@ def create_default_config(config_file: str = "config.json"):
             "interval_hours": 24,
             "output_dir": "metrics_output",
             "branches": ["main"],
-            "save_online": False
+            "save_online": False,
+            "workers": os.cpu_count(),
+            "chunk_size": 4,
+            "min_process_items": 8,
+            "halstead_scopes": False,
+            # Metric selection, e.g. ["Traditional.CC", "Traditional.LOC"]; None calculates everything
+            "metrics": None,
+            "io_workers": min(32, (os.cpu_count() or 1) + 4),
+            "max_in_flight": 64,
+            # Estimated memory of parsed trees each metrics process keeps for content analyzed again
+            "parse_cache_mb": 64,
+            # Fetched files held between the fetch, analyze and persist stages of a branch run
+            "pipeline_queue_size": 64,
+            # Also calculate project level Fan in, Fan out and CBO across modules (Project_Metrics.json)
+            "project_metrics": False,
+            # Commits needing this many files (0: never) are read from one tarball instead of one request
+            # per file, when the tarball is smaller than archive_request_kb per file
+            "archive_min_files": 32,
+            "archive_request_kb": 128,
+            # Read commits, trees and files through one pooled asyncio client instead of PyGithub
+            "async_api": False,
+            "api_url": "https://api.github.com",
+            # GitHub requests the async client keeps in flight at once
+            "api_concurrency": 16,
+            # Share of the rate limit per repository (default 1); higher priorities are also processed first
+            "repository_priorities": {},
+            # Fraction of the rate limit left for the other server; a reset closer than the max wait is waited for
+            "rate_limit_reserve": 0.1,
+            "rate_limit_max_wait_minutes": 15,
+            "rate_limit_state": "rate_limit_state.json",
+            # Conditional request cache of GitHub responses shared by both servers ("" turns it off)
+            "http_cache_path": "github_http_cache.sqlite",
+            "http_cache_max_mb": 64,
+            "cache_path": "metrics_cache.sqlite",
+            "cache_max_mb": 512,
+            # Blobs whose metrics are also kept in memory, in front of the cache file
+            "cache_memory_entries": 4096,
+            "local_repositories": {},
+            "fetch_local": True
         }
         
         with open(config_file, 'w') as f:
@@ -258,6 +421,9 @@ def main():
     parser.add_argument("--add-repo", help="Add a repository to the configuration")
     parser.add_argument("--remove-repo", help="Remove a repository from the configuration")
     
+    parser.add_argument("--cache-stats", action="store_true", help="Print metrics cache statistics and exit")
+    parser.add_argument("--recompute-stale", action="store_true", help="Recompute metrics stored by an older analyzer version and exit")
+    
     args = parser.parse_args()
     
     # Create default config if it doesn't exist
@@ -266,6 +432,17 @@ def main():
     # Create server instance
     server = MetricsServer(args.config)
     
+    if args.cache_stats:
+        print(server.metrics_store.format_stats())
+        if get_http_cache() is not None:
+            print(get_http_cache().format_stats())
+        return
+    
+    if args.recompute_stale:
+        server.recompute_stale_metrics()
+        server.shutdown_executor()
+        return
+    
     # Handle command line operations
     if args.add_repo:
         server.add_repository(args.add_repo)
@@ -275,6 +452,7 @@ def main():
         
     if args.run_once:
         server.process_all_repositories()
+        server.shutdown_executor()
     else:
         # Start the server
         server.start()
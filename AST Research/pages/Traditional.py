@@ -138,7 +138,7 @@ class TraditionalDataManager:
             return []
         
         # Define flat metrics that don't need prefixing
-        flat_metrics = ['LOC', 'Length of Identifier']
+        flat_metrics = ['LOC', 'Length of Identifier', 'Physical LOC', 'SLOC', 'Comment Lines', 'Blank Lines', 'Docstring Lines']
         
         result = []
         for metric_type, df in self.main_data[file_name].items():
@@ -156,7 +156,7 @@ class TraditionalDataManager:
             return None
         
         # Define flat metrics that don't need prefixing
-        flat_metrics = ['LOC', 'Length of Identifier']
+        flat_metrics = ['LOC', 'Length of Identifier', 'Physical LOC', 'SLOC', 'Comment Lines', 'Blank Lines', 'Docstring Lines']
         
         result_df = None
         for metric in selected_metrics:
@@ -196,7 +196,7 @@ class TraditionalDataManager:
             print(f"[TRADITIONAL PR] Available metric types: {list(file_data.keys())}")
             
             # Define flat metrics that don't need prefixing
-            flat_metrics = ['LOC', 'Length of Identifier']
+            flat_metrics = ['LOC', 'Length of Identifier', 'Physical LOC', 'SLOC', 'Comment Lines', 'Blank Lines', 'Docstring Lines']
             
             result_df = None
             for metric in selected_metrics:
@@ -11,6 +11,17 @@ from typing import Dict, List, Optional, Set
 
 #Import your existing classes
 from PullRequests.AllPullRequests import AllPullRequestMetrics
+from MetricsClasses.MetricsExecutor import MetricsExecutor
+from MetricsClasses.SharedExecutor import configure_shared_executor, shutdown_shared_executor
+from Cache.BlobMetricsCache import BlobMetricsCache
+from Cache.SQLiteMetricsCache import SQLiteMetricsCache
+from RepositorySources.RepositorySource import RepositorySource
+from RepositorySources.GitHubRepositorySource import GitHubRepositorySource
+from RepositorySources.AsyncGitHubClient import configure_async_github_client, get_async_github_client, shutdown_async_github_client
+from RepositorySources.RateLimitScheduler import RateLimitScheduler, RequestBudget, get_github_rate_limit
+from RepositorySources.CachedGitHubConnection import install_cached_connections
+from Cache.HTTPResponseCache import configure_http_cache, get_http_cache
+from RepositorySources.LocalGitRepositorySource import LocalGitRepositorySource
 
 #Configure logging
 logging.basicConfig(
@@ -37,9 +48,29 @@ class PRMetricsServer:
         """
         self.config_file = config_file
         self.config = self._load_config()
+        
+        #Conditional request cache for GitHub reads; it has to be installed before the clients are created
+        if configure_http_cache(self.config) is not None:
+            install_cached_connections()
         self.github_client = Github(self.config["access_token"])
         self.running = False
         
+        #Worker processes for metric analysis, kept alive between scheduled runs
+        self.executor = MetricsExecutor.from_config(self.config)
+        
+        #One bounded thread pool shared by file fetches and the pull request metrics writes
+        configure_shared_executor(self.config)
+        
+        #Pooled asyncio GitHub client used by the repository sources when "async_api" is on
+        configure_async_github_client(self.config)
+        
+        #Shares the API rate limit between the repositories and remembers what each spent between runs
+        self.scheduler = RateLimitScheduler.from_config(
+            self.config, lambda: get_github_rate_limit(self.github_client, get_async_github_client()), state_file="pr_rate_limit_state.json")
+        
+        #On-disk metrics cache shared with the other server and the Testing Files scripts
+        self.metrics_store = SQLiteMetricsCache.from_config(self.config)
+        
         #Track processed PRs to avoid recalculation
         self.processed_prs: Dict[str, List[int]] = {}
         
@@ -105,43 +136,69 @@ class PRMetricsServer:
         except Exception as e:
             logger.error(f"Error saving processed PRs: {e}")
     
-    def process_repository(self, repo_name: str):
+    def process_repository(self, repo_name: str, budget: Optional[RequestBudget] = None) -> bool:
         """
         Process pull requests for a single repository.
         
         Args:
             repo_name: Full name of the repository (e.g., "owner/repo").
+            budget: The repository's share of the API rate limit; PRs left when it runs out wait for the next run.
+        
+        Returns:
+            False if processing failed.
         """
         logger.info(f"Processing pull requests for repository: {repo_name}")
         try:
             #Get the repository from GitHub
             repo = self.github_client.get_repo(repo_name)
             
-            #Initialize repo in processed PRs if not exists
-            if repo_name not in self.processed_prs:
-                self.processed_prs[repo_name] = []
+            #PR files are read from a local mirror if one is configured (it has to fetch refs/pull/*/head)
+            local_path = self.config.get("local_repositories", {}).get(repo_name)
+            source = LocalGitRepositorySource(local_path, full_name=repo_name, repo=repo) if local_path else GitHubRepositorySource(repo, get_async_github_client())
+            if local_path and self.config.get("fetch_local", True):
+                source.fetch()
+            
+            try:
+                #Initialize repo in processed PRs if not exists
+                if repo_name not in self.processed_prs:
+                    self.processed_prs[repo_name] = []
             
-            #Get list of already processed PRs for this repository
-            processed_pr_numbers = set(self.processed_prs.get(repo_name, []))
+                #Get list of already processed PRs for this repository
+                processed_pr_numbers = set(self.processed_prs.get(repo_name, []))
             
-            #Get PR state from config (defaults to "open")
-            pr_state = self.config.get("pr_state", "open")
+                #Get PR state from config (defaults to "open")
+                pr_state = self.config.get("pr_state", "open")
             
-            #Log the processing strategy
-            logger.info(f"Processing all {pr_state} PRs for {repo_name} (skipping {len(processed_pr_numbers)} already processed)")
+                #Log the processing strategy
+                logger.info(f"Processing all {pr_state} PRs for {repo_name} (skipping {len(processed_pr_numbers)} already processed)")
             
-            #Create PR metrics calculator
-            pr_metrics = AllPullRequestMetrics(
-                repo, 
-                save_online=self.config.get("save_online", False),
-                save=True
-            )
+                #Create PR metrics calculator
+                pr_metrics = AllPullRequestMetrics(
+                    repo, 
+                    save_online=self.config.get("save_online", False),
+                    save=True,
+                    executor=self.executor,
+                    cache=BlobMetricsCache(store=self.metrics_store, halstead_scopes=self.config.get("halstead_scopes", False),
+                                           metrics=self.config.get("metrics"),
+                                           max_entries=self.config.get("cache_memory_entries", 4096)),
+                    source=source,
+                    client=get_async_github_client(),
+                    budget=budget
+                )
             
-            #Calculate metrics for unprocessed PRs only
-            pr_metrics.calculate_all(
-                skip_pr_numbers=processed_pr_numbers, 
-                pr_state=pr_state
-            )
+                #Calculate metrics for unprocessed PRs only
+                pr_metrics.calculate_all(
+                    skip_pr_numbers=processed_pr_numbers, 
+                    pr_state=pr_state
+                )
+            finally:
+                #Also when processing raised: the git cat-file process or archive session must not leak
+                source.close()
+                #Access times of this repository's cache hits, so they count for eviction in other processes
+                self.metrics_store.flush_touches()
+            client = get_async_github_client()
+            if client is not None:
+                logger.info(client.format_stats())
             
             #Save metrics by type if any PRs were processed
             if pr_metrics.pull_request_metrics:
@@ -162,6 +219,8 @@ class PRMetricsServer:
                 
         except Exception as e:
             logger.error(f"Error processing repository {repo_name}: {e}")
+            return False
+        return True
     
     def _update_processed_prs(self, repo_name: str, pr_numbers: List[int]):
         """Update the list of processed PRs for a repository."""
@@ -193,9 +252,16 @@ class PRMetricsServer:
         self._update_status("running")
         
         try:
-            #Process each repository
-            for repo_name in self.config["repositories"]:
-                self.process_repository(repo_name)
+            #Each repository gets its share of the rate limit; those without one wait for the next run
+            for repo_name in self.scheduler.plan(self.config["repositories"]):
+                budget = self.scheduler.acquire(repo_name)
+                if budget is None:
+                    continue
+                complete = self.process_repository(repo_name, budget=budget)
+                self.scheduler.release(budget, complete)
+            logger.info(self.scheduler.format_stats())
+            if get_http_cache() is not None:
+                logger.info(get_http_cache().format_stats())
                 
             #Update the last run time in configuration
             self.config["last_run"] = datetime.now().isoformat()
@@ -315,10 +381,17 @@ class PRMetricsServer:
             self.running = False
             self._update_status("error", {"error": str(e)})
     
+    def shutdown_executor(self):
+        """Stop the metric worker processes, the shared thread pool and the async GitHub client."""
+        self.executor.shutdown()
+        shutdown_shared_executor()
+        shutdown_async_github_client()
+
     def stop(self):
         """Stop the PR metrics server."""
         self.running = False
         logger.info("Server stopping...")
+        self.shutdown_executor()
         self._update_status("stopped")
 
 def create_default_config(config_file: str = "pr_config.json"):
@@ -332,7 +405,37 @@ def create_default_config(config_file: str = "pr_config.json"):
             "pr_state": "open",
             "use_days_lookback": False,
             "days_lookback": 30,
-            "save_online": False
+            "save_online": False,
+            "workers": os.cpu_count(),
+            "chunk_size": 4,
+            "min_process_items": 8,
+            "halstead_scopes": False,
+            # Metric selection, e.g. ["Traditional.CC", "Traditional.LOC"]; None calculates everything
+            "metrics": None,
+            "io_workers": min(32, (os.cpu_count() or 1) + 4),
+            "max_in_flight": 64,
+            # Estimated memory of parsed trees each metrics process keeps for content analyzed again
+            "parse_cache_mb": 64,
+            # Read commits, trees and files through one pooled asyncio client instead of PyGithub
+            "async_api": False,
+            "api_url": "https://api.github.com",
+            # GitHub requests the async client keeps in flight at once
+            "api_concurrency": 16,
+            # Share of the rate limit per repository (default 1); higher priorities are also processed first
+            "repository_priorities": {},
+            # Fraction of the rate limit left for the other server; a reset closer than the max wait is waited for
+            "rate_limit_reserve": 0.1,
+            "rate_limit_max_wait_minutes": 15,
+            "rate_limit_state": "pr_rate_limit_state.json",
+            # Conditional request cache of GitHub responses shared by both servers ("" turns it off)
+            "http_cache_path": "github_http_cache.sqlite",
+            "http_cache_max_mb": 64,
+            "cache_path": "metrics_cache.sqlite",
+            "cache_max_mb": 512,
+            # Blobs whose metrics are also kept in memory, in front of the cache file
+            "cache_memory_entries": 4096,
+            "local_repositories": {},
+            "fetch_local": True
         }
         
         with open(config_file, 'w') as f:
@@ -351,6 +454,8 @@ def main():
     parser.add_argument("--remove-repo", help="Remove a repository from the configuration")
     parser.add_argument("--reset-processed", help="Reset processed PRs for a repository (or 'all' for all repos)")
     
+    parser.add_argument("--cache-stats", action="store_true", help="Print metrics cache statistics and exit")
+    
     args = parser.parse_args()
     
     #Create default config if it doesn't exist
@@ -359,6 +464,12 @@ def main():
     #Create server instance
     server = PRMetricsServer(args.config)
     
+    if args.cache_stats:
+        print(server.metrics_store.format_stats())
+        if get_http_cache() is not None:
+            print(get_http_cache().format_stats())
+        return
+    
     #Handle command line operations
     if args.add_repo:
         server.add_repository(args.add_repo)
@@ -374,6 +485,7 @@ def main():
         
     if args.run_once:
         server.process_all_repositories()
+        server.shutdown_executor()
     else:
         #Start the server
         server.start()
@@ -0,0 +1,148 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import io
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+import pytest
+from Branch.BranchMetrics import BranchMetrics
+from MetricsClasses.MetricsExecutor import MetricsExecutor
+from RepositorySources.GitHubRepositorySource import GitHubRepositorySource, archive_compression_ratio
+from RepositorySources.RepositorySource import TreeEntry, iter_tar_files
+
+commit_sha = "0123456789abcdef0123456789abcdef01234567"
+files = {
+    "setup.py": b"from setuptools import setup\nsetup()\n",
+    "pkg/__init__.py": b"",
+    "pkg/module.py": b"def f(a):\n    return a + 1\n",
+    "README.md": b"# Fake\n",
+}
+
+def make_tarball() -> bytes:
+    """A gzipped tarball shaped like GitHub's: a pax global header and everything under one folder."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz", format=tarfile.PAX_FORMAT,
+                      pax_headers={"comment": commit_sha}) as archive:
+        folder = tarfile.TarInfo(f"me-fake-{commit_sha[:7]}")
+        folder.type = tarfile.DIRTYPE
+        archive.addfile(folder)
+        for path, content in files.items():
+            member = tarfile.TarInfo(f"me-fake-{commit_sha[:7]}/{path}")
+            member.size = len(content)
+            archive.addfile(member, io.BytesIO(content))
+        link = tarfile.TarInfo(f"me-fake-{commit_sha[:7]}/link.py")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "setup.py"
+        archive.addfile(link)
+    return buffer.getvalue()
+
+class ArchiveServer:
+    """Serves one tarball over HTTP, standing in for the short-lived URL the archive link redirects to."""
+    def __init__(self, tarball: bytes):
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-gzip")
+                self.send_header("Content-Length", str(len(tarball)))
+                self.end_headers()
+                self.wfile.write(tarball)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/tarball"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class FakeRepo:
+    """The parts of a PyGithub Repository the archive path uses; every call is counted."""
+    full_name = "me/fake"
+
+    def __init__(self, archive_url: str, blob_size: int):
+        self.archive_url = archive_url
+        self.blob_size = blob_size
+        self.calls = {"get_archive_link": 0, "get_git_tree": 0, "get_contents": 0}
+
+    def get_archive_link(self, archive_format, ref):
+        self.calls["get_archive_link"] += 1
+        assert archive_format == "tarball" and ref == commit_sha
+        return self.archive_url
+
+    def get_git_tree(self, sha, recursive=False):
+        self.calls["get_git_tree"] += 1
+        return SimpleNamespace(tree=[SimpleNamespace(path=path, sha=path, type="blob", size=self.blob_size)
+                                     for path in files])
+
+    def get_contents(self, path, ref):
+        self.calls["get_contents"] += 1
+        return SimpleNamespace(decoded_content=files[path] if path in files else b"# fetched\n")
+
+@pytest.fixture
+def archive_server():
+    server = ArchiveServer(make_tarball())
+    yield server
+    server.close()
+
+def make_branch(repo, tmp_path, monkeypatch, **options):
+    monkeypatch.chdir(tmp_path)
+    return BranchMetrics(GitHubRepositorySource(repo), executor=MetricsExecutor(max_workers=1), **options)
+
+def test_iter_tar_files_strips_folder_and_skips_non_files():
+    members = dict(iter_tar_files(io.BytesIO(make_tarball())))
+    # No pax header, folder or symlink; paths relative to the repository
+    assert members == files
+
+def test_iter_archive_streams_requested_paths(archive_server):
+    repo = FakeRepo(archive_server.url, blob_size=100)
+    source = GitHubRepositorySource(repo)
+    wanted = {path for path in files if path.endswith(".py")}
+    members = dict(source.iter_archive(commit_sha, wanted))
+    assert members == {path: files[path] for path in wanted}
+    assert archive_server.requests == 1
+
+def test_should_fetch_archive_per_commit(tmp_path, monkeypatch):
+    repo = FakeRepo("unused", blob_size=4096)
+    entries = [TreeEntry(path, path) for path in files]
+    # 4 files at 1 KiB per request saved pay for an archive of 4 * 4096 / archive_compression_ratio bytes
+    assert 4 * 4096 // archive_compression_ratio <= 4 * 1024
+    branch = make_branch(repo, tmp_path, monkeypatch, archive_min_files=4, archive_request_kb=1)
+    assert branch.should_fetch_archive(commit_sha, entries[:3]) is False
+    # Small batches don't list the tree to estimate the archive
+    assert repo.calls["get_git_tree"] == 0
+    assert branch.should_fetch_archive(commit_sha, entries) is True
+    assert repo.calls["get_git_tree"] == 1
+
+    large = FakeRepo("unused", blob_size=1024 * 1024)
+    branch = make_branch(large, tmp_path, monkeypatch, archive_min_files=4, archive_request_kb=1)
+    assert branch.should_fetch_archive(commit_sha, entries) is False
+    disabled = make_branch(repo, tmp_path, monkeypatch, archive_min_files=0)
+    assert disabled.should_fetch_archive(commit_sha, entries) is False
+
+def test_iter_file_sources_reads_archive_then_missing_files(archive_server, tmp_path, monkeypatch):
+    repo = FakeRepo(archive_server.url, blob_size=10)
+    branch = make_branch(repo, tmp_path, monkeypatch, archive_min_files=2, archive_request_kb=1)
+    entries = [TreeEntry("setup.py", "a"), TreeEntry("pkg/module.py", "b"), TreeEntry("missing.py", "c")]
+    sources = {file.path: source for file, source in branch.iter_file_sources(entries, commit_sha)}
+    assert sources == {"setup.py": files["setup.py"], "pkg/module.py": files["pkg/module.py"],
+                       "missing.py": b"# fetched\n"}
+    assert branch.fetch_stats == {"file_requests": 1, "archives": 1, "archive_files": 2}
+    assert repo.calls["get_contents"] == 1
+
+def test_iter_file_sources_below_threshold_fetches_per_file(archive_server, tmp_path, monkeypatch):
+    repo = FakeRepo(archive_server.url, blob_size=10)
+    branch = make_branch(repo, tmp_path, monkeypatch, archive_min_files=8, archive_request_kb=1)
+    entries = [TreeEntry("setup.py", "a"), TreeEntry("pkg/module.py", "b")]
+    sources = dict((file.path, source) for file, source in branch.iter_file_sources(entries, commit_sha))
+    assert sources == {"setup.py": files["setup.py"], "pkg/module.py": files["pkg/module.py"]}
+    assert archive_server.requests == 0
+    assert branch.fetch_stats == {"file_requests": 2, "archives": 0, "archive_files": 0}
@@ -0,0 +1,204 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncio
+import json
+import threading
+from collections import Counter
+import pytest
+from Cache.HTTPResponseCache import HTTPResponseCache
+from RepositorySources.AsyncGitHubClient import AsyncGitHubClient, GitHubAPIError
+
+# Seconds the slow endpoints take, long enough for concurrent requests to overlap
+delay = 0.2
+
+class FakeAPIServer:
+    """
+    A local HTTP/1.1 server on asyncio streams with keep-alive, standing in for the GitHub API.
+    Counts the requests of each path and the most it was answering at once.
+    """
+    def __init__(self):
+        self.requests = Counter()
+        # Responses to conditional requests, by path
+        self.not_modified = Counter()
+        self.etag = '"v1"'
+        self.active = 0
+        self.max_active = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, "127.0.0.1", 0), self.loop).result()
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+
+    async def handle(self, reader, writer):
+        answered = 0
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                target = request_line.decode("latin-1").split()[1]
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                # A keep-alive connection the server drops as the client reuses it
+                if target == "/idle-close" and answered:
+                    break
+                if target == "/no-response":
+                    self.requests[target] += 1
+                    break
+                self.requests[target] += 1
+                answered += 1
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                try:
+                    response = await self.respond(target, headers)
+                finally:
+                    self.active -= 1
+                writer.write(response)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def respond(self, target: str, headers: dict) -> bytes:
+        if target == "/chunked":
+            chunks = [b'{"kind": ', b'"chunked", "items": ', json.dumps(list(range(100))).encode(), b"}"]
+            body = b"".join(b"%x;ext=1\r\n%s\r\n" % (len(chunk), chunk) for chunk in chunks)
+            return (b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n" +
+                    body + b"0\r\nX-Trailer: yes\r\n\r\n")
+        if target.startswith("/slow/"):
+            await asyncio.sleep(delay)
+            return self.json_response(200, {"path": target})
+        if target == "/missing":
+            await asyncio.sleep(delay)
+            return self.json_response(404, {"message": "Not Found"})
+        if target == "/list-error":
+            return self.json_response(422, [{"message": "Validation Failed"}])
+        if target.startswith("/etag/"):
+            # Stale at once (max-age=0) or fresh for a minute, and revalidated by ETag
+            cache_control = "max-age=60" if target == "/etag/fresh" else "max-age=0"
+            if headers.get("if-none-match") == self.etag:
+                self.not_modified[target] += 1
+                return (f"HTTP/1.1 304 Not Modified\r\nETag: {self.etag}\r\nCache-Control: {cache_control}\r\n"
+                        f"X-RateLimit-Remaining: 4998\r\nX-RateLimit-Limit: 5000\r\n"
+                        f"X-RateLimit-Reset: 1700000000\r\n\r\n").encode("latin-1")
+            return self.json_response(200, {"path": target, "etag": self.etag},
+                                      f"ETag: {self.etag}\r\nCache-Control: {cache_control}\r\n")
+        if target == "/moved":
+            return b"HTTP/1.1 301 Moved Permanently\r\nLocation: /length\r\nContent-Length: 0\r\n\r\n"
+        return self.json_response(200, {"kind": "length", "path": target})
+
+    @staticmethod
+    def json_response(status: int, data, extra_headers: str = "") -> bytes:
+        body = json.dumps(data).encode("utf-8")
+        return (f"HTTP/1.1 {status} Status\r\nContent-Type: application/json\r\n{extra_headers}"
+                f"Content-Length: {len(body)}\r\nX-RateLimit-Remaining: 4999\r\nX-RateLimit-Limit: 5000\r\n"
+                f"X-RateLimit-Reset: 1700000000\r\n\r\n").encode("latin-1") + body
+
+    def close(self):
+        self.server.close()
+        asyncio.run_coroutine_threadsafe(self.server.wait_closed(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+@pytest.fixture
+def server():
+    server = FakeAPIServer()
+    yield server
+    server.close()
+
+@pytest.fixture
+def client(server):
+    client = AsyncGitHubClient(token="token", base_url=server.url, max_concurrency=2, timeout=5)
+    yield client
+    client.close()
+
+def gather(client, *coroutines):
+    async def run_all():
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+    return client.run(run_all())
+
+def test_content_length_and_chunked_bodies(client):
+    assert client.run(client.get_json("/length")) == {"kind": "length", "path": "/length"}
+    assert client.run(client.get_json("/chunked")) == {"kind": "chunked", "items": list(range(100))}
+    # Both read on one keep-alive connection
+    assert client.pool.opened == 1
+    assert client.pool.reused == 1
+    assert client.rate_limit == (4999, 5000, 1700000000.0)
+
+def test_redirect_is_followed(client):
+    assert client.run(client.get_json("/moved")) == {"kind": "length", "path": "/length"}
+
+def test_idle_connection_closed_by_server_is_retried_once(server, client):
+    client.run(client.get_json("/idle-close"))
+    # Sent on the pooled connection, which the server drops, then again on a new one
+    assert client.run(client.get_json("/idle-close")) == {"kind": "length", "path": "/idle-close"}
+    assert server.requests["/idle-close"] == 2
+    assert client.pool.opened == 2
+
+def test_fresh_connection_closed_without_response_raises(server, client):
+    with pytest.raises(ConnectionError):
+        client.run(client.get_json("/no-response"))
+    assert server.requests["/no-response"] == 1
+
+def test_identical_gets_in_flight_are_coalesced(server, client):
+    first, second = gather(client, client.get_json("/slow/blob"), client.get_json("/slow/blob"))
+    assert first == second == {"path": "/slow/blob"}
+    assert server.requests["/slow/blob"] == 1
+    assert client.coalesced == 1
+
+def test_error_status_raises_for_every_waiter(server, client):
+    results = gather(client, client.get_json("/missing"), client.get_json("/missing"))
+    assert all(isinstance(result, GitHubAPIError) and result.status == 404 for result in results)
+    assert "Not Found" in str(results[0])
+    assert server.requests["/missing"] == 1
+
+def test_error_body_that_is_not_an_object(client):
+    with pytest.raises(GitHubAPIError) as error:
+        client.run(client.get_json("/list-error"))
+    assert error.value.status == 422
+    assert "Validation Failed" in str(error.value)
+
+def test_requests_in_flight_are_capped(server, client):
+    results = gather(client, *(client.get_json(f"/slow/{index}") for index in range(6)))
+    assert results == [{"path": f"/slow/{index}"} for index in range(6)]
+    assert client.max_active == 2
+    assert server.max_active == 2
+
+@pytest.fixture
+def cached_client(server, tmp_path):
+    cache = HTTPResponseCache(str(tmp_path / "http_cache.sqlite"))
+    client = AsyncGitHubClient(token="token", base_url=server.url, max_concurrency=2, timeout=5, cache=cache)
+    yield client
+    client.close()
+    cache.close()
+
+def test_stale_response_is_revalidated_with_its_etag(server, cached_client):
+    assert cached_client.run(cached_client.get_json("/etag/stale")) == {"path": "/etag/stale", "etag": '"v1"'}
+    # Asked again with If-None-Match; the 304 replays the stored body with its current rate limit
+    assert cached_client.run(cached_client.get_json("/etag/stale")) == {"path": "/etag/stale", "etag": '"v1"'}
+    assert server.requests["/etag/stale"] == 2
+    assert server.not_modified["/etag/stale"] == 1
+    assert cached_client.rate_limit == (4998, 5000, 1700000000.0)
+
+    # A changed resource doesn't match the stored ETag and replaces the stored response
+    server.etag = '"v2"'
+    assert cached_client.run(cached_client.get_json("/etag/stale"))["etag"] == '"v2"'
+    assert cached_client.run(cached_client.get_json("/etag/stale"))["etag"] == '"v2"'
+    assert server.not_modified["/etag/stale"] == 2
+    stats = cached_client.cache.get_stats()
+    assert (stats["hits"], stats["revalidations"], stats["misses"], stats["entries"]) == (0, 2, 2, 1)
+
+def test_fresh_response_is_replayed_without_a_request(server, cached_client):
+    cached_client.run(cached_client.get_json("/etag/fresh"))
+    assert cached_client.run(cached_client.get_json("/etag/fresh")) == {"path": "/etag/fresh", "etag": '"v1"'}
+    assert server.requests["/etag/fresh"] == 1
+    # Responses without an ETag or Last-Modified can't be revalidated and aren't kept
+    cached_client.run(cached_client.get_json("/length"))
+    cached_client.run(cached_client.get_json("/length"))
+    assert server.requests["/length"] == 2
+    stats = cached_client.cache.get_stats()
+    assert (stats["hits"], stats["revalidations"], stats["misses"], stats["entries"]) == (1, 0, 3, 1)
@@ -0,0 +1,53 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import subprocess
+import pytest
+from Branch.BranchMetrics import BranchMetrics
+# The module BranchMetrics imports, next to it on sys.path
+from MetricsFileManager import MetricsFileManager
+from MetricsClasses.MetricsExecutor import MetricsExecutor
+from RepositorySources.LocalGitRepositorySource import LocalGitRepositorySource
+
+def git(path, *args):
+    return subprocess.run(["git", "-C", str(path), *args], capture_output=True, check=True).stdout.decode().strip()
+
+@pytest.fixture
+def local_repo(tmp_path):
+    """A clone-like folder with two commits on main."""
+    path = tmp_path / "fake"
+    path.mkdir()
+    git(path, "init", "--quiet", "--initial-branch=main")
+    git(path, "config", "user.email", "dev@example.com")
+    git(path, "config", "user.name", "dev")
+    for index in range(2):
+        (path / f"module{index}.py").write_text(f"def f{index}(a):\n    return a + {index}\n")
+        git(path, "add", ".")
+        git(path, "commit", "--quiet", "-m", f"commit {index}")
+    return path
+
+def run_branch(local_repo, tmp_path, monkeypatch) -> BranchMetrics:
+    monkeypatch.chdir(tmp_path)
+    source = LocalGitRepositorySource(str(local_repo), full_name="me/fake")
+    branch = BranchMetrics(source, save=True, executor=MetricsExecutor(max_workers=1))
+    try:
+        branch.calculate_metrics()
+    finally:
+        source.close()
+    return branch
+
+def test_failed_save_keeps_watermark(local_repo, tmp_path, monkeypatch):
+    def fail_to_save(manager):
+        print("disk full")
+        return False
+    with monkeypatch.context() as patch:
+        patch.setattr(MetricsFileManager, "save_local_metrics", fail_to_save)
+        branch = run_branch(local_repo, tmp_path, monkeypatch)
+    assert branch.pipeline_error is not None
+    assert branch.watermark.load() is None
+
+    # The next run processes the unsaved commits again and saves them
+    branch = run_branch(local_repo, tmp_path, monkeypatch)
+    assert branch.pipeline_error is None
+    assert branch.watermark.load() == git(local_repo, "rev-parse", "HEAD")
+    assert len(branch.metric_managers["Traditional"].get_commit_shas()) == 2
@@ -0,0 +1,57 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ast
+import json
+from MetricsClasses.FusedMetricsAnalyzer import FusedMetricsAnalyzer
+from MetricsClasses.HalsteadBatch import rederive_halstead_metrics
+from MetricsClasses.MetricsController import analyze_file
+
+# Far deeper than a recursive walk of the tree can go with the default recursion limit
+terms = 1200
+
+def deep_source():
+    return ("class Generated:\n"
+            "    def total(self, a):\n"
+            "        return " + " + ".join(["a"] * terms) + "\n").encode("utf-8")
+
+def test_deeply_nested_expression_is_analyzed():
+    path, result = analyze_file("deep.py", deep_source(), halstead_scopes=True)
+    assert path == "deep.py"
+    assert "error" not in result
+    # The "+"s and the return; operands are the parameters and every "a" of the sum
+    counts = result["Halstead"]["Scopes"]["Functions"]["Generated.total"]["Counts"]
+    assert counts == {"n1": 2, "N1": terms, "n2": 2, "N2": terms + 2}
+    assert result["Traditional"]["CC"] == {"Generated.total": 1}
+    assert result["OO"]["WMC"] == {"Generated": 1}
+
+def test_deeply_nested_expression_counts_like_a_flat_one():
+    deep = FusedMetricsAnalyzer(ast.parse("x = " + " + ".join(["a"] * terms))).calculate_metrics()
+    flat = FusedMetricsAnalyzer(ast.parse("x = a" + "\nx += a" * (terms - 1))).calculate_metrics()
+    deep_counts, flat_counts = deep[0]["Counts"], flat[0]["Counts"]
+    assert deep_counts["N1"] == flat_counts["N1"] == terms
+    # x and the "a"s
+    assert deep_counts["N2"] == terms + 1
+
+def test_match_statement_is_analyzed():
+    source = (b"def kind(value):\n"
+              b"    match value:\n"
+              b"        case 0:\n"
+              b"            return 'zero'\n"
+              b"        case _:\n"
+              b"            return 'other'\n")
+    path, result = analyze_file("match.py", source)
+    assert "error" not in result
+    # def, match and the two returns
+    assert result["Halstead"]["Counts"]["N1"] == 4
+    # The function, the match and its two cases
+    assert result["Traditional"]["CC"] == {"kind": 4}
+
+def test_undefined_halstead_metrics_are_stored_as_null():
+    # No operands, and then nothing at all
+    results = [analyze_file(path, source)[1]["Halstead"] for path, source in (("pass.py", b"pass\n"), ("empty.py", b""))]
+    assert [(halstead["Volume"], halstead["Difficulty"], halstead["Effort"]) for halstead in results] == [(0.0, None, None),
+                                                                                                       (None, None, None)]
+    # Valid JSON, and the batch rederivation agrees
+    assert "null" in json.dumps(results, allow_nan=False)
+    assert rederive_halstead_metrics(results) == results
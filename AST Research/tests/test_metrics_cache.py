@@ -0,0 +1,157 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import json
+import sqlite3
+import pytest
+import Cache.SQLiteMetricsCache as sqlite_cache_module
+from Cache.BlobMetricsCache import BlobMetricsCache
+from Cache.SQLiteMetricsCache import SQLiteMetricsCache
+from MetricsClasses.MetricsController import analyze_file
+
+# Parses, but the inheritance metrics can't handle a base class behind two attributes
+analyze_error_source = b"import a.b\n\nclass Child(a.b.Base):\n    pass\n"
+
+def test_analysis_error_gets_tokenizer_metrics_and_is_cached(tmp_path):
+    path, result = analyze_file("child.py", analyze_error_source)
+    assert result["error"]["stage"] == "analyze"
+    assert result["degraded"]["Traditional"]["LOC"] == 3
+
+    store = SQLiteMetricsCache(str(tmp_path / "cache.sqlite"))
+    BlobMetricsCache(store=store).put_result("blob", result)
+    # A later run finds the failure instead of fetching and analyzing the blob again
+    cache = BlobMetricsCache(store=store)
+    assert cache.get("blob") == result["degraded"]
+    assert cache.get_stats()["failure_hits"] == 1
+    store.close()
+
+class Clock:
+    """Stands in for the time module of the SQLite cache, so access times are ordered and known."""
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sqlite_cache_module, "time", clock)
+    return clock
+
+def entry(size: int) -> dict:
+    return {"LOC": "x" * (size - len('{"LOC": ""}'))}
+
+def last_access(path, blob_sha):
+    """The stored access time of a blob, read on a connection of its own like another process would."""
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT last_access FROM metrics_cache WHERE blob_sha = ?", (blob_sha,)).fetchone()[0]
+    finally:
+        connection.close()
+
+def test_eviction_removes_least_recently_used(tmp_path, clock):
+    store = SQLiteMetricsCache(str(tmp_path / "cache.sqlite"), max_bytes=250)
+    clock.now = 1
+    store.put("a", "Traditional", "v1", entry(100))
+    clock.now = 2
+    store.put("b", "Traditional", "v1", entry(100))
+    clock.now = 3
+    assert store.get("a", "Traditional", "v1") == entry(100)
+    # Over the bound: b is the least recently used now that a was read
+    clock.now = 4
+    store.put("c", "Traditional", "v1", entry(100))
+    assert store.get("b", "Traditional", "v1") is None
+    assert store.get("a", "Traditional", "v1") == entry(100)
+    assert store.get("c", "Traditional", "v1") == entry(100)
+    assert store.get_stats()["stored_bytes"] == 200
+    store.close()
+
+def test_hits_write_access_times_in_batches(tmp_path, clock, monkeypatch):
+    path = str(tmp_path / "cache.sqlite")
+    store = SQLiteMetricsCache(path)
+    clock.now = 1
+    store.put("a", "Traditional", "v1", entry(20))
+    store.put("b", "Traditional", "v1", entry(20))
+    clock.now = 5
+    store.get("a", "Traditional", "v1")
+    # Not committed by the hit itself ...
+    assert last_access(path, "a") == 1
+    # ... but with the next write
+    store.put("c", "Traditional", "v1", entry(20))
+    assert last_access(path, "a") == 5
+
+    monkeypatch.setattr(sqlite_cache_module, "touch_batch_size", 2)
+    clock.now = 6
+    store.get("a", "Traditional", "v1")
+    assert last_access(path, "a") == 5
+    store.get("b", "Traditional", "v1")
+    assert last_access(path, "a") == last_access(path, "b") == 6
+
+    # Or touch_interval seconds after the last write
+    monkeypatch.setattr(sqlite_cache_module, "touch_batch_size", 512)
+    clock.now = 10
+    store.get("a", "Traditional", "v1")
+    assert last_access(path, "a") == 6
+    clock.now = 6 + sqlite_cache_module.touch_interval
+    store.get("b", "Traditional", "v1")
+    assert last_access(path, "a") == 10
+    assert last_access(path, "b") == clock.now
+
+    clock.now = 100
+    store.get("a", "Traditional", "v1")
+    store.close()
+    assert last_access(path, "a") == 100
+
+def file_metrics(loc: int) -> dict:
+    return {"Halstead": {"Volume": 1.0}, "Traditional": {"LOC": loc}, "OO": {"WMC": {}}}
+
+def test_memory_entries_are_bounded_when_a_store_backs_them(tmp_path):
+    store = SQLiteMetricsCache(str(tmp_path / "cache.sqlite"))
+    cache = BlobMetricsCache(store=store, max_entries=2)
+    cache.put("a", file_metrics(1))
+    cache.put("b", file_metrics(2))
+    assert cache.get("a") == file_metrics(1)
+    # b is the least recently used, so it leaves memory for c
+    cache.put("c", file_metrics(3))
+    stats = cache.get_stats()
+    assert (stats["entries"], stats["evictions"], stats["store_hits"]) == (2, 1, 0)
+    assert cache.get("a") == file_metrics(1)
+    assert cache.get_stats()["store_hits"] == 0
+    # Read back from the store
+    assert cache.get("b") == file_metrics(2)
+    assert cache.get_stats()["store_hits"] == 1
+    store.close()
+
+def test_memory_entries_are_unbounded_without_a_store():
+    cache = BlobMetricsCache(max_entries=2)
+    for index in range(5):
+        cache.put(str(index), file_metrics(index))
+    assert all(cache.get(str(index)) == file_metrics(index) for index in range(5))
+    assert cache.get_stats()["evictions"] == 0
+
+def test_parse_failures_are_evicted_with_the_metrics(tmp_path, clock):
+    store = SQLiteMetricsCache(str(tmp_path / "cache.sqlite"), max_bytes=250)
+    error = {"type": "SyntaxError"}
+    # 100 bytes with the error
+    degraded = entry(100 - len(json.dumps(error)))
+    clock.now = 1
+    store.put_failure("broken", "v1", error, degraded)
+    assert store.get_stats()["parse_failure_bytes"] == 100
+    clock.now = 2
+    store.put("a", "Traditional", "v1", entry(100))
+    clock.now = 3
+    store.put("b", "Traditional", "v1", entry(100))
+    # Over the bound: the failure is the least recently used
+    assert store.get_failure("broken", "v1") is None
+    stats = store.get_stats()
+    assert (stats["parse_failures"], stats["parse_failure_bytes"], stats["stored_bytes"]) == (0, 0, 200)
+
+    # Failures alone fill the cache too
+    for index in range(3):
+        clock.now = 4 + index
+        store.put_failure(f"broken{index}", "v1", error, degraded)
+    stats = store.get_stats()
+    assert stats["stored_bytes"] + stats["parse_failure_bytes"] <= 250
+    assert store.get_failure("broken2", "v1") == {"error": error, "metrics": degraded}
+    store.close()
@@ -0,0 +1,59 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import json
+from collections import Counter
+from types import SimpleNamespace
+from Branch.MetricsFileManager import MetricsFileManager
+from Branch.MetricsFileStore import MetricsFileStore
+
+class FakeRepo:
+    """Serves a metrics file per branch through get_contents and counts the requests."""
+    full_name = "me/fake"
+
+    def __init__(self):
+        self.requests = Counter()
+
+    def get_contents(self, path, ref):
+        self.requests[ref] += 1
+        content = json.dumps({"sha-1": {"date": "2024-01-01", "metrics": {"branch": ref}}}).encode("utf-8")
+        return SimpleNamespace(decoded_content=content, sha=f"file-{ref}")
+
+def manager(repo, tmp_path, branch_name="main", store=None) -> MetricsFileManager:
+    manager = MetricsFileManager(repo, "Traditional", branch_name=branch_name, output_dir=str(tmp_path), store=store)
+    manager.load_lazily()
+    return manager
+
+def test_managers_of_one_file_share_a_single_lazy_load(tmp_path):
+    repo = FakeRepo()
+    store = MetricsFileStore()
+    first = manager(repo, tmp_path, store=store)
+    second = manager(repo, tmp_path, store=store)
+    other_branch = manager(repo, tmp_path, branch_name="feature", store=store)
+    # Nothing is requested until the contents are read
+    assert sum(repo.requests.values()) == 0
+    assert store.get_stats() == {"files": 2, "loaded": 0}
+
+    assert second.metrics["sha-1"]["metrics"] == {"branch": "main"}
+    assert first.metrics is second.metrics
+    first.add_metric("sha-2", {"date": "2024-01-02", "metrics": {}})
+    assert "sha-2" in second.metrics
+    assert repo.requests == {"main": 1}
+    # The other branch's file is a file of its own, and still unread
+    assert store.get_stats() == {"files": 2, "loaded": 1}
+    assert other_branch.metrics["sha-1"]["metrics"] == {"branch": "feature"}
+    assert repo.requests == {"main": 1, "feature": 1}
+
+def test_set_contents_drop_the_pending_load(tmp_path):
+    repo = FakeRepo()
+    replaced = manager(repo, tmp_path, store=MetricsFileStore())
+    replaced.metrics = {}
+    assert replaced.metrics == {}
+    assert sum(repo.requests.values()) == 0
+
+def test_managers_without_a_store_load_their_own_copy(tmp_path):
+    repo = FakeRepo()
+    first, second = manager(repo, tmp_path), manager(repo, tmp_path)
+    assert first.metrics == second.metrics
+    assert first.metrics is not second.metrics
+    assert repo.requests == {"main": 2}
@@ -0,0 +1,35 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from MetricsClasses.ParseTreeCache import ParseTreeCache, tree_bytes_per_source_byte
+
+def module(name: str, size: int = 100) -> bytes:
+    """Source of exactly size bytes."""
+    source = f"{name} = 1\n".encode("utf-8")
+    return source + b"#" * (size - len(source) - 1) + b"\n"
+
+def test_trees_are_evicted_by_estimated_bytes():
+    tree_size = 100 * tree_bytes_per_source_byte
+    # Room for two trees of 100 byte sources
+    cache = ParseTreeCache(max_bytes=2 * tree_size + tree_size // 2)
+    a = cache.parse(module("a"))
+    cache.parse(module("b"))
+    # The cached tree itself
+    assert cache.parse(module("a")) is a
+    # b is the least recently used
+    cache.parse(module("c"))
+    stats = cache.get_stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 2 * tree_size, 1)
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+    assert cache.parse(module("a")) is a
+    cache.parse(module("b"))
+    assert cache.get_stats()["misses"] == 4
+
+def test_oversized_trees_and_parse_errors_are_not_cached():
+    cache = ParseTreeCache(max_bytes=50 * tree_bytes_per_source_byte)
+    cache.parse(module("a", size=100))
+    with pytest.raises(SyntaxError):
+        cache.parse(b"def broken(:\n")
+    assert cache.get_stats()["entries"] == 0
+    assert cache.get_stats()["bytes"] == 0
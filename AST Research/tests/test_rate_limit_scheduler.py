@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+from RepositorySources.RateLimitScheduler import RateLimitScheduler
+
+class FakeRateLimit:
+    """The token's rate limit as the API would report it; spend() stands in for requests."""
+    def __init__(self, remaining: int, limit: int = 1000):
+        self.remaining = remaining
+        self.limit = limit
+        # Too far away to wait for
+        self.reset = time.time() + 3600
+
+    def __call__(self):
+        return (self.remaining, self.limit, self.reset)
+
+    def spend(self, requests: int):
+        self.remaining -= requests
+
+def test_shares_are_weighted_and_unused_requests_flow_on(tmp_path):
+    rate_limit = FakeRateLimit(1000)
+    state_file = str(tmp_path / "rate_limit_state.json")
+    scheduler = RateLimitScheduler(rate_limit, state_file=state_file, priorities={"big": 2})
+    assert scheduler.plan(["a", "big", "c"]) == ["big", "a", "c"]
+
+    # 900 above the reserve of 100, of which big weighs 2 of 4
+    big = scheduler.acquire("big")
+    assert big.allowance == 450
+    rate_limit.spend(100)
+    scheduler.release(big)
+    assert scheduler.state["repositories"]["big"]["last_requests"] == 100
+
+    # The 350 big left unspent are shared by a and c
+    a = scheduler.acquire("a")
+    assert a.allowance == 400
+
+    def fetch(item):
+        rate_limit.spend(150)
+        return item
+    # Stops before the item that would start past the allowance
+    assert [fetch(item) for item in a.limit(range(10))] == [0, 1, 2]
+    assert a.stopped and a.used == 450
+    scheduler.release(a)
+
+    c = scheduler.acquire("c")
+    assert c.allowance == 350
+    scheduler.release(c)
+
+    # Persisted: a, cut short, goes before c next run
+    scheduler = RateLimitScheduler(rate_limit, state_file=state_file, priorities={"big": 2})
+    repositories = scheduler.state["repositories"]
+    assert (repositories["a"]["complete"], repositories["c"]["complete"]) == (False, True)
+    assert scheduler.plan(["c", "a", "big"]) == ["big", "a", "c"]
+
+def test_new_window_is_charged_and_spent_token_defers(tmp_path):
+    rate_limit = FakeRateLimit(500)
+    scheduler = RateLimitScheduler(rate_limit, state_file=str(tmp_path / "rate_limit_state.json"))
+    scheduler.plan(["a", "b"])
+    # Half of the 400 above the reserve
+    a = scheduler.acquire("a")
+    assert a.allowance == 200
+    # The window reset and 50 of the new one were spent since
+    rate_limit.remaining, rate_limit.reset = 950, rate_limit.reset + 3600
+    a.charge()
+    assert a.used == 50
+
+    # Down to the reserve with the reset an hour away: b is deferred rather than waiting
+    rate_limit.remaining = 100
+    assert scheduler.acquire("b") is None
+    assert scheduler.state["repositories"]["b"] == {"complete": False, "deferred": 1}
+    assert a.exhausted()
@@ -0,0 +1,81 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ast
+from MetricsClasses.SymbolIndex import SymbolIndex, collect_symbols
+
+modules = {
+    "pkg/shapes.py": (
+        "class Shape:\n"
+        "    def area(self):\n"
+        "        return 0\n"
+        "\n"
+        "class Square(Shape):\n"
+        "    def __init__(self, side):\n"
+        "        self.side = side\n"
+        "\n"
+        "    def area(self):\n"
+        "        return self.side * self.side\n"
+    ),
+    "pkg/scene.py": (
+        "import os\n"
+        "from pkg.shapes import Square\n"
+        "from .shapes import Shape\n"
+        "\n"
+        "class Scene:\n"
+        "    def build(self):\n"
+        "        return Square(2)\n"
+        "\n"
+        "    def total(self, shape: Shape):\n"
+        "        return shape.area() + len(os.sep)\n"
+        "\n"
+        "def render():\n"
+        "    return Scene().build()\n"
+    ),
+    "tools/paths.py": (
+        "import os\n"
+        "\n"
+        "class Finder(os.PathLike):\n"
+        "    def find(self):\n"
+        "        return os.path.join('a', 'b')\n"
+    ),
+}
+
+def summary(path):
+    return (f"blob-{path}", collect_symbols(ast.parse(modules[path])))
+
+def test_project_cbo_and_fan_in_across_modules():
+    index = SymbolIndex()
+    # scene.py is resolved before the module it imports from exists, then again once it does
+    index.update([], {"pkg/scene.py": summary("pkg/scene.py"), "tools/paths.py": summary("tools/paths.py")})
+    assert index.get_module_metrics("pkg/scene.py")["CBO"] == {"Scene": 0}
+    dirty = index.update([], {"pkg/shapes.py": summary("pkg/shapes.py")})
+    assert dirty == {"pkg/shapes.py", "pkg/scene.py"}
+
+    shapes = index.get_module_metrics("pkg/shapes.py")
+    scene = index.get_module_metrics("pkg/scene.py")
+    # Square: its base Shape and Scene, which instantiates it; Shape: its subclass and Scene's annotation
+    assert shapes["CBO"] == {"Shape": 2, "Square": 2}
+    assert scene["CBO"] == {"Scene": 2}
+    # Square(2) calls Square.__init__
+    assert shapes["Fan in"]["Square.__init__"] == 1
+    assert scene["Fan out"] == {"Scene.build": 1, "Scene.total": 0, "render": 0}
+    # Only external classes and calls
+    assert index.get_module_metrics("tools/paths.py") == {"Fan in": {"Finder.find": 0},
+                                                          "Fan out": {"Finder.find": 0}, "CBO": {"Finder": 0}}
+
+    # Removing scene.py uncouples the shapes
+    dirty = index.update(["pkg/scene.py"], {})
+    assert dirty == {"pkg/shapes.py"}
+    shapes = index.get_module_metrics("pkg/shapes.py")
+    assert shapes["CBO"] == {"Shape": 1, "Square": 1}
+    assert shapes["Fan in"]["Square.__init__"] == 0
+
+def test_unchanged_blob_is_not_resolved_again():
+    index = SymbolIndex()
+    index.update([], {path: summary(path) for path in modules})
+    resolved = index.get_stats()["resolved_modules"]
+    assert index.update([], {"pkg/shapes.py": summary("pkg/shapes.py")}) == set()
+    assert index.get_stats()["resolved_modules"] == resolved
+    # Rebuilt from its saved summaries, the index has the same edges
+    assert SymbolIndex.from_dict(index.to_dict()).get_stats()["edges"] == index.get_stats()["edges"]